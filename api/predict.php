@@ -1,4 +1,6 @@
 <?php
+require_once __DIR__ . '/predict_client.php';
+
 header('Content-Type: application/json');
 
 $input = json_decode(file_get_contents('php://input'), true);
@@ -8,6 +10,7 @@ if (!$input || !isset($input['cycle_id'])) {
 }
 
 $cycleId = (int)$input['cycle_id'];
+$payload = ['cycle_id' => $cycleId];
 $cmd = 'python3 ' . escapeshellarg(__DIR__ . '/predict_model.py') . ' --cycle_id ' . escapeshellarg($cycleId);
 
 if (!empty($input['apply_partial'])) {
@@ -15,11 +18,20 @@ if (!empty($input['apply_partial'])) {
         echo json_encode(['status' => 'error', 'message' => 'partial_yield and partial_ratio required when apply_partial=true']);
         exit;
     }
+    $payload += [
+        'apply_partial' => true,
+        'partial_yield' => (float)$input['partial_yield'],
+        'partial_ratio' => (float)$input['partial_ratio'],
+    ];
     $cmd .= ' --apply_partial --partial_yield ' . escapeshellarg($input['partial_yield']) . ' --partial_ratio ' . escapeshellarg($input['partial_ratio']);
 }
 
-exec($cmd, $output, $ret);
-$response = json_decode(implode("\n", $output), true);
+// 常駐デーモン (predict_model.py --serve) があればそちらを使い、なければ従来どおり起動する
+$response = predict_via_daemon($payload);
+if ($response === null) {
+    exec($cmd, $output, $ret);
+    $response = json_decode(implode("\n", $output), true);
+}
 if (!$response) {
     echo json_encode(['status' => 'error', 'message' => 'Prediction failed']);
     exit;
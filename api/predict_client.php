@@ -0,0 +1,36 @@
+<?php
+/**
+ * 常駐中の predict_model.py --serve に Unix ソケット経由で予測を依頼する。
+ * 入出力は predict_model.py の JSON と同じ。デーモンに接続できなければ null を返すので、
+ * 呼び出し側は従来の exec にフォールバックする。
+ */
+function predict_socket_path(): string {
+    $path = getenv('PREDICT_SOCKET');
+    return ($path !== false && $path !== '') ? $path : '/tmp/predict_model.sock';
+}
+
+function predict_via_daemon(array $payload, ?string $socket = null, float $timeout = 30.0): ?array {
+    $socket = $socket ?? predict_socket_path();
+    if (!file_exists($socket)) {
+        return null;
+    }
+    $fp = @stream_socket_client('unix://' . $socket, $errno, $errstr, 1.0);
+    if ($fp === false) {
+        return null;
+    }
+    stream_set_timeout($fp, (int)ceil($timeout));
+    try {
+        $line = json_encode($payload, JSON_UNESCAPED_UNICODE) . "\n";
+        if (@fwrite($fp, $line) !== strlen($line)) {
+            return null;
+        }
+        $reply = fgets($fp);
+        if ($reply === false) {
+            return null;
+        }
+        $response = json_decode($reply, true);
+        return is_array($response) ? $response : null;
+    } finally {
+        fclose($fp);
+    }
+}
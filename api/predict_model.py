@@ -1,13 +1,24 @@
 #!/usr/bin/env python3
 import argparse
 import json
+import logging
 import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
 from datetime import datetime, date, timedelta
 
 import pymysql
 import pandas as pd
 import pickle
 
+# 気象の区間集計は xgbapi と共通の WeatherIndex を使う
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "xgbapi", "app", "services"))
+from weather_index import WeatherIndex  # noqa: E402
+from window_engine import WINDOW_COLUMNS, cycle_window_features, to_optional  # noqa: E402
+
 DB_CONFIG = {
     'host': 'localhost',
     'user': 'username',
@@ -17,6 +28,45 @@ DB_CONFIG = {
     'cursorclass': pymysql.cursors.DictCursor,
 }
 
+# モデル (.pkl) の置き場所。既定はこのスクリプトと同じディレクトリ
+MODEL_DIR = os.environ.get("PREDICT_MODEL_DIR", os.path.dirname(os.path.abspath(__file__)))
+MODEL_DAYS_FILE = "model_days_integrated.pkl"
+MODEL_YIELD_FILE = "model_yield_integrated.pkl"
+
+# 常駐モード (--serve) の Unix ソケット。predict.php も同じ値を参照する
+SOCKET_PATH = os.environ.get("PREDICT_SOCKET", "/tmp/predict_model.sock")
+SOCKET_MODE = int(os.environ.get("PREDICT_SOCKET_MODE", "660"), 8)
+MAX_REQUEST_BYTES = 64 * 1024
+CLIENT_IDLE_SEC = 60
+
+log = logging.getLogger("predict_model")
+
+# 類似ベッド（同グループ・定植日±7日・自身を除く）／前年同時期（同グループ・定植日-365±5日）
+SIMILAR_BED_SQL = """
+SELECT AVG(h.total_yield) AS avg_yield,
+       AVG(DATEDIFF(c.harvest_start, c.plant_date)) AS avg_days
+FROM cycles c
+JOIN beds b ON c.bed_id = b.id
+LEFT JOIN (
+    SELECT cycle_id, SUM(harvest_kg) AS total_yield
+    FROM harvests
+    GROUP BY cycle_id
+) h ON c.id = h.cycle_id
+WHERE b.group_type=%s AND c.id<>%s AND c.plant_date BETWEEN %s AND %s
+"""
+PREV_YEAR_SQL = """
+SELECT AVG(h.total_yield) AS avg_yield,
+       AVG(DATEDIFF(c.harvest_start, c.plant_date)) AS avg_days
+FROM cycles c
+JOIN beds b ON c.bed_id = b.id
+LEFT JOIN (
+    SELECT cycle_id, SUM(harvest_kg) AS total_yield
+    FROM harvests
+    GROUP BY cycle_id
+) h ON c.id = h.cycle_id
+WHERE b.group_type=%s AND c.plant_date BETWEEN %s AND %s
+"""
+
 # 修正: 基準生育日数を実績平均化
 DEFAULT_BASE_GROWTH_DAYS = {1: 50, 2: 120, 3: 80}
 
@@ -29,8 +79,11 @@ def determine_season_flag(plant_date):
     else:
         return 3  # 修正: 季節区分をモデル仕様に合わせた
 
-def compute_and_update_features(cycle_id):
-    conn = pymysql.connect(**DB_CONFIG)
+def compute_and_update_features(cycle_id, conn=None):
+    """conn を渡すと使い回す（常駐モード）。省略時は呼び出しごとに接続して閉じる。"""
+    own_conn = conn is None
+    if own_conn:
+        conn = pymysql.connect(**DB_CONFIG)
     try:
         with conn.cursor() as cur:
             cur.execute(
@@ -39,7 +92,7 @@ def compute_and_update_features(cycle_id):
             )
             cycle = cur.fetchone()
             if not cycle:
-                return None, "Cycle not found"
+                return None, None, "Cycle not found"
             plant_date = cycle["plant_date"]
             harvest_start = cycle["harvest_start"]
             group_type = cycle["group_type"]
@@ -74,21 +127,7 @@ def compute_and_update_features(cycle_id):
             # Similar bed averages
             start_range = plant_date - timedelta(days=7)
             end_range = plant_date + timedelta(days=7)
-            cur.execute(
-                """
-                SELECT AVG(h.total_yield) AS avg_yield,
-                       AVG(DATEDIFF(c.harvest_start, c.plant_date)) AS avg_days
-                FROM cycles c
-                JOIN beds b ON c.bed_id = b.id
-                LEFT JOIN (
-                    SELECT cycle_id, SUM(harvest_kg) AS total_yield
-                    FROM harvests
-                    GROUP BY cycle_id
-                ) h ON c.id = h.cycle_id
-                WHERE b.group_type=%s AND c.id<>%s AND c.plant_date BETWEEN %s AND %s
-                """,
-                (group_type, cycle_id, start_range, end_range),
-            )
+            cur.execute(SIMILAR_BED_SQL, (group_type, cycle_id, start_range, end_range))
             sim = cur.fetchone()
             similar_yield = sim["avg_yield"]
             similar_days = sim["avg_days"]
@@ -96,21 +135,7 @@ def compute_and_update_features(cycle_id):
             # Previous year
             prev_start = plant_date - timedelta(days=365 + 5)
             prev_end = plant_date - timedelta(days=365 - 5)
-            cur.execute(
-                """
-                SELECT AVG(h.total_yield) AS avg_yield,
-                       AVG(DATEDIFF(c.harvest_start, c.plant_date)) AS avg_days
-                FROM cycles c
-                JOIN beds b ON c.bed_id = b.id
-                LEFT JOIN (
-                    SELECT cycle_id, SUM(harvest_kg) AS total_yield
-                    FROM harvests
-                    GROUP BY cycle_id
-                ) h ON c.id = h.cycle_id
-                WHERE b.group_type=%s AND c.plant_date BETWEEN %s AND %s
-                """,
-                (group_type, prev_start, prev_end),
-            )
+            cur.execute(PREV_YEAR_SQL, (group_type, prev_start, prev_end))
             prev = cur.fetchone()
             prev_yield = prev["avg_yield"]
             prev_days = prev["avg_days"]
@@ -197,31 +222,358 @@ def compute_and_update_features(cycle_id):
             features = cur.fetchone()
             return features, expected_harvest, None
     finally:
-        conn.close()
+        if own_conn:
+            conn.close()
+        else:
+            # 読み取りトランザクションを閉じ、次のリクエストで最新の行が見えるようにする
+            conn.rollback()
+
+
+# ----- バッチモード (--cycle-ids / --all-open / --since) -----
+# compute_and_update_features と同じ集計を、対象サイクル全件について
+# 数本のクエリと Python 側の集計でまとめて行う。
+
+BATCH_UPDATE_CHUNK = 500
+
+BATCH_UPDATE_COLUMNS = [
+    "base_growth_days",
+    "sales_adjust_days",
+    "similar_bed_avg_yield",
+    "similar_bed_avg_days",
+    "prev_year_yield",
+    "prev_year_days",
+    "yield_diff_prev",
+    "days_diff_prev",
+    "temp_avg",
+    "temp_max",
+    "temp_min",
+    "temp_std",
+    "temp_range_avg",
+    "temp_range_std",
+    "season_flag",
+]
+
+
+def _days_between(start, end):
+    return (end - start).days if start is not None and end is not None else None
+
+
+def fetch_batch_targets(cur, cycle_ids=None, all_open=False, since=None):
+    where, args = [], []
+    if cycle_ids is not None:
+        where.append("c.id IN (%s)" % ",".join(["%s"] * len(cycle_ids)))
+        args.extend(cycle_ids)
+    if all_open:
+        where.append("c.harvest_end IS NULL")
+    if since is not None:
+        where.append("c.plant_date >= %s")
+        args.append(since)
+    if not where:
+        where.append("c.plant_date IS NOT NULL")
+    cur.execute(
+        "SELECT c.*, b.group_type FROM cycles c JOIN beds b ON c.bed_id=b.id WHERE "
+        + " AND ".join(where)
+        + " ORDER BY c.id",
+        args,
+    )
+    return list(cur.fetchall())
+
+
+class BatchInputs:
+    """対象サイクルの特徴量計算に必要な行をまとめて読み込む。"""
+
+    def __init__(self, cur, targets):
+        self.targets = targets
+        plants = [t["plant_date"] for t in targets]
+        self.base_days = self._base_growth_sums(cur, targets)
+        history = self._history(cur, min(plants) - timedelta(days=365 + 5), max(plants) + timedelta(days=7))
+        windows = cycle_window_features(history, targets)
+        self.windows = {
+            t["id"]: {c: to_optional(windows[c][i]) for c in WINDOW_COLUMNS} for i, t in enumerate(targets)
+        }
+        ends = [self.growth(t)[3] for t in targets]
+        ends = [d for d in ends if d is not None] or [max(plants)]
+        self.weather = self._weather(cur, min(plants), max(ends))
+
+    @staticmethod
+    def _base_growth_sums(cur, targets):
+        cur.execute(
+            """
+            SELECT season_flag,
+                   COUNT(DATEDIFF(harvest_start, plant_date)) AS n,
+                   SUM(DATEDIFF(harvest_start, plant_date)) AS total
+            FROM cycles
+            WHERE harvest_start IS NOT NULL
+            GROUP BY season_flag
+            """
+        )
+        sums = {r["season_flag"]: [int(r["n"]), float(r["total"] or 0)] for r in cur.fetchall()}
+        # 対象サイクルは更新後の season_flag で数える（全件を順に 1 件ずつ更新し終えた状態と同じ）
+        for t in targets:
+            days = _days_between(t["plant_date"], t["harvest_start"])
+            if days is None:
+                continue
+            old = sums.get(t.get("season_flag"))
+            if old is not None:
+                old[0] -= 1
+                old[1] -= days
+            new = sums.setdefault(determine_season_flag(t["plant_date"]), [0, 0.0])
+            new[0] += 1
+            new[1] += days
+        return sums
+
+    @staticmethod
+    def _history(cur, start, end):
+        cur.execute(
+            """
+            SELECT c.id, c.plant_date, c.harvest_start, b.group_type, h.total_yield
+            FROM cycles c
+            JOIN beds b ON c.bed_id = b.id
+            LEFT JOIN (
+                SELECT cycle_id, SUM(harvest_kg) AS total_yield
+                FROM harvests
+                GROUP BY cycle_id
+            ) h ON c.id = h.cycle_id
+            WHERE c.plant_date BETWEEN %s AND %s
+            """,
+            (start, end),
+        )
+        return cur.fetchall()
+
+    @staticmethod
+    def _weather(cur, start, end):
+        cur.execute(
+            """
+            SELECT date, temp_avg, temp_max, temp_min, variation
+            FROM weather_daily
+            WHERE date BETWEEN %s AND %s
+            ORDER BY date
+            """,
+            (start, end),
+        )
+        return WeatherIndex.from_rows(cur.fetchall())
+
+    def _temperature(self, start, end):
+        stats = self.weather.stats(start, end)
+        return {
+            "avg_t": stats["temp_avg_mean"],
+            "max_t": stats["temp_max_max"],
+            "min_t": stats["temp_min_min"],
+            "std_t": stats["temp_avg_std"],
+            "range_avg": stats["swing_avg"],
+            "range_std": stats["swing_std"],
+        }
+
+    def growth(self, cycle):
+        """(season_flag, base_growth_days, expected_harvest, 気温集計の終了日)"""
+        plant_date = cycle["plant_date"]
+        season_flag = determine_season_flag(plant_date)
+        n, total = self.base_days.get(season_flag, (0, 0.0))
+        base_growth_days = total / n if n else DEFAULT_BASE_GROWTH_DAYS[season_flag]
+        expected_harvest = (
+            plant_date + timedelta(days=base_growth_days)
+            if plant_date and base_growth_days
+            else None
+        )
+        return season_flag, base_growth_days, expected_harvest, cycle["harvest_start"] or expected_harvest
+
+    def features(self, cycle):
+        """compute_and_update_features と同じ列を返す（UPDATE する値と期待収穫日）。"""
+        plant_date = cycle["plant_date"]
+        harvest_start = cycle["harvest_start"]
+        season_flag, base_growth_days, expected_harvest, temp_end = self.growth(cycle)
+        sales_adjust_days = (
+            (harvest_start - expected_harvest).days
+            if harvest_start and expected_harvest
+            else None
+        )
+
+        windows = self.windows[cycle["id"]]
+        temps = self._temperature(plant_date, temp_end)
+
+        values = {
+            "base_growth_days": base_growth_days,
+            "sales_adjust_days": sales_adjust_days,
+            **windows,
+            "temp_avg": temps["avg_t"],
+            "temp_max": temps["max_t"],
+            "temp_min": temps["min_t"],
+            "temp_std": temps["std_t"],
+            "temp_range_avg": temps["range_avg"],
+            "temp_range_std": temps["range_std"],
+            "season_flag": season_flag,
+        }
+        return values, expected_harvest
+
+
+def bulk_update_features(cur, values_by_id):
+    """UPDATE ... JOIN (SELECT ... UNION ALL ...) でまとめて書き戻す。"""
+    ids = list(values_by_id)
+    first = "SELECT %s AS id, " + ", ".join("%s AS " + c for c in BATCH_UPDATE_COLUMNS)
+    other = "SELECT " + ", ".join(["%s"] * (len(BATCH_UPDATE_COLUMNS) + 1))
+    assignments = ", ".join("c.%s=v.%s" % (c, c) for c in BATCH_UPDATE_COLUMNS)
+    for i in range(0, len(ids), BATCH_UPDATE_CHUNK):
+        chunk = ids[i:i + BATCH_UPDATE_CHUNK]
+        args = []
+        for cycle_id in chunk:
+            args.append(cycle_id)
+            args.extend(values_by_id[cycle_id][c] for c in BATCH_UPDATE_COLUMNS)
+        derived = " UNION ALL ".join([first] + [other] * (len(chunk) - 1))
+        cur.execute(
+            "UPDATE cycles c JOIN (" + derived + ") v ON v.id = c.id SET " + assignments,
+            args,
+        )
+
+
+def run_batch(conn, cycle_ids=None, all_open=False, since=None):
+    """対象サイクルの特徴量を一括更新（1 トランザクション）し、まとめて予測する。"""
+    with conn.cursor() as cur:
+        targets = fetch_batch_targets(cur, cycle_ids, all_open, since)
+        results = {}
+        if cycle_ids is not None:
+            found = {t["id"] for t in targets}
+            for cycle_id in cycle_ids:
+                if cycle_id not in found:
+                    results[cycle_id] = {"status": "error", "cycle_id": cycle_id, "message": "Cycle not found"}
+        for t in targets:
+            if t["plant_date"] is None:
+                results[t["id"]] = {"status": "error", "cycle_id": t["id"], "message": "plant_date missing"}
+        targets = [t for t in targets if t["plant_date"] is not None]
+        if not targets:
+            return [results[k] for k in sorted(results)]
+
+        inputs = BatchInputs(cur, targets)
+        values_by_id, expected_by_id = {}, {}
+        for t in targets:
+            values_by_id[t["id"]], expected_by_id[t["id"]] = inputs.features(t)
+
+        conn.begin()
+        try:
+            bulk_update_features(cur, values_by_id)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        ids = list(values_by_id)
+        features_by_id = {}
+        for i in range(0, len(ids), BATCH_UPDATE_CHUNK):
+            chunk = ids[i:i + BATCH_UPDATE_CHUNK]
+            cur.execute(
+                "SELECT * FROM cycles WHERE id IN (%s)" % ",".join(["%s"] * len(chunk)),
+                chunk,
+            )
+            features_by_id.update((r["id"], r) for r in cur.fetchall())
+    conn.rollback()  # 読み取りトランザクションを閉じる
+
+    features_list = [features_by_id[i] for i in ids]
+    pred_days, pred_yield = predict_batch(features_list)
+    for cycle_id, features, days, yld in zip(ids, features_list, pred_days, pred_yield):
+        results[cycle_id] = build_result(cycle_id, features, expected_by_id[cycle_id], days, yld, yld)
+    return [results[k] for k in sorted(results)]
+
+
+# MySQL の AVG は DECIMAL の harvest_kg で小数 6 桁、DATEDIFF で小数 4 桁に丸めて返す
+PARITY_ABS_TOL = 1e-4
+
+
+def parity_check(conn, cycle_ids=None, all_open=False, since=None):
+    """window_engine の列を 1 件ずつの SQL (SIMILAR_BED_SQL / PREV_YEAR_SQL) と突き合わせる。書き込みはしない。"""
+    with conn.cursor() as cur:
+        targets = [t for t in fetch_batch_targets(cur, cycle_ids, all_open, since) if t["plant_date"] is not None]
+        if not targets:
+            return {"status": "success", "checked": 0, "mismatches": []}
+        plants = [t["plant_date"] for t in targets]
+        history = BatchInputs._history(cur, min(plants) - timedelta(days=365 + 5), max(plants) + timedelta(days=7))
+        windows = cycle_window_features(history, targets)
+
+        mismatches = []
+        for i, t in enumerate(targets):
+            plant_date = t["plant_date"]
+            cur.execute(
+                SIMILAR_BED_SQL,
+                (t["group_type"], t["id"], plant_date - timedelta(days=7), plant_date + timedelta(days=7)),
+            )
+            sim = cur.fetchone()
+            cur.execute(
+                PREV_YEAR_SQL,
+                (t["group_type"], plant_date - timedelta(days=365 + 5), plant_date - timedelta(days=365 - 5)),
+            )
+            prev = cur.fetchone()
+            expected = {
+                "similar_bed_avg_yield": sim["avg_yield"],
+                "similar_bed_avg_days": sim["avg_days"],
+                "prev_year_yield": prev["avg_yield"],
+                "prev_year_days": prev["avg_days"],
+            }
+            for kind, a, b in (("yield", "similar_bed_avg_yield", "prev_year_yield"), ("days", "similar_bed_avg_days", "prev_year_days")):
+                expected[kind + "_diff_prev"] = (
+                    expected[a] - expected[b] if expected[a] is not None and expected[b] is not None else None
+                )
+            for column in WINDOW_COLUMNS:
+                want, got = expected[column], to_optional(windows[column][i])
+                if (want is None) != (got is None) or (
+                    want is not None and abs(float(want) - got) > PARITY_ABS_TOL
+                ):
+                    mismatches.append({"cycle_id": t["id"], "column": column, "sql": want, "engine": got})
+    conn.rollback()
+    return {
+        "status": "success" if not mismatches else "mismatch",
+        "checked": len(targets),
+        "mismatches": mismatches[:50],
+        "mismatch_count": len(mismatches),
+    }
+
+
+_MODELS = {}  # path -> (mtime, model)
+_MODELS_LOCK = threading.Lock()
+
+
+def load_model(filename):
+    """pickle を一度だけ読み込む。ファイルが差し替えられたら読み直す。"""
+    path = os.path.join(MODEL_DIR, filename)
+    mtime = os.path.getmtime(path)
+    with _MODELS_LOCK:
+        cached = _MODELS.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path, "rb") as f:
+                cached = (mtime, pickle.load(f))
+            _MODELS[path] = cached
+            log.info("loaded %s", path)
+        return cached[1]
+
+
+FEATURE_COLS = [
+    "base_growth_days",
+    "similar_bed_avg_yield",
+    "similar_bed_avg_days",
+    "prev_year_yield",
+    "prev_year_days",
+    "yield_diff_prev",
+    "days_diff_prev",
+    "temp_avg",
+    "temp_max",
+    "temp_min",
+    "temp_std",
+    "temp_range_avg",
+    "temp_range_std",
+    "season_flag",
+]
+
+
+def predict_batch(features_list):
+    """複数サイクルをまとめて推論する（モデルごとに predict は 1 回）。"""
+    model_days = load_model(MODEL_DAYS_FILE)
+    model_yield = load_model(MODEL_YIELD_FILE)
+    df = pd.DataFrame([{c: features.get(c) for c in FEATURE_COLS} for features in features_list])
+    pred_days = [int(round(v)) for v in model_days.predict(df)]
+    pred_yield = [float(v) for v in model_yield.predict(df)]
+    return pred_days, pred_yield
 
 
 def predict(features, apply_partial=False, partial_yield=None, partial_ratio=None):
-    model_days = pickle.load(open("model_days_integrated.pkl", "rb"))
-    model_yield = pickle.load(open("model_yield_integrated.pkl", "rb"))
-    cols = [
-        "base_growth_days",
-        "similar_bed_avg_yield",
-        "similar_bed_avg_days",
-        "prev_year_yield",
-        "prev_year_days",
-        "yield_diff_prev",
-        "days_diff_prev",
-        "temp_avg",
-        "temp_max",
-        "temp_min",
-        "temp_std",
-        "temp_range_avg",
-        "temp_range_std",
-        "season_flag",
-    ]
-    df = pd.DataFrame([{c: features.get(c) for c in cols}])
-    pred_days = int(round(model_days.predict(df)[0]))
-    pred_yield = float(model_yield.predict(df)[0])
+    days, yields = predict_batch([features])
+    pred_days, pred_yield = days[0], yields[0]
     if (
         apply_partial
         and partial_yield is not None
@@ -235,26 +587,23 @@ def predict(features, apply_partial=False, partial_yield=None, partial_ratio=Non
     return pred_days, pred_yield, pred_corrected
 
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--cycle_id", type=int, required=True)
-    parser.add_argument("--apply_partial", action="store_true")
-    parser.add_argument("--partial_yield", type=float)
-    parser.add_argument("--partial_ratio", type=float)
-    args = parser.parse_args()
-
-    features, expected_harvest, err = compute_and_update_features(args.cycle_id)
+def run_prediction(cycle_id, apply_partial=False, partial_yield=None, partial_ratio=None, conn=None):
+    """1 サイクル分の特徴量更新と予測。CLI / 常駐モード共通の JSON 応答を返す。"""
+    features, expected_harvest, err = compute_and_update_features(cycle_id, conn)
     if err:
-        print(json.dumps({"status": "error", "message": err}, ensure_ascii=False))
-        return
+        return {"status": "error", "message": err}
 
     pred_days, pred_yield, pred_corr = predict(
         features,
-        apply_partial=args.apply_partial,
-        partial_yield=args.partial_yield,
-        partial_ratio=args.partial_ratio,
+        apply_partial=apply_partial,
+        partial_yield=partial_yield,
+        partial_ratio=partial_ratio,
     )
 
+    return build_result(cycle_id, features, expected_harvest, pred_days, pred_yield, pred_corr)
+
+
+def build_result(cycle_id, features, expected_harvest, pred_days, pred_yield, pred_corr):
     # 予測後にオンザフライ算出（DB保存はしない）
     if not expected_harvest:
         plant = features.get("plant_date")
@@ -268,9 +617,9 @@ def main():
         else:
             expected_harvest = None
 
-    result = {
+    return {
         "status": "success",
-        "cycle_id": args.cycle_id,
+        "cycle_id": cycle_id,
         "expected_harvest_date": expected_harvest.strftime("%Y-%m-%d")
         if expected_harvest
         else None,
@@ -280,6 +629,204 @@ def main():
         "season_flag": features["season_flag"],
         "sales_adjust_days": features["sales_adjust_days"],
     }
+
+
+def parse_request(payload):
+    """predict.php と同じ入力 JSON を run_prediction の引数に変換する。"""
+    if not isinstance(payload, dict) or payload.get("cycle_id") in (None, ""):
+        raise ValueError("cycle_id required")
+    kwargs = {"cycle_id": int(payload["cycle_id"])}
+    if payload.get("apply_partial"):
+        if payload.get("partial_yield") is None or payload.get("partial_ratio") is None:
+            raise ValueError("partial_yield and partial_ratio required when apply_partial=true")
+        kwargs.update(
+            apply_partial=True,
+            partial_yield=float(payload["partial_yield"]),
+            partial_ratio=float(payload["partial_ratio"]),
+        )
+    return kwargs
+
+
+class PredictDaemon:
+    """モデルと DB 接続を保持したまま、1 行 1 JSON のリクエストに応答する。"""
+
+    def __init__(self):
+        self.conn = None
+        self.lock = threading.Lock()  # 接続は 1 本なので予測は直列に処理する
+        self.served = 0
+
+    def warm_up(self):
+        load_model(MODEL_DAYS_FILE)
+        load_model(MODEL_YIELD_FILE)
+        try:
+            self.connection()
+        except pymysql.MySQLError as e:
+            log.warning("DB not reachable yet (%s); will retry on first request", e)
+
+    def connection(self):
+        if self.conn is None:
+            self.conn = pymysql.connect(**DB_CONFIG)
+        else:
+            self.conn.ping(reconnect=True)  # wait_timeout で切られていたら張り直す
+        return self.conn
+
+    def drop_connection(self):
+        conn, self.conn = self.conn, None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def handle(self, line):
+        try:
+            payload = json.loads(line)
+        except ValueError:
+            return {"status": "error", "message": "invalid JSON"}
+        try:
+            kwargs = parse_request(payload)
+        except (ValueError, TypeError) as e:
+            return {"status": "error", "message": str(e)}
+        with self.lock:
+            try:
+                result = run_prediction(conn=self.connection(), **kwargs)
+            except Exception:
+                log.exception("prediction failed for cycle %s", kwargs["cycle_id"])
+                self.drop_connection()
+                return {"status": "error", "message": "Prediction failed"}
+            self.served += 1
+            return result
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    timeout = CLIENT_IDLE_SEC
+
+    def handle(self):
+        # 1 接続で複数リクエストを送ってもよい（改行区切り）
+        while True:
+            try:
+                line = self.rfile.readline(MAX_REQUEST_BYTES + 1)
+            except socket.timeout:
+                return
+            if not line:
+                return
+            if len(line) > MAX_REQUEST_BYTES:
+                self._reply({"status": "error", "message": "request too large"})
+                return
+            if not line.strip():
+                continue
+            self._reply(self.server.predictor.handle(line))
+
+    def _reply(self, result):
+        self.wfile.write(json.dumps(result, ensure_ascii=False, default=str).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def _claim_socket(path):
+    """残っているソケットファイルを片付ける。稼働中のデーモンがいれば起動しない。"""
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.unlink(path)
+    else:
+        raise SystemExit("another daemon is already listening on %s" % path)
+    finally:
+        probe.close()
+
+
+def serve(path):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    predictor = PredictDaemon()
+    predictor.warm_up()
+
+    _claim_socket(path)
+    server = _UnixServer(path, _RequestHandler)
+    server.predictor = predictor
+    os.chmod(path, SOCKET_MODE)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    log.info("listening on %s", path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        predictor.drop_connection()
+        if os.path.exists(path):
+            os.unlink(path)
+        log.info("stopped after %d predictions", predictor.served)
+
+
+def _id_list(value):
+    try:
+        ids = sorted({int(v) for v in value.split(",") if v.strip()})
+    except ValueError:
+        raise argparse.ArgumentTypeError("comma-separated integers expected: %r" % value)
+    if not ids:
+        raise argparse.ArgumentTypeError("no cycle ids given")
+    return ids
+
+
+def _iso_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise argparse.ArgumentTypeError("YYYY-MM-DD expected: %r" % value)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cycle_id", type=int)
+    parser.add_argument("--apply_partial", action="store_true")
+    parser.add_argument("--partial_yield", type=float)
+    parser.add_argument("--partial_ratio", type=float)
+    parser.add_argument("--cycle-ids", type=_id_list, help="一括モード: カンマ区切りのサイクル ID")
+    parser.add_argument("--all-open", action="store_true", help="一括モード: 未完了 (harvest_end IS NULL) の全サイクル")
+    parser.add_argument("--since", type=_iso_date, help="一括モード: plant_date がこの日 (YYYY-MM-DD) 以降のサイクル")
+    parser.add_argument("--parity-check", action="store_true", help="類似ベッド・前年同時期の一括計算を SQL と突き合わせる（更新なし）")
+    parser.add_argument("--serve", action="store_true", help="常駐して Unix ソケットで待ち受ける")
+    parser.add_argument("--socket", default=SOCKET_PATH, help="--serve のソケットパス")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.socket)
+        return
+    if args.parity_check:
+        conn = pymysql.connect(**DB_CONFIG)
+        try:
+            report = parity_check(conn, args.cycle_ids, args.all_open, args.since)
+        finally:
+            conn.close()
+        print(json.dumps(report, ensure_ascii=False, default=str))
+        sys.exit(0 if report["status"] == "success" else 1)
+    if args.cycle_ids is not None or args.all_open or args.since is not None:
+        if args.cycle_id is not None or args.apply_partial:
+            parser.error("--cycle_id / --apply_partial cannot be combined with the batch options")
+        conn = pymysql.connect(**DB_CONFIG)
+        try:
+            results = run_batch(conn, args.cycle_ids, args.all_open, args.since)
+        finally:
+            conn.close()
+        # 1 行 1 サイクル（各行は --cycle_id 実行時と同じ JSON）
+        for result in results:
+            print(json.dumps(result, ensure_ascii=False, default=str))
+        return
+    if args.cycle_id is None:
+        parser.error("--cycle_id is required unless --serve or a batch option is given")
+
+    result = run_prediction(
+        args.cycle_id,
+        apply_partial=args.apply_partial,
+        partial_yield=args.partial_yield,
+        partial_ratio=args.partial_ratio,
+    )
     print(json.dumps(result, ensure_ascii=False))
 
 
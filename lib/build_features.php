@@ -1,5 +1,6 @@
 <?php
 require_once __DIR__ . '/../api/json_utils.php';
+require_once __DIR__ . '/xgbapi_client.php';
 
 function getAsof($link) {
     $res = mysqli_query($link, "SELECT LEAST(CURDATE(), MAX(date)) AS asof FROM weather_daily");
@@ -41,8 +42,17 @@ function aggregateTemperature($link, $plantDate, $asof) {
  * - harvest_end が asof 基準の直近窓（5→10→14、足りなければ拡大）
  * - 定植 DOY ±14（同季節）。年跨ぎは円環距離
  * CURDATE() 固定禁止（学習・再予測と揃える）。
+ * XGB_API_PEER_STATS=1 なら xgbapi の /api/peer_stats（同じカスケードを asof ごとの索引で解く）を使う。
  */
 function findRecentPeerStats($link, $groupType, $asof, $plantDate) {
+    $remote = xgbapi_peer_stats([[
+        'group_type' => $groupType === null ? null : (string)$groupType,
+        'plant_date' => $plantDate
+    ]], (string)$asof);
+    if ($remote !== null) {
+        return $remote[0];
+    }
+
     $doyClause = "LEAST(
                     ABS(DAYOFYEAR(c2.plant_date) - DAYOFYEAR(?)),
                     365 - ABS(DAYOFYEAR(c2.plant_date) - DAYOFYEAR(?))
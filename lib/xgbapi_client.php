@@ -0,0 +1,61 @@
+<?php
+/**
+ * xgbapi（FastAPI）への最小クライアント。接続先は .env の XGB_API_URL（…/xgbapi/api/）と XGB_API_KEY。
+ * 未設定・通信失敗・応答異常のときは null を返すので、呼び出し側は従来の SQL 版にフォールバックする。
+ */
+function xgbapi_post(string $endpoint, array $body): ?array {
+    $url = getenv('XGB_API_URL');
+    if ($url === false || $url === '') {
+        return null;
+    }
+    // 旧設定の …/api/predict_both もベース URL として扱う
+    $base = preg_replace('#/predict_both$#', '', rtrim($url, '/'));
+    $timeout = (float)(getenv('XGB_API_TIMEOUT') ?: 2.0);
+    $headers = "Content-Type: application/json\r\n";
+    $key = getenv('XGB_API_KEY');
+    if ($key !== false && $key !== '') {
+        $headers .= "X-API-Key: " . $key . "\r\n";
+    }
+    $ctx = stream_context_create([
+        'http' => [
+            'method' => 'POST',
+            'header' => $headers,
+            'content' => json_encode($body, JSON_UNESCAPED_UNICODE),
+            'timeout' => $timeout,
+            'ignore_errors' => true,
+        ],
+    ]);
+    $raw = @file_get_contents($base . '/' . $endpoint, false, $ctx);
+    if ($raw === false) {
+        return null;
+    }
+    $res = json_decode($raw, true);
+    if (!is_array($res) || empty($res['ok'])) {
+        error_log('xgbapi ' . $endpoint . ' failed: ' . substr($raw, 0, 200));
+        return null;
+    }
+    return $res;
+}
+
+/**
+ * findRecentPeerStats を xgbapi の /api/peer_stats で解く（asof ごとの索引を共有）。
+ * XGB_API_PEER_STATS=1 のときだけ使う。$items は ['group_type' => ..., 'plant_date' => 'Y-m-d'] の配列。結果は同じ順。
+ */
+function xgbapi_peer_stats(array $items, string $asof): ?array {
+    if (getenv('XGB_API_PEER_STATS') !== '1') {
+        return null;
+    }
+    $res = xgbapi_post('peer_stats', ['asof' => $asof, 'items' => $items]);
+    if ($res === null || !isset($res['results']) || count($res['results']) !== count($items)) {
+        return null;
+    }
+    $out = [];
+    foreach ($res['results'] as $r) {
+        $out[] = [
+            'peer_mean_total' => (float)$r['peer_mean_total'],
+            'peer_mean_days'  => (float)$r['peer_mean_days'],
+            'k' => (int)$r['k']
+        ];
+    }
+    return $out;
+}
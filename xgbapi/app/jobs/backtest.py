@@ -0,0 +1,361 @@
+"""Replay the feature build and a serve model over past asof dates, and score them against what happened.
+
+    cd xgbapi && python -m app.jobs.backtest --from 2024-04-01 --to 2025-03-31 [--step 7] [--variant mid|plant] [--csv pairs.csv]
+
+For each asof in the range, every cycle open at that date (planted, its
+harvest_end not yet reached) gets the row build_features_array($pdo, $id, $asof)
+would have built on that day: harvests, harvest_start / harvest_end and
+sales_adjust_days that were only recorded later are masked out of the
+history. The rows are scored with the JSON serve models and compared with
+the actual days to first harvest (harvest_start - plant_date) and, for
+finished cycles, the actual total kg. A JSON report goes to stdout.
+
+Everything is read once with four queries. The asofs are walked in order:
+per-cycle harvest totals are advanced over the date-sorted harvests, and the
+open / known masks are array comparisons over the cycles' date ordinals, so
+each asof costs one pass over the cycles plus the memoized feature build.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import sys
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services import cycle_features, serve_models
+from app.services.db_pool import DBPool, DBUnavailable
+from app.services.weather_index import WEATHER_INDEX_SQL, WeatherIndex
+
+log = logging.getLogger("xgbapi.jobs.backtest")
+
+# every cycle with what is known about it today; first_pickup dates sales_adjust_days,
+# which sp_update_sales_adjust_days only sets once a collection exists
+CYCLES_SQL = """
+SELECT c.id, c.bed_id, c.sow_date, c.plant_date, c.harvest_start, c.harvest_end,
+       c.sales_adjust_days, b.id AS bed_row, b.group_type, p.first_pickup
+FROM cycles c
+LEFT JOIN beds b ON b.id = c.bed_id
+LEFT JOIN (
+  SELECT cycle_id, MIN(pickup_date) AS first_pickup
+  FROM collections
+  GROUP BY cycle_id
+) p ON p.cycle_id = c.id
+ORDER BY c.plant_date ASC, c.id ASC
+"""
+
+HARVESTS_SQL = """
+SELECT cycle_id, harvest_date, harvest_kg
+FROM harvests
+WHERE cycle_id IS NOT NULL AND harvest_kg IS NOT NULL
+ORDER BY harvest_date ASC, id ASC
+"""
+
+# lead = actual harvest_start - asof
+LEAD_BUCKETS = ((None, 0, "started"), (1, 14, "1-14"), (15, 30, "15-30"), (31, 60, "31-60"), (61, None, "61+"))
+
+_NEVER = np.iinfo(np.int64).max  # ordinal of a date that is not (yet) recorded
+
+
+def _ordinals(values: Sequence[Optional[date]]) -> np.ndarray:
+    return np.array([d.toordinal() if d is not None else _NEVER for d in values], dtype=np.int64)
+
+
+def asof_dates(start: date, end: date, step: int) -> List[date]:
+    if step < 1:
+        raise ValueError("step must be at least 1 day")
+    if end < start:
+        raise ValueError("--to is before --from")
+    return [start + timedelta(days=i) for i in range(0, (end - start).days + 1, step)]
+
+
+class AsofReplay:
+    """The cycles and harvests tables as they stood at each asof, for asofs visited in ascending order.
+
+    Harvests are sorted by date once; :meth:`advance` adds the ones recorded
+    up to the new asof to per-cycle running totals (``np.add.at`` over the
+    new slice), so the whole walk touches each harvest once. A date column
+    counts as recorded at an asof when it is on or before it (harvest_end is
+    entered after the last harvest, harvest_start with the first).
+    """
+
+    def __init__(self, cycles: Sequence[Dict[str, Any]], harvests: Sequence[Dict[str, Any]]) -> None:
+        to_date = cycle_features._to_date
+        self.rows = list(cycles)
+        self.ids = np.array([int(r["id"]) for r in self.rows], dtype=np.int64)
+        self.plant = [to_date(r.get("plant_date")) for r in self.rows]
+        self.start = [to_date(r.get("harvest_start")) for r in self.rows]
+        self.end = [to_date(r.get("harvest_end")) for r in self.rows]
+        self.sow = [to_date(r.get("sow_date")) for r in self.rows]
+        self.plant_ord = _ordinals(self.plant)
+        self.start_ord = _ordinals(self.start)
+        self.end_ord = _ordinals(self.end)
+        self.pickup_ord = _ordinals([to_date(r.get("first_pickup")) for r in self.rows])
+        self.has_bed = np.array([r.get("bed_row") is not None for r in self.rows], dtype=bool)
+
+        pos = {int(cid): i for i, cid in enumerate(self.ids)}
+        known = [h for h in harvests if int(h["cycle_id"]) in pos]
+        self._h_pos = np.array([pos[int(h["cycle_id"])] for h in known], dtype=np.int64)
+        self._h_kg = np.array([float(h["harvest_kg"]) for h in known], dtype=np.float64)
+        self._h_ord = _ordinals([to_date(h.get("harvest_date")) for h in known])
+        order = np.argsort(self._h_ord, kind="stable")
+        self._h_pos, self._h_kg, self._h_ord = self._h_pos[order], self._h_kg[order], self._h_ord[order]
+
+        # the outcome today: SUM(harvest_kg) over every harvest, dated or not
+        self.final_kg = np.bincount(self._h_pos, weights=self._h_kg, minlength=len(self.rows))
+        self.final_n = np.bincount(self._h_pos, minlength=len(self.rows))
+        self._kg = np.zeros(len(self.rows), dtype=np.float64)
+        self._n = np.zeros(len(self.rows), dtype=np.int64)
+        self._next = 0
+        self.asof: Optional[date] = None
+
+    def advance(self, asof: date) -> None:
+        if self.asof is not None and asof < self.asof:
+            raise ValueError("asofs must be visited in ascending order")
+        stop = int(np.searchsorted(self._h_ord, asof.toordinal(), side="right"))
+        if stop > self._next:
+            new = slice(self._next, stop)
+            np.add.at(self._kg, self._h_pos[new], self._h_kg[new])
+            np.add.at(self._n, self._h_pos[new], 1)
+            self._next = stop
+        self.asof = asof
+
+    def open_positions(self) -> np.ndarray:
+        """Cycles planted by the asof whose harvest_end had not been recorded (``harvest_end IS NULL`` then)."""
+        t = self.asof.toordinal()
+        return np.flatnonzero((self.plant_ord <= t) & (self.end_ord > t))
+
+    def inputs(self, weather: WeatherIndex, positions: np.ndarray) -> cycle_features.CycleInputs:
+        """:class:`CycleInputs` for the cycles at ``positions``, from the rows TARGETS_SQL / HISTORY_SQL returned then."""
+        t = self.asof.toordinal()
+        started = self.start_ord <= t
+        ended = self.end_ord <= t
+        picked = self.pickup_ord <= t
+        history = [
+            {
+                "id": r["id"],
+                "bed_id": r["bed_id"],
+                "bed_row": r.get("bed_row"),
+                "group_type": r.get("group_type"),
+                "plant_date": self.plant[i],
+                "harvest_start": self.start[i] if started[i] else None,
+                "harvest_end": self.end[i] if ended[i] else None,
+                "total_yield": float(self._kg[i]) if self._n[i] else None,
+            }
+            for i, r in enumerate(self.rows)
+        ]
+        targets = {}
+        for i in positions:
+            if not self.has_bed[i]:  # TARGETS_SQL joins beds: "cycle not found", as in PHP
+                continue
+            r = self.rows[i]
+            targets[int(r["id"])] = {
+                "id": r["id"],
+                "bed_id": r["bed_id"],
+                "sow_date": self.sow[i],
+                "plant_date": self.plant[i],
+                "sales_adjust_days": r.get("sales_adjust_days") if picked[i] else None,
+                "group_type": r.get("group_type"),
+            }
+        return cycle_features.CycleInputs(self.asof, targets, weather, history)
+
+
+# ----- metrics -----
+def _errors(pred: np.ndarray, actual: np.ndarray, baseline: np.ndarray) -> Dict[str, Any]:
+    ok = ~np.isnan(actual)
+    n = int(ok.sum())
+    if not n:
+        return {"n": 0}
+    err = pred[ok] - actual[ok]
+    return {
+        "n": n,
+        "mae": round(float(np.abs(err).mean()), 3),
+        "rmse": round(float(np.sqrt((err ** 2).mean())), 3),
+        "bias": round(float(err.mean()), 3),
+        "baseline_mae": round(float(np.abs(baseline[ok] - actual[ok]).mean()), 3),
+    }
+
+
+def summarize(pairs: Dict[str, np.ndarray], mask: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    if mask is None:
+        mask = np.ones(len(pairs["asof"]), dtype=bool)
+    return {
+        "pairs": int(mask.sum()),
+        "days": _errors(pairs["pred_days"][mask], pairs["actual_days"][mask], pairs["baseline_days"][mask]),
+        "yield": _errors(pairs["pred_yield"][mask], pairs["actual_yield"][mask], pairs["baseline_yield"][mask]),
+    }
+
+
+def lead_buckets(pairs: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    lead = pairs["lead_days"]
+    out = []
+    for lo, hi, label in LEAD_BUCKETS:
+        mask = ~np.isnan(lead)
+        if lo is not None:
+            mask &= lead >= lo
+        if hi is not None:
+            mask &= lead <= hi
+        out.append({"lead_days": label, **summarize(pairs, mask)})
+    return out
+
+
+# ----- job -----
+def replay(
+    replayer: AsofReplay,
+    weather: WeatherIndex,
+    asofs: Sequence[date],
+    variant: str = "mid",
+) -> Tuple[Dict[str, np.ndarray], List[Dict[str, Any]], Dict[str, int]]:
+    """(scored pairs as columns, per-asof counts, failure counts by message)."""
+    keys: List[Tuple[int, int]] = []  # (asof index, cycle position)
+    rows: List[Dict[str, Any]] = []
+    failures: Dict[str, int] = {}
+    per_asof: List[Dict[str, Any]] = []
+    for a, asof in enumerate(asofs):
+        replayer.advance(asof)
+        positions = replayer.open_positions()
+        inputs = replayer.inputs(weather, positions)
+        ids = [int(replayer.ids[i]) for i in positions]
+        inputs.prefetch_peers(ids)
+        built = 0
+        for i, cycle_id in zip(positions, ids):
+            try:
+                rows.append(inputs.features(cycle_id))
+            except cycle_features.CycleFeatureError as exc:
+                failures[str(exc)] = failures.get(str(exc), 0) + 1
+                continue
+            keys.append((a, int(i)))
+            built += 1
+        per_asof.append({"asof": asof.isoformat(), "open": int(len(positions)), "built": built})
+
+    preds = serve_models.predict_rows(rows, variant)  # one vectorised pass over every pair
+    scored = [j for j, p in enumerate(preds) if isinstance(p, dict)]
+    for j, p in enumerate(preds):
+        if not isinstance(p, dict):
+            failures[p] = failures.get(p, 0) + 1
+
+    a_idx = np.array([keys[j][0] for j in scored], dtype=np.int64)
+    pos = np.array([keys[j][1] for j in scored], dtype=np.int64)
+    asof_ord = np.array([d.toordinal() for d in asofs], dtype=np.int64)[a_idx]
+    start_ord, plant_ord, end_ord = replayer.start_ord[pos], replayer.plant_ord[pos], replayer.end_ord[pos]
+    has_start = start_ord != _NEVER
+    finished = (end_ord != _NEVER) & (replayer.final_n[pos] > 0)
+    pairs = {
+        "asof": a_idx,
+        "cycle_id": replayer.ids[pos],
+        "model_id": np.array([preds[j]["model_id"] for j in scored], dtype=object),
+        "pred_days": np.array([preds[j]["days"] for j in scored], dtype=np.float64),
+        "pred_yield": np.array([preds[j]["yield"] for j in scored], dtype=np.float64),
+        "baseline_days": np.array([preds[j]["baseline_days"] for j in scored], dtype=np.float64),
+        "baseline_yield": np.array([preds[j]["baseline_yield"] for j in scored], dtype=np.float64),
+        "actual_days": np.where(has_start, (start_ord - plant_ord).astype(np.float64), np.nan),
+        "actual_yield": np.where(finished, replayer.final_kg[pos], np.nan),
+        "lead_days": np.where(has_start, (start_ord - asof_ord).astype(np.float64), np.nan),
+    }
+    scored_per_asof = np.bincount(a_idx, minlength=len(asofs))
+    for a, entry in enumerate(per_asof):
+        entry["scored"] = int(scored_per_asof[a])
+        mask = a_idx == a
+        report = summarize(pairs, mask)
+        entry["days_mae"] = report["days"].get("mae")
+        entry["yield_mae"] = report["yield"].get("mae")
+    return pairs, per_asof, failures
+
+
+def write_csv(path: str, pairs: Dict[str, np.ndarray], asofs: Sequence[date]) -> None:
+    columns = ("cycle_id", "model_id", "pred_days", "actual_days", "baseline_days",
+               "pred_yield", "actual_yield", "baseline_yield", "lead_days")
+    with open(path, "w", newline="", encoding="utf-8") as fh:
+        w = csv.writer(fh)
+        w.writerow(("asof",) + columns)
+        for j in range(len(pairs["asof"])):
+            values = []
+            for c in columns:
+                v = pairs[c][j]
+                values.append("" if isinstance(v, float) and np.isnan(v) else v)
+            w.writerow([asofs[pairs["asof"][j]].isoformat()] + values)
+
+
+async def load(pool: DBPool) -> Tuple[AsofReplay, WeatherIndex]:
+    cycles, harvests, weather = await asyncio.gather(
+        pool.fetchall(CYCLES_SQL),
+        pool.fetchall(HARVESTS_SQL),
+        pool.fetchall(WEATHER_INDEX_SQL),
+    )
+    return AsofReplay(cycles, harvests), WeatherIndex.from_rows(weather)
+
+
+async def backtest(
+    pool: DBPool,
+    start: date,
+    end: date,
+    step: int = 7,
+    variant: str = "mid",
+    csv_path: Optional[str] = None,
+) -> Dict[str, Any]:
+    started = time.perf_counter()
+    replayer, weather = await load(pool)
+    loaded = time.perf_counter()
+    if weather.end is None:
+        raise RuntimeError("asof not found (weather_daily is empty)")
+    if end > weather.end:  # getAsof never passes the last weather day
+        log.warning("--to %s is after the last weather day; stopping at %s", end, weather.end)
+        end = weather.end
+    asofs = asof_dates(start, end, step)
+    pairs, per_asof, failures = replay(replayer, weather, asofs, variant)
+    if csv_path:
+        write_csv(csv_path, pairs, asofs)
+    done = time.perf_counter()
+    log.info(
+        "%d asofs, %d pairs scored in %.2fs (load %.2fs)",
+        len(asofs), len(pairs["asof"]), done - started, loaded - started,
+    )
+    return {
+        "variant": variant,
+        "model_ids": sorted(set(pairs["model_id"].tolist())),
+        "from": asofs[0].isoformat() if asofs else None,
+        "to": asofs[-1].isoformat() if asofs else None,
+        "step_days": step,
+        "asofs": len(asofs),
+        **summarize(pairs),
+        "failed": sum(failures.values()),
+        "failures": failures,
+        "by_lead": lead_buckets(pairs),
+        "by_asof": per_asof,
+        "elapsed_sec": {"load": round(loaded - started, 3), "total": round(done - started, 3)},
+    }
+
+
+async def _main(args: argparse.Namespace) -> int:
+    pool = DBPool.from_env()
+    try:
+        report = await backtest(pool, args.date_from, args.date_to, args.step, args.variant, args.csv)
+    except (DBUnavailable, RuntimeError, ValueError) as exc:
+        log.error("backtest aborted: %s", exc)
+        return 1
+    finally:
+        await pool.close()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="As-of backtest of the serve models over past dates.")
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat, required=True, help="first asof (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="date_to", type=date.fromisoformat, required=True, help="last asof (YYYY-MM-DD)")
+    parser.add_argument("--step", type=int, default=7, help="days between asofs (default: 7)")
+    parser.add_argument("--variant", choices=("mid", "plant"), default="mid", help="serve model (default: mid ridge)")
+    parser.add_argument("--csv", help="also write every scored (asof, cycle) pair to this CSV")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    return asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""Re-featurise and re-predict every open cycle, as jobs/repredict_open_cycles.php does.
+
+    cd xgbapi && python -m app.jobs.repredict_open_cycles [--variant mid|plant] [--workers N] [--dry-run]
+
+Features for the whole open set come from a handful of set-based queries
+(read through ``features_cache``), are built in contiguous shards on a
+process pool, scored with the JSON serve models in one vectorised pass, and
+every ``predictions`` row is inserted in batched statements within a single
+transaction. stdout carries the PHP job's ``OK`` / ``FAIL`` / ``DONE`` lines.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.services import cycle_features, serve_models
+from app.services.db_pool import DBPool, DBUnavailable
+from app.services.features_cache import FeaturesCache
+
+log = logging.getLogger("xgbapi.jobs.repredict")
+
+OPEN_CYCLES_SQL = "SELECT id FROM cycles WHERE harvest_end IS NULL ORDER BY plant_date ASC, id ASC"
+
+# ⑤ compute_yield_postproc_from_harvests, for many cycles
+POSTPROC_SQL = """
+SELECT cycle_id,
+       COALESCE(SUM(harvest_kg), 0) AS kg_sum,
+       COALESCE(SUM(harvest_ratio), 0) AS ratio_sum
+FROM harvests
+WHERE cycle_id IN ({placeholders})
+GROUP BY cycle_id
+"""
+POSTPROC_MIN_RATIO = 0.05
+
+INSERT_SQL = """
+INSERT INTO predictions (cycle_id, model_id, pred_days, pred_total_kg, postproc_total_kg)
+VALUES {values}
+"""
+INSERT_CHUNK = 500
+QUERY_CHUNK = 1000
+SHARD_MIN_CYCLES = 250  # smaller shards spend more on shipping the inputs than they save
+
+FEATURES_CACHE = os.getenv("FEATURES_CACHE", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+# ----- features (process pool) -----
+_WORKER_INPUTS: Optional[cycle_features.CycleInputs] = None
+
+
+def _init_worker(inputs: cycle_features.CycleInputs) -> None:
+    global _WORKER_INPUTS
+    _WORKER_INPUTS = inputs
+
+
+def _build(inputs: cycle_features.CycleInputs, ids: Sequence[int]) -> Tuple[Dict[int, Dict[str, Any]], Dict[int, str]]:
+    rows: Dict[int, Dict[str, Any]] = {}
+    errors: Dict[int, str] = {}
+    for cycle_id in ids:
+        try:
+            rows[cycle_id] = inputs.features(cycle_id)
+        except cycle_features.CycleFeatureError as exc:
+            errors[cycle_id] = str(exc)
+    return rows, errors
+
+
+def _build_shard(ids: Sequence[int]) -> Tuple[Dict[int, Dict[str, Any]], Dict[int, str]]:
+    return _build(_WORKER_INPUTS, ids)
+
+
+def build_features(
+    inputs: cycle_features.CycleInputs,
+    ids: Sequence[int],
+    workers: int,
+) -> Tuple[Dict[int, Dict[str, Any]], Dict[int, str]]:
+    """Feature rows (and per-cycle errors) for ``ids``, sharded over up to ``workers`` processes.
+
+    Shards are contiguous runs of the plant_date order, so neighbouring
+    cycles, which share most aggregates, land in the same worker's memo.
+    """
+    shards = min(max(1, workers), len(ids) // SHARD_MIN_CYCLES)
+    if shards <= 1:
+        return _build(inputs, ids)
+    inputs.peers  # build the peer index once, before the inputs are shipped to the workers
+    size = -(-len(ids) // shards)
+    chunks = [ids[i:i + size] for i in range(0, len(ids), size)]
+    rows: Dict[int, Dict[str, Any]] = {}
+    errors: Dict[int, str] = {}
+    with ProcessPoolExecutor(len(chunks), initializer=_init_worker, initargs=(inputs,)) as ex:
+        for shard_rows, shard_errors in ex.map(_build_shard, chunks):
+            rows.update(shard_rows)
+            errors.update(shard_errors)
+    return rows, errors
+
+
+# ----- DB steps -----
+async def fetch_postproc(pool: DBPool, ids: Sequence[int]) -> Dict[int, Optional[float]]:
+    """SUM(kg) / SUM(ratio) per cycle; None when the ratio is below POSTPROC_MIN_RATIO."""
+    sums: Dict[int, Tuple[float, float]] = {}
+    for i in range(0, len(ids), QUERY_CHUNK):
+        chunk = list(ids[i:i + QUERY_CHUNK])
+        sql = POSTPROC_SQL.format(placeholders=",".join(["%s"] * len(chunk)))
+        for r in await pool.fetchall(sql, chunk):
+            sums[int(r["cycle_id"])] = (float(r["kg_sum"] or 0), float(r["ratio_sum"] or 0))
+    out: Dict[int, Optional[float]] = {}
+    for cycle_id in ids:
+        kg, ratio = sums.get(cycle_id, (0.0, 0.0))
+        out[cycle_id] = serve_models.php_round(kg / ratio) if ratio >= POSTPROC_MIN_RATIO else None
+    return out
+
+
+async def insert_predictions(pool: DBPool, rows: Sequence[Tuple[int, str, float, float, Optional[float]]]) -> int:
+    statements = []
+    for i in range(0, len(rows), INSERT_CHUNK):
+        chunk = rows[i:i + INSERT_CHUNK]
+        args: List[Any] = [v for row in chunk for v in row]
+        statements.append((INSERT_SQL.format(values=",".join(["(%s,%s,%s,%s,%s)"] * len(chunk))), args))
+    return await pool.transaction(statements) if statements else 0
+
+
+def _php_str(value: Optional[float]) -> str:
+    # (string)$float: shortest round-trip form, no trailing ".0"
+    if value is None:
+        return "null"
+    text = repr(float(value))
+    return text[:-2] if text.endswith(".0") else text
+
+
+# ----- job -----
+async def repredict(pool: DBPool, variant: str = "mid", workers: int = 1, dry_run: bool = False) -> Tuple[int, int, int]:
+    started = time.perf_counter()
+    ids = [int(r["id"]) for r in await pool.fetchall(OPEN_CYCLES_SQL)]
+    rows: Dict[int, Dict[str, Any]] = {}
+    errors: Dict[int, str] = {}
+    cached: Dict[int, Dict[str, Any]] = {}
+    try:
+        asof = await cycle_features.fetch_asof(pool)
+        cache = FeaturesCache(cycle_features.FEATURE_SPEC, cycle_features.FEATURE_COLUMNS) if FEATURES_CACHE else None
+        cache_inputs = None
+        if cache is not None and ids:
+            cached, cache_inputs = await cache.lookup(pool, ids, asof)
+        rows.update(cached)
+        todo = [cycle_id for cycle_id in ids if cycle_id not in cached]
+        if todo:
+            inputs = await cycle_features.fetch_inputs(pool, todo, asof)
+            built, errors = await asyncio.get_running_loop().run_in_executor(
+                None, build_features, inputs, todo, workers
+            )
+            rows.update(built)
+            if cache is not None:
+                await cache.store(pool, built, asof, cache_inputs)
+    except RuntimeError as exc:  # asof not found: every cycle fails, as in PHP
+        errors = {cycle_id: str(exc) for cycle_id in ids}
+        rows = {}
+    features_done = time.perf_counter()
+
+    scored = [cycle_id for cycle_id in ids if cycle_id in rows]
+    preds = dict(zip(scored, serve_models.predict_rows([rows[i] for i in scored], variant)))
+    predicted = [cycle_id for cycle_id in scored if isinstance(preds[cycle_id], dict)]
+    errors.update({cycle_id: preds[cycle_id] for cycle_id in scored if cycle_id not in predicted})
+    postproc = await fetch_postproc(pool, predicted) if predicted else {}
+
+    if not dry_run:
+        try:
+            await insert_predictions(pool, [
+                (cycle_id, preds[cycle_id]["model_id"], preds[cycle_id]["days"], preds[cycle_id]["yield"], postproc[cycle_id])
+                for cycle_id in predicted
+            ])
+        except DBUnavailable as exc:  # rolled back: nothing was written
+            errors.update({cycle_id: str(exc) for cycle_id in predicted})
+            predicted = []
+    done = set(predicted)
+
+    ok = fail = 0
+    for cycle_id in ids:
+        if cycle_id in done:
+            ok += 1
+            p = preds[cycle_id]
+            print("OK cycle=%d days=%.1f yield=%.1f postproc=%s" % (cycle_id, p["days"], p["yield"], _php_str(postproc[cycle_id])))
+        else:
+            fail += 1
+            print("FAIL cycle=%d %s" % (cycle_id, errors.get(cycle_id, "not predicted")))
+            log.error("repredict_open failed cycle_id=%d error=%s", cycle_id, errors.get(cycle_id))
+    print("DONE ok=%d fail=%d total=%d" % (ok, fail, len(ids)))
+    log.info(
+        "%d cycles (%d from features_cache) in %.2fs, features %.2fs%s",
+        len(ids), len(cached), time.perf_counter() - started, features_done - started,
+        " (dry run, nothing inserted)" if dry_run else "",
+    )
+    return ok, fail, len(ids)
+
+
+async def _main(args: argparse.Namespace) -> int:
+    pool = DBPool.from_env()
+    try:
+        await repredict(pool, args.variant, args.workers, args.dry_run)
+    except DBUnavailable as exc:
+        log.error("repredict_open aborted: %s", exc)
+        return 1
+    finally:
+        await pool.close()
+    return 0
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Re-predict every open cycle (harvest_end IS NULL).")
+    parser.add_argument("--variant", choices=("mid", "plant"), default="mid", help="serve model (default: mid ridge)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="feature-building processes")
+    parser.add_argument("--dry-run", action="store_true", help="print the results without inserting predictions")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    return asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
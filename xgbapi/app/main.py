@@ -4,6 +4,7 @@ import json
 import logging
 import logging.config
 import os
+import time
 from datetime import datetime
 from pathlib import Path
 from typing import List
@@ -13,10 +14,13 @@ from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response
 
 from app.deps.auth import require_api_key
+from app.services import metrics
+from app.services.codec import FastJSONResponse
 from app.routes.predict import router as predict_router
+from app.routes.predict import close_db, shutdown_workers, start_background_preload, stop_artifact_watcher
 
 load_dotenv()
 
@@ -28,6 +32,7 @@ MODEL_PATH_DAYS = os.getenv("MODEL_PATH_DAYS")
 MODEL_PATH_YIELD = os.getenv("MODEL_PATH_YIELD")
 PREPROC_PATH = os.getenv("PREPROC_PATH")
 FEATURE_META_PATH = os.getenv("FEATURE_META_PATH")
+LOOP_LAG_INTERVAL_SEC = float(os.getenv("LOOP_LAG_INTERVAL_SEC", "0.5"))
 
 logger = logging.getLogger("xgbapi")
 
@@ -38,14 +43,21 @@ def _split_env(name: str, default: str) -> List[str]:
 
 class RequestIdMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
+        started = time.perf_counter()
         rid = request.headers.get("X-Request-ID") or datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
         request.state.request_id = rid
         response = await call_next(request)
         response.headers["X-Request-ID"] = rid
+        # label by route template, not raw path, to keep the series count bounded
+        route = request.scope.get("route")
+        endpoint = getattr(route, "path", None) or "unmatched"
+        metrics.REQUEST_SECONDS.observe(
+            time.perf_counter() - started, endpoint, request.method, response.status_code
+        )
         return response
 
 
-app = FastAPI(title="XGBoost Predict API", version=APP_VERSION)
+app = FastAPI(title="XGBoost Predict API", version=APP_VERSION, default_response_class=FastJSONResponse)
 
 # CORS configuration from environment
 allow_origins = _split_env("CORS_ALLOW_ORIGINS", "*")
@@ -59,6 +71,8 @@ app.add_middleware(
 )
 app.add_middleware(RequestIdMiddleware)
 
+_LOOP_LAG = metrics.LoopLagMonitor(LOOP_LAG_INTERVAL_SEC)
+
 # API key protection
 app.include_router(predict_router, prefix="/api", dependencies=[Depends(require_api_key)])
 
@@ -77,6 +91,16 @@ async def on_startup() -> None:
     logger.info("[CONFIG] FEATURE_META_PATH  = %s", FEATURE_META_PATH)
     logger.info("[CONFIG] LOG_LEVEL          = %s", LOG_LEVEL)
     logger.info("[CONFIG] APP_VERSION        = %s", APP_VERSION)
+    start_background_preload()
+    _LOOP_LAG.start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    await _LOOP_LAG.stop()
+    stop_artifact_watcher()
+    shutdown_workers()
+    await close_db()
 
 
 @app.get("/healthz")
@@ -84,6 +108,11 @@ async def healthz() -> dict:
     return {"ok": True}
 
 
+@app.get("/metrics")
+async def prometheus_metrics() -> Response:
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
     rid = getattr(request.state, "request_id", datetime.utcnow().strftime("%Y%m%d%H%M%S%f"))
@@ -97,6 +126,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
     return JSONResponse(
         status_code=exc.status_code,
         content={"ok": False, "error": {"code": code, "message": message}, "request_id": rid},
+        headers=getattr(exc, "headers", None),
     )
 
 
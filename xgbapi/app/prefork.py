@@ -0,0 +1,269 @@
+"""Pre-fork multi-worker server sharing one copy of the model memory.
+
+    python -m app.prefork        (WORKERS=4, API_HOST, API_PORT from the env)
+
+The parent binds the socket and loads the artifacts once, moves every object
+it has allocated into the GC's permanent generation (``gc.freeze``) and
+forks ``WORKERS`` uvicorn servers on the shared socket. Workers never write to
+the model objects, so their pages stay shared copy-on-write instead of each
+process holding its own copy.
+
+Reloads are coordinated by the parent: on SIGHUP, or when the artifact files
+change (polled every ``ARTIFACT_POLL_SEC``), it loads the new artifacts and
+replaces the workers one at a time, starting each new worker and waiting
+until it reports ready before gracefully stopping an old one.
+"""
+from __future__ import annotations
+
+import gc
+import json
+import logging
+import logging.config
+import os
+import random
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+log = logging.getLogger("xgbapi.prefork")
+
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8080"))
+WORKERS = max(1, int(os.getenv("WORKERS", str(os.cpu_count() or 1))))
+# OpenMP / BLAS threads per worker; 1 avoids WORKERS x cores oversubscription
+PREFORK_OMP_THREADS = max(1, int(os.getenv("PREFORK_OMP_THREADS", "1")))
+PREFORK_READY_TIMEOUT_SEC = float(os.getenv("PREFORK_READY_TIMEOUT_SEC", "120"))
+PREFORK_GRACEFUL_SEC = float(os.getenv("PREFORK_GRACEFUL_SEC", "30"))
+ARTIFACT_POLL_SEC = float(os.getenv("ARTIFACT_POLL_SEC", "5"))
+
+_THREAD_ENV = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+
+def _configure_env() -> None:
+    """Must run before numpy / xgboost are imported."""
+    for name in _THREAD_ENV:
+        os.environ.setdefault(name, str(PREFORK_OMP_THREADS))
+    # each worker gets its share of the cores for the inference thread pool
+    os.environ.setdefault("INFER_WORKERS", str(max(1, (os.cpu_count() or 1) // WORKERS)))
+    # workers must not reload on their own: the parent re-forks them instead
+    os.environ["ARTIFACT_POLL_SEC"] = "0"
+    os.environ["STARTUP_PRELOAD"] = "1"
+
+
+def _configure_logging() -> None:
+    cfg_path = Path(__file__).resolve().parent.parent / "config" / "logging.json"
+    if cfg_path.exists():
+        with open(cfg_path, "r", encoding="utf-8") as f:
+            cfg = json.load(f)
+        cfg.setdefault("disable_existing_loggers", False)
+        logging.config.dictConfig(cfg)
+    else:
+        logging.basicConfig(level=logging.INFO)
+
+
+def _limit_model_threads(art) -> None:
+    for model in (art.model_days, art.model_yield):
+        try:
+            if "n_jobs" in model.get_params():
+                model.set_params(n_jobs=PREFORK_OMP_THREADS)
+        except Exception:
+            pass  # not an sklearn-style estimator
+
+
+class Supervisor:
+    def __init__(self, app, predict, sock: socket.socket) -> None:
+        self.app = app
+        self.predict = predict
+        self.sock = sock
+        self.workers: Dict[int, float] = {}  # pid -> started at
+        self.retiring: set = set()
+        self.stopping = False
+        self.reload_requested = False
+        self._pending_sig: Optional[str] = None
+        self._failed_sig: Optional[str] = None
+
+    # ----- artifacts -----
+    def load(self) -> bool:
+        started = time.perf_counter()
+        try:
+            art = self.predict.load_for_prefork()
+        except Exception:
+            log.exception("[PREFORK] artifact load failed")
+            return False
+        _limit_model_threads(art)
+        gc.collect()
+        gc.freeze()  # keep the GC from touching (and un-sharing) the parent's pages
+        log.info("[PREFORK] artifacts loaded in %.3fs (sig=%s)", time.perf_counter() - started, art.signature)
+        return True
+
+    # ----- workers -----
+    def spawn(self) -> Tuple[int, int]:
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            try:
+                self._child(write_fd)
+            finally:
+                os._exit(0)
+        os.close(write_fd)
+        self.workers[pid] = time.monotonic()
+        log.info("[PREFORK] started worker pid=%d", pid)
+        return pid, read_fd
+
+    def _child(self, ready_fd: int) -> None:
+        import uvicorn
+
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(sig, signal.SIG_DFL)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        random.seed()  # the parent's state is inherited by every worker
+
+        def _notify_ready() -> None:
+            self.predict._READY.wait()
+            try:
+                os.write(ready_fd, b"1")
+            except OSError:
+                pass  # the parent was not waiting for this worker
+            finally:
+                os.close(ready_fd)
+
+        threading.Thread(target=_notify_ready, name="prefork-ready", daemon=True).start()
+        config = uvicorn.Config(self.app, host=API_HOST, port=API_PORT, log_config=None)
+        uvicorn.Server(config).run(sockets=[self.sock])
+
+    @staticmethod
+    def wait_ready(read_fd: int, timeout: float) -> bool:
+        try:
+            ready, _, _ = select.select([read_fd], [], [], timeout)
+            return bool(ready and os.read(read_fd, 1))
+        finally:
+            os.close(read_fd)
+
+    def reap(self) -> None:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            started = self.workers.pop(pid, None)
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+                continue
+            if started is None or self.stopping:
+                continue
+            log.error("[PREFORK] worker pid=%d exited unexpectedly (status=%s); restarting", pid, status)
+            if time.monotonic() - started < 1.0:
+                time.sleep(1.0)  # crash loop: don't spin
+            _, read_fd = self.spawn()
+            os.close(read_fd)
+
+    def rolling_restart(self) -> None:
+        old: List[int] = [pid for pid in self.workers if pid not in self.retiring]
+        for pid in old:
+            new_pid, read_fd = self.spawn()
+            if not self.wait_ready(read_fd, PREFORK_READY_TIMEOUT_SEC):
+                log.warning("[PREFORK] worker pid=%d not ready after %.0fs; continuing", new_pid, PREFORK_READY_TIMEOUT_SEC)
+            self.retiring.add(pid)
+            try:
+                os.kill(pid, signal.SIGTERM)  # uvicorn finishes in-flight requests
+            except ProcessLookupError:
+                pass
+        log.info("[PREFORK] rolling restart of %d workers done", len(old))
+
+    def reload(self) -> None:
+        log.info("[PREFORK] reloading artifacts")
+        if self.load():
+            self._failed_sig = None
+            self.rolling_restart()
+        else:
+            self._failed_sig = self.predict._signature()
+            log.error("[PREFORK] reload failed; workers keep serving the previous artifacts")
+
+    def _artifacts_changed(self) -> bool:
+        sig = self.predict._signature()
+        if sig == self.predict._SIG or sig == self._failed_sig:
+            self._pending_sig = None
+            return False
+        if sig != self._pending_sig:
+            self._pending_sig = sig  # wait one more poll for writes to settle
+            return False
+        self._pending_sig = None
+        return True
+
+    # ----- main loop -----
+    def run(self) -> None:
+        def _on_hup(signum, frame):
+            self.reload_requested = True
+
+        def _on_stop(signum, frame):
+            self.stopping = True
+
+        signal.signal(signal.SIGHUP, _on_hup)
+        signal.signal(signal.SIGTERM, _on_stop)
+        signal.signal(signal.SIGINT, _on_stop)
+
+        for _ in range(WORKERS):
+            _, read_fd = self.spawn()
+            os.close(read_fd)
+
+        next_poll = time.monotonic() + ARTIFACT_POLL_SEC
+        while not self.stopping:
+            self.reap()
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload()
+            elif ARTIFACT_POLL_SEC > 0 and time.monotonic() >= next_poll:
+                next_poll = time.monotonic() + ARTIFACT_POLL_SEC
+                if self._artifacts_changed():
+                    self.reload()
+            time.sleep(0.5)
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        log.info("[PREFORK] stopping %d workers", len(self.workers))
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + PREFORK_GRACEFUL_SEC
+        while self.workers and time.monotonic() < deadline:
+            self.retiring.update(self.workers)
+            self.reap()
+            time.sleep(0.1)
+        for pid in list(self.workers):
+            log.warning("[PREFORK] killing worker pid=%d", pid)
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+
+def main() -> None:
+    _configure_env()
+    _configure_logging()
+
+    from app.main import app
+    from app.routes import predict
+
+    sock = socket.create_server((API_HOST, API_PORT), backlog=2048)
+    log.info("[PREFORK] listening on %s:%s with %d workers", API_HOST, API_PORT, WORKERS)
+
+    supervisor = Supervisor(app, predict, sock)
+    if not supervisor.load():
+        log.error("[PREFORK] starting workers without preloaded artifacts; each worker loads its own copy")
+    supervisor.run()
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
+    sys.exit(0)
@@ -1,15 +1,31 @@
 from __future__ import annotations
 
+import asyncio
+import functools
+import itertools
 import json
 import logging
 import os
-from datetime import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
 from types import SimpleNamespace
 from typing import Any, Dict, List, Optional
 
 from fastapi import APIRouter, HTTPException, Request
+from starlette.requests import ClientDisconnect
+from starlette.responses import Response
 
-from app.services import feature_shim
+from app.services import codec, cycle_features, feature_shim, metrics, preproc_plan, tree_engine
+from app.services.artifact_watcher import ArtifactWatcher
+from app.services.batcher import MicroBatcher
+from app.services.db_pool import DBPool, DBUnavailable
+from app.services.features_cache import FeaturesCache
+from app.services.inference_pool import InferencePool, PoolBusy
+from app.services.model_registry import ModelRegistry
+from app.services.pred_cache import PredictionCache
+from app.services.shadow import ShadowScorer
 
 try:  # Required to load serialized models
     import joblib
@@ -21,11 +37,6 @@ try:  # Required for array math / rounding
 except Exception as exc:  # pragma: no cover - import guard
     raise RuntimeError("numpy is required for prediction endpoints") from exc
 
-try:  # Optional: only needed when preprocessing pipeline exists
-    import pandas as pd  # type: ignore
-except Exception:  # pragma: no cover - optional dependency
-    pd = None
-
 router = APIRouter()
 log = logging.getLogger("xgbapi.predict")
 
@@ -34,8 +45,85 @@ MODEL_PATH_YIELD = os.getenv("MODEL_PATH_YIELD")
 PREPROC_PATH = os.getenv("PREPROC_PATH")
 FEATURE_META_PATH = os.getenv("FEATURE_META_PATH")
 
+# Opt-in micro-batching for /predict_both (see README "Micro-batching")
+BATCH_ENABLED = os.getenv("BATCH_ENABLED", "0").strip().lower() in ("1", "true", "yes", "on")
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+BATCH_MAX_ROWS = int(os.getenv("BATCH_MAX_ROWS", "1024"))
+
+# Inference worker pool / load shedding (see README "Inference workers")
+INFER_WORKERS = int(os.getenv("INFER_WORKERS", str(min(4, os.cpu_count() or 1))))
+INFER_MAX_QUEUE = int(os.getenv("INFER_MAX_QUEUE", "32"))
+INFER_BUSY_STATUS = int(os.getenv("INFER_BUSY_STATUS", "503"))
+
+# Per-row prediction cache (PRED_CACHE_SIZE=0 disables)
+PRED_CACHE_SIZE = int(os.getenv("PRED_CACHE_SIZE", "50000"))
+PRED_CACHE_TTL_SEC = float(os.getenv("PRED_CACHE_TTL_SEC", "600"))
+
+# Feature matrix: dtype and the fill value for absent / null optional features
+MATRIX_DTYPE = np.dtype(os.getenv("MATRIX_DTYPE", "float64"))
+MISSING_FILL = float("nan") if os.getenv("MISSING_FILL", "zero").strip().lower() == "nan" else 0.0
+
+# Artifact hot-swap: polling interval in seconds (0 = check mtimes on every request)
+ARTIFACT_POLL_SEC = float(os.getenv("ARTIFACT_POLL_SEC", "5"))
+
+# Startup: load artifacts and score a warm-up batch before reporting ready
+STARTUP_PRELOAD = os.getenv("STARTUP_PRELOAD", "1").strip().lower() not in ("0", "false", "no", "off")
+WARMUP_ROWS = int(os.getenv("WARMUP_ROWS", "64"))
+
+# Flat-array tree evaluator for small batches (TREE_ENGINE=auto|off)
+TREE_ENGINE = os.getenv("TREE_ENGINE", "auto").strip().lower()
+TREE_ENGINE_MAX_ROWS = int(os.getenv("TREE_ENGINE_MAX_ROWS", "64"))
+
+# Preprocessor compiled to NumPy at load time (PREPROC_PLAN=auto|off)
+PREPROC_PLAN = os.getenv("PREPROC_PLAN", "auto").strip().lower()
+
+# Versioned models under MODEL_BASE/MODEL_NAME/<version>/, selected per request
+MODEL_BASE = os.getenv("MODEL_BASE", "")
+MODEL_NAME = os.getenv("MODEL_NAME", "yield_days_xgb")
+MODEL_MAX_RESIDENT = int(os.getenv("MODEL_MAX_RESIDENT", "2"))
+MODEL_VERSION_HEADER = "X-Model-Version"
+MODEL_VERSION_PARAM = "model_version"
+
+# Shadow scoring of /predict_both traffic with a registry version (empty = off)
+SHADOW_MODEL_VERSION = os.getenv("SHADOW_MODEL_VERSION", "").strip()
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "1.0"))
+SHADOW_MAX_PENDING = int(os.getenv("SHADOW_MAX_PENDING", "8"))
+
+# Streaming NDJSON bulk scoring (/predict_stream): rows scored per chunk, longest accepted line
+STREAM_CHUNK_ROWS = max(1, int(os.getenv("STREAM_CHUNK_ROWS", "2000")))
+STREAM_MAX_LINE_BYTES = int(os.getenv("STREAM_MAX_LINE_BYTES", str(1 << 20)))
+
+# Forecast DB for /predict_cycles (same FORECAST_DB_* variables as db.php)
+FORECAST_DB_HOST = os.getenv("FORECAST_DB_HOST", "")
+FORECAST_DB_PORT = int(os.getenv("FORECAST_DB_PORT", "3306"))
+FORECAST_DB_USER = os.getenv("FORECAST_DB_USER", "")
+FORECAST_DB_PASS = os.getenv("FORECAST_DB_PASS", "")
+FORECAST_DB_NAME = os.getenv("FORECAST_DB_NAME", "")
+FORECAST_DB_CHARSET = os.getenv("FORECAST_DB_CHARSET", "utf8mb4")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "4"))
+PREDICT_CYCLES_MAX_IDS = int(os.getenv("PREDICT_CYCLES_MAX_IDS", "5000"))
+# Read-through features_cache for /predict_cycles (needs INSERT on features_cache)
+FEATURES_CACHE = os.getenv("FEATURES_CACHE", "1").strip().lower() not in ("0", "false", "no", "off")
+
+# /peer_stats: per-asof peer index lifetime, largest request
+PEER_INDEX_TTL_SEC = float(os.getenv("PEER_INDEX_TTL_SEC", "60"))
+PEER_STATS_MAX_ITEMS = int(os.getenv("PEER_STATS_MAX_ITEMS", "5000"))
+
+_DEFAULT_PATHS = SimpleNamespace(
+    version=None,
+    days=MODEL_PATH_DAYS,
+    yield_=MODEL_PATH_YIELD,
+    preproc=PREPROC_PATH,
+    meta=FEATURE_META_PATH,
+)
+
 _ARTIFACTS: Optional[SimpleNamespace] = None
 _SIG: Optional[str] = None
+_LOAD_LOCK = threading.Lock()
+_READY = threading.Event()
+_PRELOAD_ERROR: Optional[str] = None
+_PINNED = False  # pre-fork workers: the parent owns reloads, never re-check per request
 
 REQUIRED_TEMP_KEYS = [
     "気温_平均",
@@ -46,6 +134,8 @@ REQUIRED_TEMP_KEYS = [
     "気温振れ幅_std",
 ]
 REQUIRED_OTHER_KEYS = ["営業調整日数"]
+REQUIRED_KEYS = frozenset(REQUIRED_TEMP_KEYS + REQUIRED_OTHER_KEYS)
+_ABSENT = object()  # dict.get default for required keys; float(_ABSENT) raises TypeError
 
 
 def _mtime(path: Optional[str]) -> str:
@@ -57,12 +147,12 @@ def _mtime(path: Optional[str]) -> str:
         return "NA"
 
 
-def _signature() -> str:
+def _signature(paths: SimpleNamespace = _DEFAULT_PATHS) -> str:
     parts = [
-        f"DAYS:{MODEL_PATH_DAYS or '-'}:{_mtime(MODEL_PATH_DAYS)}",
-        f"YIELD:{MODEL_PATH_YIELD or '-'}:{_mtime(MODEL_PATH_YIELD)}",
-        f"PREP:{PREPROC_PATH or '-'}:{_mtime(PREPROC_PATH)}",
-        f"META:{FEATURE_META_PATH or '-'}:{_mtime(FEATURE_META_PATH)}",
+        f"DAYS:{paths.days or '-'}:{_mtime(paths.days)}",
+        f"YIELD:{paths.yield_ or '-'}:{_mtime(paths.yield_)}",
+        f"PREP:{paths.preproc or '-'}:{_mtime(paths.preproc)}",
+        f"META:{paths.meta or '-'}:{_mtime(paths.meta)}",
     ]
     return "|".join(parts)
 
@@ -81,17 +171,17 @@ def _load_json(path: str) -> Any:
         return json.load(fh)
 
 
-def _load_feature_order_from_meta() -> Optional[List[str]]:
-    if not FEATURE_META_PATH or not os.path.isfile(FEATURE_META_PATH):
+def _load_feature_order_from_meta(path: Optional[str] = FEATURE_META_PATH) -> Optional[List[str]]:
+    if not path or not os.path.isfile(path):
         return None
     try:
-        meta = _load_json(FEATURE_META_PATH)
+        meta = _load_json(path)
         for key in ("feature_order", "feature_names", "columns", "feature_cols"):
             arr = _safe_list(meta.get(key))
             if arr and all(isinstance(s, str) for s in arr):
                 return arr
     except Exception:
-        log.exception("Failed to load FEATURE_META_PATH=%s", FEATURE_META_PATH)
+        log.exception("Failed to load FEATURE_META_PATH=%s", path)
     return None
 
 
@@ -112,55 +202,251 @@ def _infer_feature_order_from_model(model: Any) -> Optional[List[str]]:
     return None
 
 
-def get_model_and_artifacts() -> SimpleNamespace:
-    global _ARTIFACTS, _SIG
+def _timed_load(path: str):
+    started = time.perf_counter()
+    obj = joblib.load(path)
+    return obj, time.perf_counter() - started
 
-    sig = _signature()
-    if _ARTIFACTS is not None and sig == _SIG:
-        return _ARTIFACTS
 
-    if not MODEL_PATH_DAYS or not MODEL_PATH_YIELD:
+def _load_artifacts(sig: str, paths: SimpleNamespace = _DEFAULT_PATHS) -> SimpleNamespace:
+    if not paths.days or not paths.yield_:
         raise RuntimeError("MODEL_PATH_DAYS and MODEL_PATH_YIELD must be set")
 
-    model_days = joblib.load(MODEL_PATH_DAYS)
-    log.info("[MODEL:days] loaded from %s", MODEL_PATH_DAYS)
+    # The three pickles are independent: load them concurrently (joblib/zlib
+    # release the GIL for file I/O and decompression).
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=3, thread_name_prefix="load") as ex:
+        days_f = ex.submit(_timed_load, paths.days)
+        yield_f = ex.submit(_timed_load, paths.yield_)
+        preproc_f = ex.submit(_timed_load, paths.preproc) if paths.preproc and os.path.isfile(paths.preproc) else None
 
-    model_yield = joblib.load(MODEL_PATH_YIELD)
-    log.info("[MODEL:yield] loaded from %s", MODEL_PATH_YIELD)
+        model_days, secs = days_f.result()
+        log.info("[MODEL:days] loaded from %s in %.3fs", paths.days, secs)
 
-    preproc = None
-    if PREPROC_PATH and os.path.isfile(PREPROC_PATH):
-        try:
-            preproc = joblib.load(PREPROC_PATH)
-            log.info("[PREPROC] loaded from %s", PREPROC_PATH)
-        except Exception as exc:
-            log.warning("[PREPROC] failed to load from %s: %s", PREPROC_PATH, exc)
+        model_yield, secs = yield_f.result()
+        log.info("[MODEL:yield] loaded from %s in %.3fs", paths.yield_, secs)
+
+        preproc = None
+        if preproc_f is not None:
+            try:
+                preproc, secs = preproc_f.result()
+                log.info("[PREPROC] loaded from %s in %.3fs", paths.preproc, secs)
+            except Exception as exc:
+                log.warning("[PREPROC] failed to load from %s: %s", paths.preproc, exc)
+    log.info("[LOAD] artifacts loaded in %.3fs", time.perf_counter() - started)
 
     order = (
-        _load_feature_order_from_meta()
+        _load_feature_order_from_meta(paths.meta)
         or feature_shim._expected_columns_from_preproc(preproc)
         or _infer_feature_order_from_model(model_days)
         or _infer_feature_order_from_model(model_yield)
     )
 
     src = (
-        "meta" if order and FEATURE_META_PATH else
+        "meta" if order and paths.meta else
         "preproc" if order and preproc is not None else
         "model" if order else
         "none"
     )
     log.info("[FEATURES] order size=%s (source=%s)", len(order) if order else None, src)
 
-    _ARTIFACTS = SimpleNamespace(
+    layout = _build_layout(order, preproc)
+    plan = None
+    if preproc is not None and layout.columns and PREPROC_PLAN not in ("0", "off", "false", "no"):
+        plan = preproc_plan.compile_plan(
+            preproc,
+            layout.columns,
+            functools.partial(_sklearn_preproc, preproc, layout.columns),
+            dtype=MATRIX_DTYPE,
+        )
+
+    return SimpleNamespace(
         model_days=model_days,
         model_yield=model_yield,
-        model_path_days=MODEL_PATH_DAYS,
-        model_path_yield=MODEL_PATH_YIELD,
+        model_path_days=paths.days,
+        model_path_yield=paths.yield_,
         preproc=preproc,
         feature_order=order,
+        layout=layout,
+        preproc_plan=plan,
+        signature=sig,
+        model_version=paths.version,
+        engine_days=None,
+        engine_yield=None,
     )
-    _SIG = sig
-    return _ARTIFACTS
+
+
+def _warmup(art: SimpleNamespace) -> None:
+    """Score a batch of all-zero rows so a broken artifact is rejected before it
+    is served and first-call allocation costs are paid up front."""
+    layout = _layout(art)
+    if TREE_ENGINE != "off":
+        # compiled here rather than at load: the parity check calls the native
+        # predict, which a pre-fork parent must not do
+        art.engine_days = tree_engine.compile_model(art.model_days)
+        art.engine_yield = tree_engine.compile_model(art.model_yield)
+    n = max(1, WARMUP_ROWS)
+    X = np.zeros((n, len(layout.columns)), dtype=MATRIX_DTYPE)
+    started = time.perf_counter()
+    token = metrics.ENDPOINT.set("warmup")
+    try:
+        days, yields = _score_both(art, X)
+    finally:
+        metrics.ENDPOINT.reset(token)
+    if len(days) != n or len(yields) != n:
+        raise RuntimeError(f"warm-up returned {len(days)}/{len(yields)} predictions for {n} rows")
+    log.info("[WARMUP] %d rows scored in %.3fs", n, time.perf_counter() - started)
+
+
+def _publish(art: SimpleNamespace) -> None:
+    global _ARTIFACTS, _SIG
+    _ARTIFACTS = art  # single reference assignment: readers see old or new, never a mix
+    _SIG = art.signature
+    _READY.set()
+
+
+def get_model_and_artifacts() -> SimpleNamespace:
+    art = _ARTIFACTS
+    if art is not None and (_PINNED or (_WATCHER is not None and _WATCHER.running)):
+        # the watcher (or the pre-fork parent) keeps the snapshot current; no stat() here
+        return art
+
+    sig = _signature()
+    if art is not None and sig == _SIG:
+        return art
+    with _LOAD_LOCK:
+        if _ARTIFACTS is not None and _SIG == sig:
+            return _ARTIFACTS
+        art = _load_artifacts(sig)
+        _publish(art)
+    if _WATCHER is not None:
+        _WATCHER.mark_loaded(sig)
+    return art
+
+
+def _load_version(version: str, directory: str) -> SimpleNamespace:
+    def _opt(name: str) -> Optional[str]:
+        path = os.path.join(directory, name)
+        return path if os.path.isfile(path) else None
+
+    paths = SimpleNamespace(
+        version=version,
+        days=os.path.join(directory, "model_days.pkl"),
+        yield_=os.path.join(directory, "model_yield.pkl"),
+        preproc=_opt("preproc.pkl"),
+        meta=_opt("feature_meta.json"),
+    )
+    art = _load_artifacts(_signature(paths), paths)
+    _warmup(art)
+    return art
+
+
+_REGISTRY: Optional[ModelRegistry] = (
+    ModelRegistry(MODEL_BASE, MODEL_NAME, _load_version, max_resident=MODEL_MAX_RESIDENT)
+    if MODEL_BASE else None
+)
+
+
+def _score_shadow(art: SimpleNamespace, columns: List[str], X: np.ndarray):
+    """Score the primary request matrix with the shadow snapshot."""
+    metrics.ENDPOINT.set("shadow")  # runs on the dedicated shadow thread
+    layout = _layout(art)
+    if list(columns) != list(layout.columns):
+        pos = {c: j for j, c in enumerate(columns)}
+        missing = [c for c in layout.columns if c not in pos]
+        if missing:
+            raise ValueError(f"shadow model needs features the primary does not provide: {missing[:5]}")
+        X = X[:, [pos[c] for c in layout.columns]]
+    return _score_both(art, X)
+
+
+def _make_shadow() -> Optional[ShadowScorer]:
+    if not SHADOW_MODEL_VERSION:
+        return None
+    if not MODEL_BASE:
+        log.warning("[SHADOW] SHADOW_MODEL_VERSION=%s ignored: MODEL_BASE is not set", SHADOW_MODEL_VERSION)
+        return None
+    directory = os.path.join(MODEL_BASE, MODEL_NAME, SHADOW_MODEL_VERSION)
+    return ShadowScorer(
+        name=f"{MODEL_NAME}/{SHADOW_MODEL_VERSION}",
+        # own reference, outside the registry LRU, so A/B traffic cannot evict it
+        load=functools.partial(_load_version, SHADOW_MODEL_VERSION, directory),
+        score=_score_shadow,
+        sample_rate=SHADOW_SAMPLE_RATE,
+        max_pending=SHADOW_MAX_PENDING,
+    )
+
+
+_SHADOW: Optional[ShadowScorer] = _make_shadow()
+
+
+def _artifacts_for(version: Optional[str]) -> SimpleNamespace:
+    """Default artifacts, or the requested registry version."""
+    if not version:
+        return get_model_and_artifacts()
+    if _REGISTRY is None:
+        raise ValueError("model versions are not configured on this server (MODEL_BASE)")
+    return _REGISTRY.get(version)
+
+
+def load_for_prefork() -> SimpleNamespace:
+    """Load and pin the artifacts in a pre-fork parent, without warm-up.
+
+    Predicting here would start OpenMP's thread pool, which does not survive
+    fork(); each worker warms the inherited snapshot in :func:`preload_artifacts`.
+    """
+    global _ARTIFACTS, _SIG, _PINNED
+    sig = _signature()
+    art = _load_artifacts(sig)
+    _ARTIFACTS, _SIG, _PINNED = art, sig, True
+    return art
+
+
+def preload_artifacts() -> None:
+    """Load, warm up and publish the artifacts, then start the watcher.
+
+    Runs on a background thread from startup so the server already answers
+    ``/api/health`` (not ready) meanwhile; requests that arrive early wait on
+    the load lock instead of loading a second copy.
+    """
+    global _PRELOAD_ERROR
+    started = time.perf_counter()
+    try:
+        with _LOAD_LOCK:
+            if _ARTIFACTS is None:
+                sig = _signature()
+                art = _load_artifacts(sig)
+                _warmup(art)
+                _publish(art)
+                if _WATCHER is not None:
+                    _WATCHER.mark_loaded(sig)
+            elif not _READY.is_set():
+                # inherited from a pre-fork parent: only the warm-up is left
+                _warmup(_ARTIFACTS)
+                _READY.set()
+        log.info("[PRELOAD] ready in %.3fs", time.perf_counter() - started)
+    except Exception as exc:
+        _PRELOAD_ERROR = f"{type(exc).__name__}: {exc}"
+        log.exception("[PRELOAD] failed after %.3fs", time.perf_counter() - started)
+    finally:
+        start_artifact_watcher()
+
+
+def start_background_preload() -> None:
+    if not STARTUP_PRELOAD:
+        start_artifact_watcher()
+        return
+    threading.Thread(target=preload_artifacts, name="artifact-preload", daemon=True).start()
+
+
+def start_artifact_watcher() -> None:
+    if _WATCHER is not None:
+        _WATCHER.start()
+
+
+def stop_artifact_watcher() -> None:
+    if _WATCHER is not None:
+        _WATCHER.stop()
 
 
 def _new_rid() -> str:
@@ -178,23 +464,53 @@ def _ensure_rid(request: Request) -> str:
     return rid
 
 
-def _resolve_feature_order(art: SimpleNamespace) -> List[str]:
-    if art.feature_order:
-        return list(art.feature_order)
-    names = getattr(art.preproc, "feature_names_in_", None)
-    order = _safe_list(names)
-    if order:
-        return order
-    raise RuntimeError("feature_order is empty")
+def _build_layout(feature_order: Optional[List[str]], preproc) -> SimpleNamespace:
+    """Column layout resolved once per artifact load (not per request)."""
+    columns = list(feature_order) if feature_order else _safe_list(getattr(preproc, "feature_names_in_", None))
+    if not columns:
+        return SimpleNamespace(
+            columns=None, index=None, fill=None, nan_check=None, required=None, error="feature_order is empty"
+        )
+    missing = [key for key in REQUIRED_TEMP_KEYS + REQUIRED_OTHER_KEYS if key not in columns]
+    required = np.array([col in REQUIRED_KEYS for col in columns], dtype=bool)
+    return SimpleNamespace(
+        columns=columns,
+        index={col: i for i, col in enumerate(columns)},
+        # dict.get default per column: an absent required key fails the fast path
+        fill=tuple(_ABSENT if col in REQUIRED_KEYS else MISSING_FILL for col in columns),
+        # explicit nulls come out of np.fromiter as NaN; where NaN is not already
+        # the fill value they have to be resolved by _matrix_errors
+        nan_check=np.flatnonzero(required) if np.isnan(MISSING_FILL) else slice(None),
+        required=np.flatnonzero(required),
+        error=f"feature_order missing required keys: {missing}" if missing else None,
+    )
+
+
+def _layout(art: SimpleNamespace) -> SimpleNamespace:
+    layout = art.layout
+    if layout.error:
+        raise RuntimeError(layout.error)
+    return layout
 
 
-def _apply_preproc(X: List[List[float]], feature_order: List[str], preproc):
-    if preproc is None:
-        return np.asarray(X, dtype=float)
-    if pd is None:
-        raise RuntimeError("pandas is required when a preprocessor is configured")
-    df = pd.DataFrame(X, columns=feature_order)
-    return preproc.transform(df)
+def _sklearn_preproc(preproc, feature_order: List[str], X: np.ndarray):
+    try:  # only the fallback path needs pandas
+        import pandas as pd
+    except Exception as exc:  # pragma: no cover - optional dependency
+        raise RuntimeError("pandas is required when a preprocessor is configured") from exc
+    return preproc.transform(pd.DataFrame(X, columns=feature_order))
+
+
+def _apply_preproc(art: SimpleNamespace, X: np.ndarray):
+    if art.preproc is None:
+        return X
+    started = time.perf_counter()
+    if art.preproc_plan is not None:
+        Xt = art.preproc_plan.transform(X)
+    else:
+        Xt = _sklearn_preproc(art.preproc, art.layout.columns, X)
+    metrics.observe_stage("preproc", started)
+    return Xt
 
 
 def _parse_payload(body: Any) -> List[Dict[str, Any]]:
@@ -223,45 +539,368 @@ def _parse_payload(body: Any) -> List[Dict[str, Any]]:
     return items
 
 
-def _assert_required_in_feature_order(feature_order: List[str]) -> None:
-    missing = [
-        key for key in REQUIRED_TEMP_KEYS + REQUIRED_OTHER_KEYS if key not in feature_order
-    ]
-    if missing:
-        raise RuntimeError(f"feature_order missing required keys: {missing}")
+def _matrix_from_items(items: List[Dict[str, Any]], layout: SimpleNamespace, offset: int = 0) -> np.ndarray:
+    columns, fill = layout.columns, layout.fill
+    n, k = len(items), len(columns)
+    cells = itertools.chain.from_iterable(map(feats.get, columns, fill) for feats in items)
+    try:
+        X = np.fromiter(cells, dtype=MATRIX_DTYPE, count=n * k).reshape(n, k)
+    except (TypeError, ValueError):
+        # missing required keys or non-numeric cells
+        return _matrix_errors(items, layout, offset)
+    if np.isnan(X[:, layout.nan_check]).any():
+        return _matrix_errors(items, layout, offset)
+    return X
 
 
-def _matrix_from_items(items: List[Dict[str, Any]], feature_order: List[str]) -> List[List[float]]:
-    required = set(REQUIRED_TEMP_KEYS + REQUIRED_OTHER_KEYS)
-    matrix: List[List[float]] = []
-    for idx, feats in enumerate(items):
-        row: List[float] = []
-        for col in feature_order:
+def _matrix_errors(items: List[Dict[str, Any]], layout: SimpleNamespace, offset: int = 0) -> np.ndarray:
+    """Cell-by-cell slow path: reports the first bad cell in row-major order."""
+    X = np.empty((len(items), len(layout.columns)), dtype=MATRIX_DTYPE)
+    for idx, feats in enumerate(items, offset):
+        for j, col in enumerate(layout.columns):
             value = feats.get(col, None)
             if value is None:
-                if col in required:
+                if col in REQUIRED_KEYS:
                     raise ValueError(f"data[{idx}].features missing required key '{col}'")
-                row.append(0.0)
+                X[idx - offset, j] = MISSING_FILL
                 continue
             try:
-                row.append(float(value))
+                X[idx - offset, j] = float(value)
             except (TypeError, ValueError):
                 raise ValueError(f"data[{idx}].features['{col}'] must be numeric")
-        matrix.append(row)
-    return matrix
+    return X
+
+
+def _matrix_from_columnar(columns: List[str], rows: codec.Rows, layout: SimpleNamespace, offset: int = 0) -> np.ndarray:
+    """Columnar payload -> matrix in feature order. null/NaN cells count as missing."""
+    given = set(columns)
+    for col in layout.columns:
+        if col in REQUIRED_KEYS and col not in given:
+            raise ValueError(f"columns missing required key '{col}'")
+
+    try:
+        R = np.asarray(rows, dtype=np.float64)
+    except (TypeError, ValueError):
+        R = None
+    if R is None or R.ndim != 2 or R.shape[1] != len(columns):
+        _columnar_errors(columns, rows, offset)
+
+    src = [j for j, col in enumerate(columns) if col in layout.index]
+    dst = [layout.index[columns[j]] for j in src]
+    X = np.full((len(R), len(layout.columns)), MISSING_FILL, dtype=MATRIX_DTYPE)
+    X[:, dst] = R[:, src]
+
+    missing = np.isnan(X)
+    if missing.any():
+        bad = missing[:, layout.required]
+        if bad.any():
+            idx, j = np.argwhere(bad)[0]
+            raise ValueError(f"rows[{idx + offset}] missing required key '{layout.columns[layout.required[j]]}'")
+        X[missing] = MISSING_FILL
+    return X
+
+
+def _columnar_errors(columns: List[str], rows: codec.Rows, offset: int = 0) -> None:
+    for idx, row in enumerate(rows, offset):
+        if not isinstance(row, (list, tuple)) or len(row) != len(columns):
+            raise ValueError(f"rows[{idx}] must be a list of {len(columns)} values")
+        for col, value in zip(columns, row):
+            if value is None:
+                continue
+            try:
+                float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"rows[{idx}]['{col}'] must be numeric")
+    raise ValueError("rows must be numeric")
+
+
+def _prepare_matrix(raw: bytes, content_type: Optional[str], version: Optional[str] = None):
+    """Decode + validate a request body. Returns (artifacts, X, columnar)."""
+    started = time.perf_counter()
+    body = codec.decode_body(raw, content_type)
+    metrics.observe_stage("decode", started)
+    if codec.is_columnar(body):
+        columns, rows = codec.parse_columnar(body)
+        art = _artifacts_for(version)
+        started = time.perf_counter()
+        X = _matrix_from_columnar(columns, rows, _layout(art))
+        metrics.observe_stage("matrix", started)
+        return art, X, True
+    features = _parse_payload(body)
+    art = _artifacts_for(version)
+    started = time.perf_counter()
+    X = _matrix_from_items(features, _layout(art))
+    metrics.observe_stage("matrix", started)
+    return art, X, False
+
+
+def _predict_timed(model: Any, engine: Optional[tree_engine.FlatForest], Xt: Any, stage: str) -> np.ndarray:
+    started = time.perf_counter()
+    if engine is not None and Xt.shape[0] <= TREE_ENGINE_MAX_ROWS:
+        # small batches: framework overhead dominates the native predict
+        out = engine.predict(Xt)
+    else:
+        out = model.predict(Xt)
+    metrics.observe_stage(stage, started)
+    return out
+
+
+def _score_both(art: SimpleNamespace, X: np.ndarray):
+    Xt = _apply_preproc(art, X)
+    return (
+        _predict_timed(art.model_days, art.engine_days, Xt, "predict_days"),
+        _predict_timed(art.model_yield, art.engine_yield, Xt, "predict_yield"),
+    )
+
+
+def _score_days(art: SimpleNamespace, X: np.ndarray):
+    Xt = _apply_preproc(art, X)
+    return (_predict_timed(art.model_days, art.engine_days, Xt, "predict_days"),)
+
+
+def _predict_days_sync(raw: bytes, content_type: Optional[str], version: Optional[str] = None):
+    art, X, columnar = _prepare_matrix(raw, content_type, version)
+    return (art, columnar, *_score_days(art, X))
+
+
+def _predict_both_sync(raw: bytes, content_type: Optional[str], version: Optional[str] = None):
+    art, X, columnar = _prepare_matrix(raw, content_type, version)
+    return (art, X, columnar, *_score_both(art, X))
+
+
+def _stream_items(lines: List[bytes], offset: int):
+    items: List[Dict[str, Any]] = []
+    ids: List[Any] = []
+    for idx, line in enumerate(lines, offset):
+        try:
+            entry = codec.json_loads(line)
+        except Exception:
+            raise ValueError(f"data[{idx}] is not valid JSON")
+        if not isinstance(entry, dict) or not isinstance(entry.get("features"), dict):
+            raise ValueError(f"data[{idx}] must be an object with 'features'")
+        items.append(entry["features"])
+        ids.append(entry.get("id"))
+    return items, ids
+
+
+def _stream_rows(lines: List[bytes], offset: int) -> List[Any]:
+    rows = []
+    for idx, line in enumerate(lines, offset):
+        try:
+            rows.append(codec.json_loads(line))
+        except Exception:
+            raise ValueError(f"rows[{idx}] is not valid JSON")
+    return rows
+
+
+def _score_stream_chunk(art: SimpleNamespace, lines: List[bytes], offset: int, columns: Optional[List[str]]) -> bytes:
+    """Decode, score and encode one chunk of a /predict_stream body (runs on the pool)."""
+    layout = _layout(art)
+    started = time.perf_counter()
+    if columns is None:
+        items, ids = _stream_items(lines, offset)
+    else:
+        rows = _stream_rows(lines, offset)
+    metrics.observe_stage("decode", started)
+
+    started = time.perf_counter()
+    if columns is None:
+        X = _matrix_from_items(items, layout, offset)
+    else:
+        X = _matrix_from_columnar(columns, rows, layout, offset)
+    metrics.observe_stage("matrix", started)
+
+    days_raw, yields = _score_both(art, X)
+    started = time.perf_counter()
+    days = np.rint(days_raw).astype(np.int64)
+    yields = np.asarray(yields, dtype=np.float64)
+    if columns is not None:
+        # one line per chunk with parallel arrays, like the columnar /predict_both response
+        out = codec.json_dumps({"offset": offset, "days": days, "yield": yields}) + b"\n"
+    else:
+        out = b"".join(
+            codec.json_dumps({"days": d, "yield": y} if i is None else {"id": i, "days": d, "yield": y}) + b"\n"
+            for i, d, y in zip(ids, days.tolist(), yields.tolist())
+        )
+    metrics.observe_stage("encode", started)
+    return out
+
+
+_WATCHER: Optional[ArtifactWatcher] = (
+    ArtifactWatcher(
+        signature=_signature,
+        load=_load_artifacts,
+        warmup=_warmup,
+        publish=_publish,
+        lock=_LOAD_LOCK,
+        interval_sec=ARTIFACT_POLL_SEC,
+    )
+    if ARTIFACT_POLL_SEC > 0 else None
+)
+
+
+def _prepare_keyed(raw: bytes, content_type: Optional[str], kind: str, version: Optional[str] = None):
+    art, X, columnar = _prepare_matrix(raw, content_type, version)
+    started = time.perf_counter()
+    keys = _CACHE.keys(art.signature, kind, X)
+    metrics.observe_stage("cache_keys", started)
+    return art, X, columnar, keys
+
+
+_POOL = InferencePool(workers=INFER_WORKERS, max_queue=INFER_MAX_QUEUE)
+
+_CACHE: Optional[PredictionCache] = (
+    PredictionCache(max_entries=PRED_CACHE_SIZE, ttl_sec=PRED_CACHE_TTL_SEC)
+    if PRED_CACHE_SIZE > 0 else None
+)
+
+_BATCHER: Optional[MicroBatcher] = (
+    MicroBatcher(
+        _score_both,
+        max_wait_ms=BATCH_MAX_WAIT_MS,
+        max_rows=BATCH_MAX_ROWS,
+        runner=functools.partial(_POOL.run, shed=False),
+        on_batch=lambda requests, rows: (metrics.BATCH_REQUESTS.observe(requests), metrics.BATCH_ROWS.observe(rows)),
+    )
+    if BATCH_ENABLED else None
+)
+
+
+async def _score_both_async(art: SimpleNamespace, X: np.ndarray):
+    if _BATCHER is not None:
+        return await _BATCHER.submit(art, X)
+    return await _POOL.run(_score_both, art, X, shed=False)
+
+
+async def _score_days_async(art: SimpleNamespace, X: np.ndarray):
+    return await _POOL.run(_score_days, art, X, shed=False)
+
+
+async def _cached(art: SimpleNamespace, X: np.ndarray, keys: List[bytes], score):
+    """Serve cached rows and score only the misses; returns one array per output."""
+    values = await _CACHE.resolve(keys, lambda idx: score(art, X[idx]))
+    return tuple(np.array(values, dtype=np.float64).T)
+
+
+_DB = DBPool(
+    host=FORECAST_DB_HOST,
+    user=FORECAST_DB_USER,
+    password=FORECAST_DB_PASS,
+    db=FORECAST_DB_NAME,
+    port=FORECAST_DB_PORT,
+    charset=FORECAST_DB_CHARSET,
+    minsize=DB_POOL_MIN,
+    maxsize=DB_POOL_MAX,
+)
+_WEATHER = cycle_features.WeatherStore()
+_PEERS = cycle_features.PeerStore(PEER_INDEX_TTL_SEC)
+_FEATURES_CACHE = (
+    FeaturesCache(cycle_features.FEATURE_SPEC, cycle_features.FEATURE_COLUMNS) if FEATURES_CACHE else None
+)
+
+
+async def close_db() -> None:
+    await _DB.close()
+
+
+def shutdown_workers() -> None:
+    _POOL.shutdown()
+    if _SHADOW is not None:
+        _SHADOW.shutdown()
+
+
+def _requested_version(request: Request) -> Optional[str]:
+    version = request.headers.get(MODEL_VERSION_HEADER) or request.query_params.get(MODEL_VERSION_PARAM)
+    if not version:
+        return None
+    return version.strip() or None
+
+
+def _respond(request: Request, content: Dict[str, Any], art: Optional[SimpleNamespace] = None) -> Response:
+    headers = None
+    if art is not None and art.model_version:
+        headers = {MODEL_VERSION_HEADER: art.model_version}
+    # Returning a Response skips FastAPI's jsonable_encoder pass over the payload
+    if codec.wants_msgpack(request.headers.get("accept")):
+        return Response(content=codec.pack_msgpack(content), media_type="application/msgpack", headers=headers)
+    return codec.FastJSONResponse(content, headers=headers)
+
+
+def _busy(exc: PoolBusy) -> HTTPException:
+    log.warning("request shed: %s", exc)
+    return HTTPException(
+        status_code=INFER_BUSY_STATUS,
+        detail={"code": INFER_BUSY_STATUS, "message": "server busy, retry later"},
+        headers={"Retry-After": "1"},
+    )
+
+
+def _collect_metrics():
+    """Scrape-time counters/gauges from the pool, cache, watcher, registry and shadow."""
+    pool = _POOL.stats()
+    yield "xgbapi_inference_inflight", "gauge", "Scoring jobs running or queued.", [({}, pool["inflight"])]
+    yield "xgbapi_inference_rejected_total", "counter", "Requests shed because the queue was full.", [({}, pool["rejected"])]
+    yield "xgbapi_artifacts_ready", "gauge", "1 once artifacts are loaded and warmed up.", [({}, int(_READY.is_set()))]
+    if _CACHE is not None:
+        c = _CACHE.stats()
+        yield "xgbapi_pred_cache_lookups_total", "counter", "Prediction cache lookups by result.", [
+            ({"result": r}, c[r]) for r in ("hits", "misses", "shared")
+        ]
+        yield "xgbapi_pred_cache_evictions_total", "counter", "Entries evicted (LRU) or expired (TTL).", [
+            ({"reason": "lru"}, c["evictions"]), ({"reason": "ttl"}, c["expired"]),
+        ]
+        yield "xgbapi_pred_cache_entries", "gauge", "Entries in the prediction cache.", [({}, c["size"])]
+    if _WATCHER is not None:
+        w = _WATCHER.stats()
+        yield "xgbapi_artifact_reloads_total", "counter", "Artifact hot-swaps by result.", [
+            ({"result": "ok"}, w["reloads"]), ({"result": "failed"}, w["failures"]),
+        ]
+    if _REGISTRY is not None:
+        r = _REGISTRY.stats()
+        yield "xgbapi_model_registry_loads_total", "counter", "Model versions loaded.", [({}, r["loads"])]
+        yield "xgbapi_model_registry_evictions_total", "counter", "Model versions evicted.", [({}, r["evictions"])]
+        yield "xgbapi_model_registry_resident", "gauge", "Model versions in memory.", [({}, len(r["resident"]))]
+    if _SHADOW is not None:
+        sh = _SHADOW.stats()
+        yield "xgbapi_shadow_batches_total", "counter", "Shadow batches by result.", [
+            ({"result": "scored"}, sh["batches"]), ({"result": "dropped"}, sh["dropped"]), ({"result": "error"}, sh["errors"]),
+        ]
+        yield "xgbapi_shadow_mae", "gauge", "Running MAE between shadow and primary.", [
+            ({"output": k}, d["mae"]) for k, d in sh["deltas"].items() if d["mae"] is not None
+        ]
+
+
+metrics.REGISTRY.add_collector(_collect_metrics)
 
 
 def _health_payload(request: Request) -> Dict[str, Any]:
     rid = _ensure_rid(request)
+    if STARTUP_PRELOAD and not _READY.is_set():
+        message = f"preload_failed: {_PRELOAD_ERROR}" if _PRELOAD_ERROR else "warming_up"
+        return {"ok": False, "ready": False, "error": {"code": 503, "message": message}, "request_id": rid}
     try:
         art = get_model_and_artifacts()
         size = len(art.feature_order) if art.feature_order else None
         return {
             "ok": bool(art.model_days is not None and art.model_yield is not None),
+            "ready": True,
             "model_path_days": art.model_path_days,
             "model_path_yield": art.model_path_yield,
             "request_id": rid,
             "feature_order_size": size,
+            "artifact_watcher": _WATCHER.stats() if _WATCHER is not None else None,
+            "tree_engine": {
+                "days": art.engine_days.kind if art.engine_days is not None else None,
+                "yield": art.engine_yield.kind if art.engine_yield is not None else None,
+                "max_rows": TREE_ENGINE_MAX_ROWS,
+            },
+            "preproc_plan": art.preproc_plan.summary if art.preproc_plan is not None else None,
+            "db": {
+                **_DB.stats(),
+                "weather": _WEATHER.stats(),
+                "peers": _PEERS.stats(),
+                "features_cache": _FEATURES_CACHE.stats() if _FEATURES_CACHE is not None else None,
+            } if _DB.configured else None,
         }
     except Exception:
         log.exception("health check failed (rid=%s)", rid)
@@ -277,34 +916,57 @@ async def feature_meta():
 
 @router.get("/health")
 async def health(request: Request):
-    return _health_payload(request)
+    payload = _health_payload(request)
+    if payload.get("ready") is False:
+        return codec.FastJSONResponse(payload, status_code=503)
+    return payload
+
+
+@router.get("/models")
+async def models():
+    if _REGISTRY is None:
+        return {"ok": True, "enabled": False, "versions": []}
+    versions = await _POOL.run(_REGISTRY.describe, shed=False)
+    return {"ok": True, "enabled": True, "stats": _REGISTRY.stats(), "versions": versions}
+
+
+@router.get("/shadow_stats")
+async def shadow_stats():
+    return {"ok": True, "enabled": _SHADOW is not None, "stats": _SHADOW.stats() if _SHADOW is not None else None}
+
+
+@router.get("/cache_stats")
+async def cache_stats():
+    return {"ok": True, "enabled": _CACHE is not None, "stats": _CACHE.stats() if _CACHE is not None else None}
 
 
 @router.post("/predict")
 async def predict(request: Request):
     rid = _ensure_rid(request)
     log.info("/predict called (rid=%s)", rid)
+    metrics.ENDPOINT.set("/api/predict")
 
+    raw = await request.body()
+    version = _requested_version(request)
     try:
-        body = await request.json()
-    except Exception:
-        raise HTTPException(status_code=400, detail={"code": 200, "message": "Invalid JSON payload"})
-
-    try:
-        features = _parse_payload(body)
-        art = get_model_and_artifacts()
-        feature_order = _resolve_feature_order(art)
-        _assert_required_in_feature_order(feature_order)
-        X = _matrix_from_items(features, feature_order)
-        Xt = _apply_preproc(X, feature_order, art.preproc)
-        days = np.rint(art.model_days.predict(Xt)).astype(int)
-        predictions = [int(d) for d in days]
-        return {
+        content_type = request.headers.get("content-type")
+        if _CACHE is None:
+            art, _, days_raw = await _POOL.run(_predict_days_sync, raw, content_type, version)
+        else:
+            art, X, _, keys = await _POOL.run(_prepare_keyed, raw, content_type, "days", version)
+            (days_raw,) = await _cached(art, X, keys, _score_days_async)
+        predictions = np.rint(days_raw).astype(np.int64)
+        metrics.REQUEST_ROWS.observe(len(predictions), "/api/predict")
+        return _respond(request, {
             "ok": True,
             "model_path": art.model_path_days,
             "request_id": rid,
             "predictions": predictions,
-        }
+        }, art)
+    except codec.UnsupportedMediaType as exc:
+        raise HTTPException(status_code=415, detail={"code": 200, "message": str(exc)})
+    except PoolBusy as exc:
+        raise _busy(exc)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail={"code": 200, "message": str(exc)})
     except RuntimeError as exc:
@@ -318,35 +980,340 @@ async def predict(request: Request):
 async def predict_both(request: Request):
     rid = _ensure_rid(request)
     log.info("/predict_both called (rid=%s)", rid)
+    metrics.ENDPOINT.set("/api/predict_both")
 
+    raw = await request.body()
+    content_type = request.headers.get("content-type")
+    version = _requested_version(request)
     try:
-        body = await request.json()
+        if _CACHE is not None:
+            art, X, columnar, keys = await _POOL.run(_prepare_keyed, raw, content_type, "both", version)
+            days_raw, yields = await _cached(art, X, keys, _score_both_async)
+        elif _BATCHER is not None:
+            art, X, columnar = await _POOL.run(_prepare_matrix, raw, content_type, version)
+            days_raw, yields = await _BATCHER.submit(art, X)
+        else:
+            art, X, columnar, days_raw, yields = await _POOL.run(_predict_both_sync, raw, content_type, version)
+        days = np.rint(days_raw).astype(np.int64)
+        yields = np.asarray(yields, dtype=np.float64)
+        metrics.REQUEST_ROWS.observe(len(days), "/api/predict_both")
+        if columnar:
+            # parallel arrays instead of a list of dicts, serialized straight from NumPy
+            predictions: Any = {"days": days, "yield": yields}
+        else:
+            predictions = [
+                {"days": d, "yield": y} for d, y in zip(days.tolist(), yields.tolist())
+            ]
+        response = _respond(request, {
+            "ok": True,
+            "model_path_days": art.model_path_days,
+            "model_path_yield": art.model_path_yield,
+            "request_id": rid,
+            "predictions": predictions,
+        }, art)
+        if _SHADOW is not None and art.model_version != SHADOW_MODEL_VERSION:
+            # enqueue only; scored on the shadow thread after this response
+            _SHADOW.submit(art.layout.columns, X, (days_raw, yields))
+        return response
+    except codec.UnsupportedMediaType as exc:
+        raise HTTPException(status_code=415, detail={"code": 200, "message": str(exc)})
+    except PoolBusy as exc:
+        raise _busy(exc)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail={"code": 200, "message": str(exc)})
+    except RuntimeError as exc:
+        raise HTTPException(status_code=500, detail={"code": 100, "message": str(exc)})
     except Exception:
-        raise HTTPException(status_code=400, detail={"code": 200, "message": "Invalid JSON payload"})
+        log.exception("predict_both failed (rid=%s)", rid)
+        raise HTTPException(status_code=500, detail={"code": 900, "message": "internal error"})
+
 
+async def _stream_predictions(request: Request, art: SimpleNamespace, rid: str):
+    """Read NDJSON lines, score them STREAM_CHUNK_ROWS at a time and yield results.
+
+    The next chunk is read while the previous one is scored, so at most two
+    chunks of rows are held no matter how large the body is. A bad row stops
+    the stream with an error line; ``rows`` there counts the rows already
+    returned.
+    """
+    columns: Optional[List[str]] = None
+    batch: List[bytes] = []
+    pending: Optional[asyncio.Future] = None
+    pending_rows = 0
+    read = emitted = chunks = 0
+    first = True
     try:
-        features = _parse_payload(body)
-        art = get_model_and_artifacts()
-        feature_order = _resolve_feature_order(art)
-        _assert_required_in_feature_order(feature_order)
-        X = _matrix_from_items(features, feature_order)
-        Xt = _apply_preproc(X, feature_order, art.preproc)
-        days = np.rint(art.model_days.predict(Xt)).astype(int)
-        yields = art.model_yield.predict(Xt)
-        predictions = [
-            {"days": int(d), "yield": float(y)} for d, y in zip(days, yields)
-        ]
-        return {
+        async for line in codec.ndjson_lines(request.stream(), STREAM_MAX_LINE_BYTES):
+            if first:
+                first = False
+                try:
+                    header = codec.json_loads(line)
+                except Exception:
+                    header = None
+                if isinstance(header, dict) and "columns" in header and "features" not in header:
+                    columns = codec.parse_columns(header["columns"])
+                    continue
+            batch.append(line)
+            if len(batch) < STREAM_CHUNK_ROWS:
+                continue
+            if pending is not None:
+                yield await pending
+                emitted += pending_rows
+            pending = asyncio.ensure_future(_POOL.run(_score_stream_chunk, art, batch, read, columns, shed=False))
+            pending_rows = len(batch)
+            read += len(batch)
+            chunks += 1
+            batch = []
+
+        if pending is not None:
+            yield await pending
+            emitted += pending_rows
+            pending = None
+        if batch:
+            yield await _POOL.run(_score_stream_chunk, art, batch, read, columns, shed=False)
+            emitted += len(batch)
+            chunks += 1
+        metrics.REQUEST_ROWS.observe(emitted, "/api/predict_stream")
+        log.info("/predict_stream done (rid=%s rows=%d chunks=%d)", rid, emitted, chunks)
+        yield codec.json_dumps({
+            "ok": True,
+            "model_path_days": art.model_path_days,
+            "model_path_yield": art.model_path_yield,
+            "request_id": rid,
+            "rows": emitted,
+        }) + b"\n"
+    except ClientDisconnect:
+        log.warning("/predict_stream client disconnected (rid=%s rows=%d)", rid, emitted)
+    except Exception as exc:
+        if isinstance(exc, ValueError):
+            error = {"code": 200, "message": str(exc)}
+        elif isinstance(exc, RuntimeError):
+            error = {"code": 100, "message": str(exc)}
+        else:
+            log.exception("predict_stream failed (rid=%s)", rid)
+            error = {"code": 900, "message": "internal error"}
+        yield codec.json_dumps({"ok": False, "error": error, "request_id": rid, "rows": emitted}) + b"\n"
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+
+
+@router.post("/predict_stream")
+async def predict_stream(request: Request):
+    rid = _ensure_rid(request)
+    log.info("/predict_stream called (rid=%s)", rid)
+    metrics.ENDPOINT.set("/api/predict_stream")
+
+    mt = codec.media_type(request.headers.get("content-type"))
+    if mt in codec.MSGPACK_TYPES or mt in codec.ARROW_STREAM_TYPES or mt in codec.ARROW_FILE_TYPES:
+        raise HTTPException(status_code=415, detail={"code": 200, "message": "predict_stream accepts NDJSON only"})
+    version = _requested_version(request)
+    try:
+        # admission (load shedding) and version resolution happen once, up front;
+        # the whole stream is scored with this snapshot
+        art = await _POOL.run(_artifacts_for, version)
+        _layout(art)
+    except PoolBusy as exc:
+        raise _busy(exc)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail={"code": 200, "message": str(exc)})
+    except RuntimeError as exc:
+        raise HTTPException(status_code=500, detail={"code": 100, "message": str(exc)})
+    except Exception:
+        log.exception("predict_stream failed (rid=%s)", rid)
+        raise HTTPException(status_code=500, detail={"code": 900, "message": "internal error"})
+
+    headers = {MODEL_VERSION_HEADER: art.model_version} if art.model_version else None
+    return codec.DuplexStreamingResponse(
+        _stream_predictions(request, art, rid), media_type=codec.NDJSON_TYPE, headers=headers
+    )
+
+
+def _parse_cycles_request(body: Any):
+    if not isinstance(body, dict):
+        raise ValueError("JSON root must be an object")
+    ids = body.get("cycle_ids")
+    if not isinstance(ids, list) or not ids:
+        raise ValueError("'cycle_ids' must be a non-empty list")
+    if not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        raise ValueError("'cycle_ids' must be integers")
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > PREDICT_CYCLES_MAX_IDS:
+        raise ValueError(f"at most {PREDICT_CYCLES_MAX_IDS} cycle_ids per request")
+    asof = body.get("asof")
+    if asof is not None:
+        try:
+            asof = date.fromisoformat(str(asof))
+        except ValueError:
+            raise ValueError("'asof' must be a date (YYYY-MM-DD)")
+    return ids, asof, bool(body.get("include_features", False))
+
+
+def _predict_cycles_sync(
+    art: SimpleNamespace,
+    inputs: Optional[cycle_features.CycleInputs],
+    ids: List[int],
+    cached: Dict[int, Dict[str, Any]],
+):
+    """Build feature rows for ``ids`` (unless ``cached``) and score the ones that could be built."""
+    layout = _layout(art)
+    started = time.perf_counter()
+    built: List[int] = []
+    rows: List[Dict[str, Any]] = []
+    errors: List[Dict[str, Any]] = []
+    for cycle_id in ids:
+        row = cached.get(cycle_id)
+        if row is None:
+            try:
+                row = inputs.features(cycle_id)
+            except cycle_features.CycleFeatureError as exc:
+                errors.append({"cycle_id": cycle_id, "message": str(exc)})
+                continue
+        rows.append(row)
+        built.append(cycle_id)
+    metrics.observe_stage("features", started)
+    if not rows:
+        return built, rows, errors, np.empty(0), np.empty(0)
+
+    started = time.perf_counter()
+    X = _matrix_from_items(rows, layout)
+    metrics.observe_stage("matrix", started)
+    return (built, rows, errors, *_score_both(art, X))
+
+
+@router.post("/predict_cycles")
+async def predict_cycles(request: Request):
+    rid = _ensure_rid(request)
+    log.info("/predict_cycles called (rid=%s)", rid)
+    metrics.ENDPOINT.set("/api/predict_cycles")
+
+    raw = await request.body()
+    version = _requested_version(request)
+    try:
+        ids, asof, include_features = _parse_cycles_request(codec.decode_body(raw, request.headers.get("content-type")))
+        art = await _POOL.run(_artifacts_for, version)
+        started = time.perf_counter()
+        cached: Dict[int, Dict[str, Any]] = {}
+        cache_inputs: Optional[str] = None
+        if _FEATURES_CACHE is not None:
+            if asof is None:
+                asof = await cycle_features.fetch_asof(_DB)
+            cached, cache_inputs = await _FEATURES_CACHE.lookup(_DB, ids, asof)
+        todo = [cycle_id for cycle_id in ids if cycle_id not in cached]
+        inputs = await cycle_features.fetch_inputs(_DB, todo, asof, _WEATHER) if todo else None
+        metrics.observe_stage("db", started)
+        built, rows, errors, days_raw, yields = await _POOL.run(
+            _predict_cycles_sync, art, inputs, ids, cached, shed=False
+        )
+        if _FEATURES_CACHE is not None:
+            fresh = {cycle_id: row for cycle_id, row in zip(built, rows) if cycle_id not in cached}
+            await _FEATURES_CACHE.store(_DB, fresh, asof, cache_inputs)
+
+        days = np.rint(days_raw).astype(np.int64).tolist()
+        yields = np.asarray(yields, dtype=np.float64).tolist()
+        predictions = []
+        for i, cycle_id in enumerate(built):
+            item: Dict[str, Any] = {"cycle_id": cycle_id, "days": days[i], "yield": yields[i]}
+            if include_features:
+                item["features"] = {col: rows[i].get(col) for col in art.layout.columns}
+            predictions.append(item)
+        metrics.REQUEST_ROWS.observe(len(predictions), "/api/predict_cycles")
+        memo = inputs.memo.stats() if inputs is not None else {}
+        log.info(
+            "predict_cycles: %d cycles, %d from features_cache, aggregate memo hit rate %.2f (rid=%s)",
+            len(ids), len(cached), memo.get("total", {}).get("hit_rate", 0.0), rid,
+        )
+        return _respond(request, {
             "ok": True,
+            "asof": (inputs.asof if inputs is not None else asof).isoformat(),
             "model_path_days": art.model_path_days,
             "model_path_yield": art.model_path_yield,
             "request_id": rid,
             "predictions": predictions,
-        }
+            "errors": errors,
+            "memo": memo,
+            "features_cache": {"hits": len(cached), "misses": len(todo)},
+        }, art)
+    except codec.UnsupportedMediaType as exc:
+        raise HTTPException(status_code=415, detail={"code": 200, "message": str(exc)})
+    except PoolBusy as exc:
+        raise _busy(exc)
+    except DBUnavailable as exc:
+        log.warning("predict_cycles: %s (rid=%s)", exc, rid)
+        raise HTTPException(status_code=503, detail={"code": 503, "message": str(exc)})
     except ValueError as exc:
         raise HTTPException(status_code=400, detail={"code": 200, "message": str(exc)})
     except RuntimeError as exc:
         raise HTTPException(status_code=500, detail={"code": 100, "message": str(exc)})
     except Exception:
-        log.exception("predict_both failed (rid=%s)", rid)
+        log.exception("predict_cycles failed (rid=%s)", rid)
+        raise HTTPException(status_code=500, detail={"code": 900, "message": "internal error"})
+
+
+def _parse_peer_request(body: Any):
+    if not isinstance(body, dict):
+        raise ValueError("JSON root must be an object")
+    items = body.get("items")
+    if not isinstance(items, list) or not items:
+        raise ValueError("'items' must be a non-empty list")
+    if len(items) > PEER_STATS_MAX_ITEMS:
+        raise ValueError(f"at most {PEER_STATS_MAX_ITEMS} items per request")
+    groups: List[Any] = []
+    plants: List[date] = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError(f"items[{i}] must be an object")
+        group = item.get("group_type")
+        if group is not None and not isinstance(group, str):
+            raise ValueError(f"items[{i}].group_type must be a string or null")
+        try:
+            plants.append(date.fromisoformat(str(item.get("plant_date"))))
+        except ValueError:
+            raise ValueError(f"items[{i}].plant_date must be a date (YYYY-MM-DD)")
+        groups.append(group)
+    asof = body.get("asof")
+    if asof is not None:
+        try:
+            asof = date.fromisoformat(str(asof))
+        except ValueError:
+            raise ValueError("'asof' must be a date (YYYY-MM-DD)")
+    return groups, plants, asof
+
+
+@router.post("/peer_stats")
+async def peer_stats(request: Request):
+    """findRecentPeerStats for many (group_type, plant_date) pairs from the shared per-asof index."""
+    rid = _ensure_rid(request)
+    log.info("/peer_stats called (rid=%s)", rid)
+    metrics.ENDPOINT.set("/api/peer_stats")
+
+    raw = await request.body()
+    try:
+        groups, plants, asof = _parse_peer_request(codec.decode_body(raw, request.headers.get("content-type")))
+        started = time.perf_counter()
+        index = await _PEERS.get(_DB, asof)
+        metrics.observe_stage("db", started)
+        totals, days, k = index.lookup_many(groups, plants)
+        results = [
+            {"peer_mean_total": t, "peer_mean_days": d, "k": n}
+            for t, d, n in zip(totals.tolist(), days.tolist(), k.tolist())
+        ]
+        metrics.REQUEST_ROWS.observe(len(results), "/api/peer_stats")
+        return _respond(request, {
+            "ok": True,
+            "asof": index.asof.isoformat(),
+            "request_id": rid,
+            "results": results,
+        })
+    except codec.UnsupportedMediaType as exc:
+        raise HTTPException(status_code=415, detail={"code": 200, "message": str(exc)})
+    except DBUnavailable as exc:
+        log.warning("peer_stats: %s (rid=%s)", exc, rid)
+        raise HTTPException(status_code=503, detail={"code": 503, "message": str(exc)})
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail={"code": 200, "message": str(exc)})
+    except RuntimeError as exc:
+        raise HTTPException(status_code=500, detail={"code": 100, "message": str(exc)})
+    except Exception:
+        log.exception("peer_stats failed (rid=%s)", rid)
         raise HTTPException(status_code=500, detail={"code": 900, "message": "internal error"})
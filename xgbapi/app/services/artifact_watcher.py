@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+log = logging.getLogger("xgbapi.watcher")
+
+
+class ArtifactWatcher:
+    """Poll artifact files in a background thread and hot-swap new versions.
+
+    ``signature()`` is cheap (mtimes); when it changes and stays the same for
+    one more poll (so half-written files are not picked up), ``load(sig)``
+    builds a new snapshot, ``warmup(snapshot)`` runs a test prediction and only
+    then ``publish(snapshot)`` swaps it in. Any failure keeps the previous
+    snapshot serving; the failed signature is not retried until it changes.
+    ``lock`` serialises loads with any on-demand loader on the request path.
+    """
+
+    def __init__(
+        self,
+        signature: Callable[[], str],
+        load: Callable[[str], Any],
+        warmup: Callable[[Any], None],
+        publish: Callable[[Any], None],
+        lock: threading.Lock,
+        interval_sec: float = 5.0,
+    ) -> None:
+        self._signature = signature
+        self._load = load
+        self._warmup = warmup
+        self._publish = publish
+        self._lock = lock
+        self.interval = max(0.1, float(interval_sec))
+        self.current: Optional[str] = None
+        self._seen: Optional[str] = None
+        self._failed: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.reloads = 0
+        self.failures = 0
+        self.last_reload_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="artifact-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1.0)
+        self._thread = None
+
+    def mark_loaded(self, sig: str) -> None:
+        """Record a snapshot published by someone else (e.g. an on-demand load)."""
+        self.current = self._seen = sig
+
+    def check(self, force: bool = False) -> bool:
+        """One poll. Returns True when a new snapshot was published."""
+        sig = self._signature()
+        if sig == self.current or sig == self._failed:
+            return False
+        if not force and self.current is not None and sig != self._seen:
+            self._seen = sig  # changed since last poll: wait until it settles
+            return False
+        with self._lock:
+            if sig == self.current:
+                return False
+            started = time.perf_counter()
+            try:
+                snapshot = self._load(sig)
+                self._warmup(snapshot)
+            except Exception as exc:
+                self.failures += 1
+                self._failed = sig
+                self.last_error = f"{type(exc).__name__}: {exc}"
+                log.exception("[WATCHER] reload failed; keeping previous artifacts (sig=%s)", sig)
+                return False
+            self._publish(snapshot)
+            self.current = self._seen = sig
+            self._failed = None
+            self.reloads += 1
+            self.last_reload_at = time.time()
+            self.last_error = None
+        log.info("[WATCHER] artifacts swapped in %.3fs (sig=%s)", time.perf_counter() - started, sig)
+        return True
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.check()
+            except Exception:
+                log.exception("[WATCHER] poll failed")
+            self._stop.wait(self.interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "interval_sec": self.interval,
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_reload_at": self.last_reload_at,
+            "last_error": self.last_error,
+        }
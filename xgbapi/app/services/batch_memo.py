@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class BatchMemo:
+    """Aggregate results memoized for one feature batch, keyed by their semantic parameters.
+
+    An instance lives exactly as long as the rows it was computed from (one
+    :class:`~app.services.cycle_features.CycleInputs`, i.e. one asof), so
+    nothing needs invalidating. Hits and misses are counted per kind of
+    aggregate for reporting. Not thread-safe: a batch is built on one thread.
+    """
+
+    def __init__(self) -> None:
+        self._tables: Dict[str, Dict[Hashable, Any]] = {}
+        self._hits: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+
+    def get(self, kind: str, key: Hashable, compute: Callable[[], T]) -> T:
+        table = self._tables.setdefault(kind, {})
+        if key in table:
+            self._hits[kind] = self._hits.get(kind, 0) + 1
+            return table[key]
+        self._misses[kind] = self._misses.get(kind, 0) + 1
+        value = table[key] = compute()
+        return value
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        out: Dict[str, Dict[str, Any]] = {}
+        total_hits = total_misses = 0
+        for kind in sorted(self._tables):
+            hits, misses = self._hits.get(kind, 0), self._misses.get(kind, 0)
+            total_hits += hits
+            total_misses += misses
+            out[kind] = _rate(hits, misses)
+        out["total"] = _rate(total_hits, total_misses)
+        return out
+
+
+def _rate(hits: int, misses: int) -> Dict[str, Any]:
+    lookups = hits + misses
+    return {"hits": hits, "misses": misses, "hit_rate": round(hits / lookups, 4) if lookups else 0.0}
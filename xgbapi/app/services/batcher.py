@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple
+
+import numpy as np
+
+log = logging.getLogger("xgbapi.batcher")
+
+ScoreFn = Callable[[Any, np.ndarray], Tuple[np.ndarray, ...]]
+Runner = Callable[..., Awaitable[Any]]
+BatchHook = Callable[[int, int], None]
+
+
+async def _run_inline(fn: Callable[..., Any], *args: Any) -> Any:
+    return fn(*args)
+
+
+class MicroBatcher:
+    """Coalesce concurrent scoring calls into one preproc+predict pass.
+
+    Requests arriving within ``max_wait_ms`` of the first pending one (or until
+    ``max_rows`` rows are queued) are stacked and scored with a single call to
+    ``fn(art, X)``; each caller receives only its own slice of the outputs.
+    Requests are grouped per artifact snapshot so a reload never mixes models.
+    ``runner`` decides where ``fn`` executes (e.g. ``InferencePool.run``);
+    ``on_batch(requests, rows)`` is called after each successful batch.
+    """
+
+    def __init__(
+        self,
+        fn: ScoreFn,
+        max_wait_ms: float = 5.0,
+        max_rows: int = 1024,
+        runner: Runner = _run_inline,
+        on_batch: Optional[BatchHook] = None,
+    ) -> None:
+        self._fn = fn
+        self._runner = runner
+        self._on_batch = on_batch
+        self._max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._max_rows = max(1, int(max_rows))
+        self._pending: List[Tuple[Any, np.ndarray, asyncio.Future]] = []
+        self._rows = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, art: Any, X: np.ndarray) -> Tuple[np.ndarray, ...]:
+        loop = asyncio.get_running_loop()
+        fut: asyncio.Future = loop.create_future()
+        self._pending.append((art, X, fut))
+        self._rows += len(X)
+        if self._rows >= self._max_rows:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._max_wait, self._flush)
+        return await fut
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._rows = self._pending, [], 0
+
+        groups: dict = {}
+        for entry in batch:
+            groups.setdefault(id(entry[0]), []).append(entry)
+        loop = asyncio.get_running_loop()
+        for entries in groups.values():
+            task = loop.create_task(self._run(entries))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, entries: List[Tuple[Any, np.ndarray, asyncio.Future]]) -> None:
+        art = entries[0][0]
+        try:
+            X = entries[0][1] if len(entries) == 1 else np.concatenate([e[1] for e in entries])
+            outputs = await self._runner(self._fn, art, X)
+        except Exception as exc:
+            if len(entries) == 1:
+                _set_exception(entries[0][2], exc)
+                return
+            # One bad member must not fail its neighbours: score them individually.
+            log.warning("batch of %d requests failed (%s); retrying one by one", len(entries), exc)
+            await asyncio.gather(*(self._run([entry]) for entry in entries))
+            return
+
+        log.debug("scored batch requests=%d rows=%d", len(entries), len(X))
+        if self._on_batch is not None:
+            self._on_batch(len(entries), len(X))
+        start = 0
+        for _, part, fut in entries:
+            stop = start + len(part)
+            if not fut.done():
+                fut.set_result(tuple(out[start:stop] for out in outputs))
+            start = stop
+
+
+def _set_exception(fut: asyncio.Future, exc: BaseException) -> None:
+    if not fut.done():
+        fut.set_exception(exc)
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, AsyncIterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from starlette.responses import JSONResponse, StreamingResponse
+
+try:  # Optional: fast JSON encode/decode (falls back to the stdlib json module)
+    import orjson  # type: ignore
+except Exception:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:  # Optional: MessagePack request/response bodies
+    import msgpack  # type: ignore
+except Exception:  # pragma: no cover - optional dependency
+    msgpack = None
+
+try:  # Optional: Arrow IPC request bodies
+    import pyarrow as pa  # type: ignore
+except Exception:  # pragma: no cover - optional dependency
+    pa = None
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+ARROW_STREAM_TYPES = ("application/vnd.apache.arrow.stream",)
+ARROW_FILE_TYPES = ("application/vnd.apache.arrow.file", "application/x-apache-arrow-file")
+NDJSON_TYPE = "application/x-ndjson"
+
+Rows = Union[Sequence[Sequence[Any]], np.ndarray]
+
+# JSON_BACKEND=auto (orjson when installed) | orjson | json
+JSON_BACKEND = os.getenv("JSON_BACKEND", "auto").strip().lower()
+USE_ORJSON = orjson is not None and JSON_BACKEND in ("auto", "orjson")
+_ORJSON_OPTS = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS) if orjson is not None else 0
+
+
+def _np_default(obj: Any) -> Any:
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def json_loads(raw: Union[bytes, str]) -> Any:
+    return orjson.loads(raw) if USE_ORJSON else json.loads(raw)
+
+
+def json_dumps(content: Any) -> bytes:
+    """Compact UTF-8 JSON; NumPy arrays and scalars are serialized directly."""
+    if USE_ORJSON:
+        try:
+            return orjson.dumps(content, default=_np_default, option=_ORJSON_OPTS)
+        except TypeError:
+            pass  # e.g. non-contiguous arrays or ints beyond 64 bits; let stdlib handle it
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"), default=_np_default
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered through :func:`json_dumps` (orjson when available)."""
+
+    def render(self, content: Any) -> bytes:
+        return json_dumps(content)
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse for handlers that keep reading the request body while
+    the response streams.
+
+    The stock class consumes ``receive()`` in the background to detect client
+    disconnects, which would swallow request body chunks. Here the body
+    iterator itself sees the disconnect (``request.stream()`` raises
+    ``ClientDisconnect``).
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+class UnsupportedMediaType(Exception):
+    """The Content-Type needs an optional decoder that is not installed."""
+
+
+def media_type(header: Optional[str]) -> str:
+    return (header or "").split(";", 1)[0].strip().lower()
+
+
+def decode_body(raw: bytes, content_type: Optional[str]) -> Any:
+    """Decode a request body according to its Content-Type.
+
+    JSON and MessagePack yield the same object model. Arrow IPC yields a
+    columnar payload ``{"columns": [...], "values": ndarray}``.
+    Decoding failures raise ``ValueError`` with the message returned to the client.
+    """
+    mt = media_type(content_type)
+    if mt in MSGPACK_TYPES:
+        if msgpack is None:
+            raise UnsupportedMediaType("msgpack is not installed on this server")
+        try:
+            return msgpack.unpackb(raw, raw=False)
+        except Exception:
+            raise ValueError("Invalid MessagePack payload")
+    if mt in ARROW_STREAM_TYPES or mt in ARROW_FILE_TYPES:
+        if pa is None:
+            raise UnsupportedMediaType("pyarrow is not installed on this server")
+        return _decode_arrow(raw, stream=mt in ARROW_STREAM_TYPES)
+    # Anything else is parsed as JSON, as request.json() always did
+    try:
+        return json_loads(raw)
+    except Exception:
+        raise ValueError("Invalid JSON payload")
+
+
+def _decode_arrow(raw: bytes, stream: bool) -> dict:
+    try:
+        reader = pa.ipc.open_stream(raw) if stream else pa.ipc.open_file(raw)
+        table = reader.read_all()
+    except Exception:
+        raise ValueError("Invalid Arrow IPC payload")
+    columns = [str(name) for name in table.column_names]
+    values = np.empty((table.num_rows, len(columns)), dtype=np.float64)
+    for j, name in enumerate(columns):
+        try:
+            # nulls come back as NaN and are treated like JSON nulls
+            values[:, j] = table.column(j).to_numpy(zero_copy_only=False).astype(np.float64)
+        except (TypeError, ValueError, pa.ArrowException):
+            raise ValueError(f"column '{name}' must be numeric")
+    return {"columns": columns, "values": values}
+
+
+def is_columnar(body: Any) -> bool:
+    return isinstance(body, dict) and "columns" in body and "data" not in body
+
+
+def parse_columns(columns: Any) -> List[str]:
+    if not isinstance(columns, list) or not columns or not all(isinstance(c, str) for c in columns):
+        raise ValueError("'columns' must be a non-empty list of strings")
+    if len(set(columns)) != len(columns):
+        raise ValueError("'columns' must not contain duplicates")
+    return columns
+
+
+def parse_columnar(body: dict) -> Tuple[List[str], Rows]:
+    """Validate ``{"columns": [...], "rows": [[...], ...]}`` and return (columns, rows)."""
+    columns = parse_columns(body.get("columns"))
+
+    rows = body.get("values")
+    if rows is None:
+        rows = body.get("rows")
+        if not isinstance(rows, list):
+            raise ValueError("'rows' must be a list")
+    if len(rows) == 0:
+        raise ValueError("rows must not be empty")
+    return columns, rows
+
+
+def wants_msgpack(accept: Optional[str]) -> bool:
+    if msgpack is None or not accept:
+        return False
+    return any(media_type(part) in MSGPACK_TYPES for part in accept.split(","))
+
+
+def pack_msgpack(content: Any) -> bytes:
+    return msgpack.packb(content, use_bin_type=True, default=_np_default)
+
+
+async def ndjson_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[bytes]:
+    """Split a chunked byte stream into non-empty lines.
+
+    Holds at most one partial line (bounded by ``max_line_bytes``) besides the
+    current chunk, however large the whole stream is.
+    """
+    pending = b""
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        if len(pending) > max_line_bytes:
+            raise ValueError(f"NDJSON line exceeds {max_line_bytes} bytes")
+        for line in lines:
+            line = line.strip()
+            if line:
+                yield line
+    pending = pending.strip()
+    if pending:
+        yield pending
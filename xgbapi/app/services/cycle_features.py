@@ -0,0 +1,428 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.services.batch_memo import BatchMemo
+from app.services.peer_index import PeerIndex
+from app.services.weather_index import WEATHER_INDEX_SQL, WeatherIndex
+
+log = logging.getLogger("xgbapi.cycle_features")
+
+# 特徴量仕様_v2, computed as lib/build_features.php does, but for many cycles
+# from a handful of set-based queries instead of ~10 queries per cycle.
+
+ASOF_SQL = "SELECT LEAST(CURDATE(), MAX(date)) AS asof FROM weather_daily"
+
+TARGETS_SQL = """
+SELECT c.id, c.bed_id, c.sow_date, c.plant_date, c.sales_adjust_days, b.group_type
+FROM cycles c
+JOIN beds b ON b.id = c.bed_id
+WHERE c.id IN ({placeholders})
+"""
+
+WEATHER_SQL = """
+SELECT date, temp_avg, temp_max, temp_min, variation
+FROM weather_daily
+WHERE date BETWEEN %s AND %s
+ORDER BY date
+"""
+
+WEATHER_SINCE_SQL = """
+SELECT date, temp_avg, temp_max, temp_min, variation
+FROM weather_daily
+WHERE date >= %s
+ORDER BY date
+"""
+
+# every cycle a peer (harvested) or year-over-year (planted around a year
+# before a target) average can draw from, with its total harvest
+HISTORY_SQL = """
+SELECT c.id, c.bed_id, c.plant_date, c.harvest_start, c.harvest_end,
+       b.id AS bed_row, b.group_type, h.total_yield
+FROM cycles c
+LEFT JOIN beds b ON b.id = c.bed_id
+LEFT JOIN (
+  SELECT cycle_id, SUM(harvest_kg) AS total_yield
+  FROM harvests
+  GROUP BY cycle_id
+) h ON h.cycle_id = c.id
+WHERE c.harvest_start IS NOT NULL OR c.plant_date BETWEEN %s AND %s
+"""
+
+# every cycle findRecentPeerStats can draw from (its own filters are applied by PeerIndex)
+PEER_HISTORY_SQL = """
+SELECT c.id, c.bed_id, c.plant_date, c.harvest_start, c.harvest_end,
+       b.id AS bed_row, b.group_type, h.total_yield
+FROM cycles c
+LEFT JOIN beds b ON b.id = c.bed_id
+LEFT JOIN (
+  SELECT cycle_id, SUM(harvest_kg) AS total_yield
+  FROM harvests
+  GROUP BY cycle_id
+) h ON h.cycle_id = c.id
+WHERE c.harvest_start IS NOT NULL AND c.harvest_end IS NOT NULL
+"""
+
+# the row CycleInputs.features returns, in a fixed order (features_cache stores values only)
+FEATURE_SPEC = "v2"  # 特徴量仕様_v2
+FEATURE_COLUMNS = (
+    "育苗日数",
+    "定植月",
+    "グループ_通常",
+    "気温_平均",
+    "気温_最大",
+    "気温_最小",
+    "気温_std",
+    "気温振れ幅_平均",
+    "気温振れ幅_std",
+    "類似ベッド_平均収量",
+    "類似ベッド_平均日数",
+    "前年同時期収量",
+    "前年同時期日数",
+    "類似対前年_収量差",
+    "類似対前年_日数差",
+    "収量差_前年",
+    "日数差_前年",
+    "営業調整日数",
+)
+
+YOY_RADIUS_DAYS = 5
+DEFAULT_NURSERY_DAYS = 21
+WEATHER_REFRESH_DAYS = 7  # trailing days re-read on every batch to pick up late corrections
+WEATHER_RELOAD_SEC = 3600.0  # full reload, for edits further back
+
+
+class CycleFeatureError(ValueError):
+    """Features cannot be built for one cycle (reported per cycle, not per request)."""
+
+
+def _to_date(value: Any) -> Optional[date]:
+    if value is None or isinstance(value, date) and not isinstance(value, datetime):
+        return value
+    if isinstance(value, datetime):
+        return value.date()
+    return date.fromisoformat(str(value)[:10])
+
+
+def _num(value: Any) -> Optional[float]:
+    return None if value is None else float(value)
+
+
+def _php_float(value: Optional[float]) -> float:
+    # PHP's (float)null is 0.0; the PHP builder casts every aggregate this way
+    return 0.0 if value is None else float(value)
+
+
+def _avg(values: Iterable[Optional[float]]) -> Optional[float]:
+    """SQL AVG: NULLs ignored, NULL when nothing is left."""
+    vals = [v for v in values if v is not None]
+    return sum(vals) / len(vals) if vals else None
+
+
+def _stddev_pop(values: Iterable[Optional[float]]) -> Optional[float]:
+    vals = [v for v in values if v is not None]
+    if not vals:
+        return None
+    mean = sum(vals) / len(vals)
+    return math.sqrt(sum((v - mean) ** 2 for v in vals) / len(vals))
+
+
+def _minus_one_year(d: date) -> date:
+    # strtotime('-1 year') rolls 29 Feb over to 1 Mar
+    try:
+        return d.replace(year=d.year - 1)
+    except ValueError:
+        return date(d.year - 1, 3, 1)
+
+
+def _same_group(row: Dict[str, Any], group_type: Any) -> bool:
+    # SQL equality: NULL never matches
+    return group_type is not None and row["group_type"] == group_type
+
+
+class CycleInputs:
+    """Rows fetched for one batch of cycles; :meth:`features` is pure Python.
+
+    Cycles of one batch share an asof and mostly a group and a season, so the
+    aggregates behind each feature row are memoized in :attr:`memo` by what
+    they depend on (date range, group, planting DOY, bed): a sweep over every
+    open cycle computes each distinct aggregate once.
+    """
+
+    def __init__(
+        self,
+        asof: date,
+        targets: Dict[int, Dict[str, Any]],
+        weather: WeatherIndex,
+        history: List[Dict[str, Any]],
+    ) -> None:
+        self.asof = asof
+        self.targets = targets
+        self.weather = weather
+        self.history = [self._history_row(r) for r in history]
+        self._peers: Optional[PeerIndex] = None
+        self.memo = BatchMemo()
+
+    @staticmethod
+    def _history_row(r: Dict[str, Any]) -> Dict[str, Any]:
+        plant, start = _to_date(r.get("plant_date")), _to_date(r.get("harvest_start"))
+        return {
+            "id": r["id"],
+            "bed_id": r["bed_id"],
+            "has_bed": r.get("bed_row") is not None,
+            "group_type": r.get("group_type"),
+            "plant_date": plant,
+            "harvest_start": start,
+            "harvest_end": _to_date(r.get("harvest_end")),
+            "total_yield": _num(r.get("total_yield")),
+            "days_to_first": (start - plant).days if start and plant else None,
+        }
+
+    # ----- aggregates (same filters as the PHP queries) -----
+    def temperature(self, plant_date: date) -> Dict[str, Optional[float]]:
+        asof = self.asof
+        d1 = plant_date if asof >= plant_date else asof - timedelta(days=6)
+        return self.memo.get("temperature", d1, lambda: self.weather.stats(d1, asof))
+
+    @staticmethod
+    def _means(rows: List[Dict[str, Any]]) -> Tuple[float, float, int]:
+        return (
+            _php_float(_avg(r["total_yield"] for r in rows)),
+            _php_float(_avg(r["days_to_first"] for r in rows)),
+            len(rows),
+        )
+
+    @property
+    def peers(self) -> PeerIndex:
+        if self._peers is None:
+            self._peers = PeerIndex(self.asof, self.history)
+        return self._peers
+
+    def peer_stats(self, group_type: Any, plant_date: date) -> Tuple[float, float, int]:
+        """findRecentPeerStats: recently finished cycles planted in the same season."""
+        # asof is fixed for the batch; the cascade only sees the group and the planting DOY
+        key = (group_type, plant_date.timetuple().tm_yday)
+        return self.memo.get("peer", key, lambda: self.peers.lookup(group_type, plant_date))
+
+    def prefetch_peers(self, cycle_ids: Iterable[int]) -> None:
+        """Resolve :meth:`peer_stats` for all of ``cycle_ids`` with one vectorised index lookup."""
+        keys: Dict[Tuple[Any, int], date] = {}
+        for cycle_id in cycle_ids:
+            c = self.targets.get(cycle_id)
+            plant_date = _to_date(c.get("plant_date")) if c else None
+            if plant_date is not None:
+                keys.setdefault((c.get("group_type"), plant_date.timetuple().tm_yday), plant_date)
+        if not keys:
+            return
+        totals, days, k = self.peers.lookup_many([g for g, _ in keys], list(keys.values()))
+        for i, key in enumerate(keys):
+            self.memo.get("peer", key, lambda: (float(totals[i]), float(days[i]), int(k[i])))
+
+    def yoy_stats(self, bed_id: Any, group_type: Any, plant_date: date) -> Tuple[float, float, int]:
+        """findYOY: cycles planted around the same day a year earlier (bed, then group, then all)."""
+        target = _minus_one_year(plant_date)
+        start, end = target - timedelta(days=YOY_RADIUS_DAYS), target + timedelta(days=YOY_RADIUS_DAYS)
+        window = self.memo.get("yoy_window", (start, end), lambda: [
+            h for h in self.history
+            if h["has_bed"] and h["plant_date"] is not None and start <= h["plant_date"] <= end
+        ])
+        for kind, key, match in (
+            ("yoy_bed", bed_id, lambda h: h["bed_id"] == bed_id),
+            ("yoy_group", group_type, lambda h: _same_group(h, group_type)),
+        ):
+            stats = self.memo.get(kind, (start, end, key), lambda: self._means([h for h in window if match(h)]))
+            if stats[2]:
+                return stats
+        return self.memo.get("yoy_all", (start, end), lambda: self._means(window))
+
+    # ----- feature row -----
+    def features(self, cycle_id: int) -> Dict[str, Any]:
+        c = self.targets.get(cycle_id)
+        if c is None:
+            raise CycleFeatureError(f"cycle not found: {cycle_id}")
+        plant_date = _to_date(c.get("plant_date"))
+        if plant_date is None:
+            raise CycleFeatureError(f"plant_date missing: {cycle_id}")
+        sow_date = _to_date(c.get("sow_date"))
+        group_type = c.get("group_type")
+
+        temp = self.temperature(plant_date)
+        if temp["temp_avg_mean"] is None:
+            raise CycleFeatureError("temperature data missing")
+
+        peer_total, peer_days, _ = self.peer_stats(group_type, plant_date)
+        yoy_total, yoy_days, yoy_k = self.yoy_stats(c.get("bed_id"), group_type, plant_date)
+        if yoy_k == 0:
+            yoy_total, yoy_days = peer_total, peer_days
+
+        yield_diff = peer_total - yoy_total
+        days_diff = peer_days - yoy_days
+        return {
+            "育苗日数": (plant_date - sow_date).days if sow_date else DEFAULT_NURSERY_DAYS,
+            "定植月": plant_date.month,
+            "グループ_通常": 1 if group_type in ("normal", "通常") else 0,
+            "気温_平均": _php_float(temp["temp_avg_mean"]),
+            "気温_最大": _php_float(temp["temp_max_max"]),
+            "気温_最小": _php_float(temp["temp_min_min"]),
+            "気温_std": _php_float(temp["temp_avg_std"]),
+            "気温振れ幅_平均": _php_float(temp["swing_avg"]),
+            "気温振れ幅_std": _php_float(temp["swing_std"]),
+            "類似ベッド_平均収量": peer_total,
+            "類似ベッド_平均日数": peer_days,
+            "前年同時期収量": yoy_total,
+            "前年同時期日数": yoy_days,
+            # 類似 − 前年 under both names in use (PHP builder / xgbapi feature_meta);
+            # the model's feature order picks the one it was trained with
+            "類似対前年_収量差": yield_diff,
+            "類似対前年_日数差": days_diff,
+            "収量差_前年": yield_diff,
+            "日数差_前年": days_diff,
+            "営業調整日数": int(c.get("sales_adjust_days") or 0),
+        }
+
+
+class WeatherStore:
+    """Process-wide :class:`WeatherIndex`: loaded once, then extended as new days arrive.
+
+    Each :meth:`get` re-reads the last ``WEATHER_REFRESH_DAYS`` days; when they
+    differ from what is held, a copy of the index is extended and swapped in,
+    so feature builds still running on the previous snapshot are unaffected.
+    """
+
+    def __init__(self) -> None:
+        self.index: Optional[WeatherIndex] = None
+        self._loaded_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self.loads = 0
+        self.appends = 0
+
+    async def get(self, pool: Any) -> WeatherIndex:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            index = self.index
+            if index is None or index.end is None or time.monotonic() - self._loaded_at > WEATHER_RELOAD_SEC:
+                self.index = WeatherIndex.from_rows(await pool.fetchall(WEATHER_INDEX_SQL))
+                self._loaded_at = time.monotonic()
+                self.loads += 1
+                log.info("[CYCLES] weather index loaded: %s", self.index.info())
+            else:
+                since = index.end - timedelta(days=WEATHER_REFRESH_DAYS)
+                rows = await pool.fetchall(WEATHER_SINCE_SQL, (since,))
+                if not index.matches(rows):
+                    fresh = index.copy()
+                    fresh.append(rows)
+                    self.index = fresh
+                    self.appends += 1
+            return self.index
+
+    def stats(self) -> Dict[str, Any]:
+        info = self.index.info() if self.index is not None else {"days": 0, "start": None, "end": None}
+        return {**info, "loads": self.loads, "appends": self.appends}
+
+
+async def fetch_asof(pool: Any) -> date:
+    """getAsof: the last weather day, but never after today."""
+    asof = _to_date(((await pool.fetchone(ASOF_SQL)) or {}).get("asof"))
+    if asof is None:
+        raise RuntimeError("asof not found (weather_daily is empty)")
+    return asof
+
+
+class PeerStore:
+    """:class:`PeerIndex` per asof, kept for ``ttl`` seconds.
+
+    A re-prediction sweep asks for the peer stats of every open cycle with the
+    same asof; the finished-cycle history is read and indexed once for all of
+    them. Indexes are replaced, never mutated, so a lookup in progress keeps
+    its snapshot.
+    """
+
+    def __init__(self, ttl: float = 60.0, max_entries: int = 4) -> None:
+        self.ttl = float(ttl)
+        self.max_entries = max(1, int(max_entries))
+        self._entries: Dict[date, Tuple[float, PeerIndex]] = {}
+        self._lock: Optional[asyncio.Lock] = None
+        self.builds = 0
+        self.hits = 0
+
+    async def get(self, pool: Any, asof: Optional[date] = None) -> PeerIndex:
+        if asof is None:
+            asof = await fetch_asof(pool)
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            now = time.monotonic()
+            entry = self._entries.get(asof)
+            if entry is not None and now - entry[0] <= self.ttl:
+                self.hits += 1
+                return entry[1]
+            rows = await pool.fetchall(PEER_HISTORY_SQL)
+            index = PeerIndex(asof, [CycleInputs._history_row(r) for r in rows])
+            self._entries = {
+                k: v for k, v in self._entries.items() if now - v[0] <= self.ttl
+            }
+            while len(self._entries) >= self.max_entries:
+                self._entries.pop(min(self._entries, key=lambda k: self._entries[k][0]))
+            self._entries[asof] = (now, index)
+            self.builds += 1
+            log.info("[CYCLES] peer index built: %s", index.info())
+            return index
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ttl_sec": self.ttl,
+            "asofs": sorted(k.isoformat() for k in self._entries),
+            "builds": self.builds,
+            "hits": self.hits,
+        }
+
+
+async def fetch_inputs(
+    pool: Any,
+    cycle_ids: Sequence[int],
+    asof: Optional[date] = None,
+    weather: Optional[WeatherStore] = None,
+) -> CycleInputs:
+    """Load everything needed for ``cycle_ids`` with four queries in two round trips.
+
+    With a :class:`WeatherStore` the weather comes from its shared index
+    (refreshing only the last few days) instead of a per-batch range query.
+    """
+    ids = sorted(set(int(i) for i in cycle_ids))
+    targets_q = pool.fetchall(TARGETS_SQL.format(placeholders=",".join(["%s"] * len(ids))), ids)
+    if asof is None:
+        target_rows, asof_row = await asyncio.gather(targets_q, pool.fetchone(ASOF_SQL))
+        asof = _to_date((asof_row or {}).get("asof"))
+        if asof is None:
+            raise RuntimeError("asof not found (weather_daily is empty)")
+    else:
+        target_rows = await targets_q
+    targets = {int(r["id"]): r for r in target_rows}
+
+    plants = [d for d in (_to_date(r.get("plant_date")) for r in target_rows) if d is not None]
+    if plants:
+        weather_from = min(min(plants), asof - timedelta(days=6))
+        yoy_from = _minus_one_year(min(plants)) - timedelta(days=YOY_RADIUS_DAYS)
+        yoy_to = _minus_one_year(max(plants)) + timedelta(days=YOY_RADIUS_DAYS)
+    else:
+        weather_from = asof
+        yoy_from = yoy_to = asof
+    if weather is not None:
+        index, history = await asyncio.gather(
+            weather.get(pool),
+            pool.fetchall(HISTORY_SQL, (yoy_from, yoy_to)),
+        )
+    else:
+        weather_rows, history = await asyncio.gather(
+            pool.fetchall(WEATHER_SQL, (weather_from, asof)),
+            pool.fetchall(HISTORY_SQL, (yoy_from, yoy_to)),
+        )
+        index = WeatherIndex.from_rows(weather_rows)
+    log.debug("[CYCLES] %d targets, %d weather days, %d history rows", len(targets), len(index), len(history))
+    return CycleInputs(asof, targets, index, history)
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:  # Optional: only needed for endpoints that read the forecast DB
+    import aiomysql  # type: ignore
+except Exception:  # pragma: no cover - optional dependency
+    aiomysql = None
+
+log = logging.getLogger("xgbapi.db")
+
+
+class DBUnavailable(RuntimeError):
+    """The database is not configured, the driver is missing or it cannot be reached."""
+
+
+class DBPool:
+    """Lazily created aiomysql connection pool.
+
+    The pool is opened on first use from the event loop, so a pre-fork parent
+    never holds connections its workers would inherit. Rows come back as
+    dicts, like the ``DictCursor`` used by the PHP / CLI tools.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        user: str,
+        password: str,
+        db: str,
+        port: int = 3306,
+        charset: str = "utf8mb4",
+        minsize: int = 1,
+        maxsize: int = 4,
+        connect_timeout: float = 5.0,
+    ) -> None:
+        self.host = host
+        self.user = user
+        self.password = password
+        self.db = db
+        self.port = int(port)
+        self.charset = charset
+        self.minsize = max(0, int(minsize))
+        self.maxsize = max(1, int(maxsize))
+        self.connect_timeout = float(connect_timeout)
+        self._pool: Any = None
+        self._lock: Optional[asyncio.Lock] = None
+        self.queries = 0
+        self.errors = 0
+
+    @classmethod
+    def from_env(cls, minsize: int = 1, maxsize: int = 2) -> "DBPool":
+        """A pool on the FORECAST_DB_* variables (as db.php), for CLI jobs."""
+        return cls(
+            host=os.getenv("FORECAST_DB_HOST", ""),
+            port=int(os.getenv("FORECAST_DB_PORT", "3306")),
+            user=os.getenv("FORECAST_DB_USER", ""),
+            password=os.getenv("FORECAST_DB_PASS", ""),
+            db=os.getenv("FORECAST_DB_NAME", ""),
+            charset=os.getenv("FORECAST_DB_CHARSET", "utf8mb4"),
+            minsize=minsize,
+            maxsize=maxsize,
+        )
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.host and self.user and self.db)
+
+    async def _get_pool(self) -> Any:
+        if self._pool is not None:
+            return self._pool
+        if aiomysql is None:
+            raise DBUnavailable("aiomysql is not installed on this server")
+        if not self.configured:
+            raise DBUnavailable("database is not configured (FORECAST_DB_*)")
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._pool is None:
+                try:
+                    self._pool = await aiomysql.create_pool(
+                        host=self.host,
+                        port=self.port,
+                        user=self.user,
+                        password=self.password,
+                        db=self.db,
+                        charset=self.charset,
+                        minsize=self.minsize,
+                        maxsize=self.maxsize,
+                        connect_timeout=self.connect_timeout,
+                        autocommit=True,
+                    )
+                except Exception as exc:
+                    raise DBUnavailable(f"database connection failed: {exc}") from exc
+                log.info("[DB] pool opened to %s:%s/%s (max %d)", self.host, self.port, self.db, self.maxsize)
+        return self._pool
+
+    async def fetchall(self, sql: str, args: Sequence[Any] = ()) -> List[Dict[str, Any]]:
+        pool = await self._get_pool()
+        self.queries += 1
+        try:
+            async with pool.acquire() as conn:
+                async with conn.cursor(aiomysql.DictCursor) as cur:
+                    await cur.execute(sql, tuple(args))
+                    return list(await cur.fetchall())
+        except Exception as exc:
+            self.errors += 1
+            raise DBUnavailable(f"database query failed: {exc}") from exc
+
+    async def fetchone(self, sql: str, args: Sequence[Any] = ()) -> Optional[Dict[str, Any]]:
+        rows = await self.fetchall(sql, args)
+        return rows[0] if rows else None
+
+    async def execute(self, sql: str, args: Sequence[Any] = ()) -> int:
+        """Run one write statement (autocommit); returns the affected row count."""
+        pool = await self._get_pool()
+        self.queries += 1
+        try:
+            async with pool.acquire() as conn:
+                async with conn.cursor() as cur:
+                    return await cur.execute(sql, tuple(args))
+        except Exception as exc:
+            self.errors += 1
+            raise DBUnavailable(f"database write failed: {exc}") from exc
+
+    async def transaction(self, statements: Sequence[Tuple[str, Sequence[Any]]]) -> int:
+        """Run write statements on one connection as a single transaction (all or nothing)."""
+        pool = await self._get_pool()
+        self.queries += len(statements)
+        try:
+            async with pool.acquire() as conn:
+                await conn.begin()
+                try:
+                    affected = 0
+                    async with conn.cursor() as cur:
+                        for sql, args in statements:
+                            affected += await cur.execute(sql, tuple(args))
+                    await conn.commit()
+                except BaseException:
+                    await conn.rollback()
+                    raise
+                return affected
+        except Exception as exc:
+            self.errors += 1
+            raise DBUnavailable(f"database transaction failed: {exc}") from exc
+
+    def stats(self) -> Dict[str, Any]:
+        pool = self._pool
+        return {
+            "configured": self.configured,
+            "driver": aiomysql is not None,
+            "open": pool is not None,
+            "size": pool.size if pool is not None else 0,
+            "free": pool.freesize if pool is not None else 0,
+            "maxsize": self.maxsize,
+            "queries": self.queries,
+            "errors": self.errors,
+        }
+
+    async def close(self) -> None:
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+            await pool.wait_closed()
+            log.info("[DB] pool closed")
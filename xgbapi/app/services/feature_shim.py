@@ -1,9 +1,11 @@
 # /home/centos/xgbapi/app/services/feature_shim.py
 from __future__ import annotations
 from datetime import datetime, date
-from typing import Any, Dict, List, Optional, Iterable
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Iterable
 import numpy as np
-import pandas as pd
+
+if TYPE_CHECKING:  # pandas は DataFrame を返す関数の中でだけ import（推論経路では不要）
+    import pandas as pd
 
 # =========================================================
 # 基本ユーティリティ
@@ -145,6 +147,8 @@ def build_feature_row(payload: Dict[str, Any], preproc) -> pd.DataFrame:
     APIの生入力(dict/Pydantic)を、preproc が期待する“学習時の日本語特徴列”に合わせて
     1行DataFrameとして構築。算出不能な列は NaN（＝Imputer に委任）。
     """
+    import pandas as pd
+
     # Pydantic v2: model_dump / v1: dict
     if hasattr(payload, "model_dump"):
         payload = payload.model_dump()
@@ -256,6 +260,8 @@ def adapt_features(df: pd.DataFrame, preproc, payload: Dict[str, Any] | None = N
 
 def build_feature_frame(payloads: Iterable[Dict[str, Any]], preproc) -> pd.DataFrame:
     """複数レコード版。各 payload を build_feature_row に通して縦に結合。"""
+    import pandas as pd
+
     expected = _expected_columns_from_preproc(preproc)
     rows = []
     for p in payloads:
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from datetime import date
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from app.services.db_pool import DBUnavailable
+
+log = logging.getLogger("xgbapi.features_cache")
+
+# Checksum of every table a feature row is computed from: any edit to a cycle,
+# a harvest, a bed's group or a weather day changes it, and with it every key,
+# so a cached row is never served for inputs it was not built from.
+INPUTS_FINGERPRINT_SQL = """
+SELECT
+  (SELECT CONCAT(COUNT(*), ':', COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', id, IFNULL(bed_id, ''),
+          IFNULL(sow_date, ''), IFNULL(plant_date, ''), IFNULL(harvest_start, ''),
+          IFNULL(harvest_end, ''), IFNULL(sales_adjust_days, '')))), 0))
+   FROM cycles) AS cycles,
+  (SELECT CONCAT(COUNT(*), ':', COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', id, IFNULL(cycle_id, ''),
+          IFNULL(harvest_kg, '')))), 0))
+   FROM harvests) AS harvests,
+  (SELECT CONCAT(COUNT(*), ':', COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', id, IFNULL(group_type, '')))), 0))
+   FROM beds) AS beds,
+  (SELECT CONCAT(COUNT(*), ':', COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', date, IFNULL(temp_avg, ''),
+          IFNULL(temp_max, ''), IFNULL(temp_min, ''), IFNULL(variation, '')))), 0))
+   FROM weather_daily) AS weather
+"""
+
+LOOKUP_SQL = "SELECT hash, features_json FROM features_cache WHERE hash IN ({placeholders})"
+
+UPSERT_SQL = """
+INSERT INTO features_cache (cycle_id, asof, features_json, hash)
+VALUES {values}
+ON DUPLICATE KEY UPDATE features_json = VALUES(features_json)
+"""
+
+LOOKUP_CHUNK = 1000
+WRITE_CHUNK = 500
+
+
+def spec_version(spec: str, columns: Sequence[str]) -> str:
+    """``spec`` plus a digest of the column order: renaming or reordering a feature changes it."""
+    digest = hashlib.sha1("\x1f".join(columns).encode("utf-8")).hexdigest()[:8]
+    return f"{spec}.{digest}"
+
+
+class FeaturesCache:
+    """Read-through cache of feature rows in ``features_cache``.
+
+    Keys are content addresses: ``hash = sha256(cycle_id|asof|spec|inputs)``,
+    where ``inputs`` is :data:`INPUTS_FINGERPRINT_SQL`. Lookups are bulk
+    ``hash IN (...)`` queries on the table's unique key; misses are written
+    back with multi-row ``INSERT ... ON DUPLICATE KEY UPDATE``. Rows are
+    stored as ``{"spec": ..., "x": [...]}``, the values in column order,
+    instead of a Japanese-keyed object; a row whose spec differs is ignored.
+
+    The cache is an optimisation only: a failed lookup counts as all misses
+    and a failed write is logged, neither fails the request.
+    """
+
+    def __init__(self, spec: str, columns: Sequence[str]) -> None:
+        self.columns = tuple(columns)
+        self.spec = spec_version(spec, self.columns)
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+
+    def key(self, cycle_id: int, asof: date, inputs: str) -> str:
+        return hashlib.sha256(f"{int(cycle_id)}|{asof.isoformat()}|{self.spec}|{inputs}".encode("utf-8")).hexdigest()
+
+    def encode(self, row: Mapping[str, Any]) -> str:
+        return json.dumps({"spec": self.spec, "x": [row[c] for c in self.columns]}, separators=(",", ":"))
+
+    def decode(self, text: str) -> Optional[Dict[str, Any]]:
+        try:
+            payload = json.loads(text)
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(payload, dict) or payload.get("spec") != self.spec:
+            return None  # PHP's {"features": {...}} rows, or another feature spec
+        values = payload.get("x")
+        if not isinstance(values, list) or len(values) != len(self.columns):
+            return None
+        return dict(zip(self.columns, values))
+
+    async def fingerprint(self, pool: Any) -> str:
+        row = await pool.fetchone(INPUTS_FINGERPRINT_SQL) or {}
+        return "/".join(str(row.get(k)) for k in ("cycles", "harvests", "beds", "weather"))
+
+    async def lookup(
+        self,
+        pool: Any,
+        cycle_ids: Sequence[int],
+        asof: date,
+    ) -> Tuple[Dict[int, Dict[str, Any]], Optional[str]]:
+        """(rows found, inputs fingerprint to :meth:`store` misses under; None if the lookup failed)."""
+        try:
+            inputs = await self.fingerprint(pool)
+            by_key = {self.key(cid, asof, inputs): int(cid) for cid in cycle_ids}
+            keys = list(by_key)
+            found: Dict[int, Dict[str, Any]] = {}
+            for i in range(0, len(keys), LOOKUP_CHUNK):
+                chunk = keys[i:i + LOOKUP_CHUNK]
+                sql = LOOKUP_SQL.format(placeholders=",".join(["%s"] * len(chunk)))
+                for r in await pool.fetchall(sql, chunk):
+                    row = self.decode(r["features_json"])
+                    if row is not None:
+                        found[by_key[r["hash"]]] = row
+        except DBUnavailable as exc:
+            self.errors += 1
+            self.misses += len(cycle_ids)
+            log.warning("[FEATURES_CACHE] lookup failed, building every row: %s", exc)
+            return {}, None
+        self.hits += len(found)
+        self.misses += len(cycle_ids) - len(found)
+        return found, inputs
+
+    async def store(
+        self,
+        pool: Any,
+        rows: Mapping[int, Mapping[str, Any]],
+        asof: date,
+        inputs: Optional[str],
+    ) -> int:
+        """Write ``rows`` ({cycle_id: feature row}) back; returns the number written."""
+        if inputs is None or not rows:
+            return 0
+        items = list(rows.items())
+        written = 0
+        try:
+            for i in range(0, len(items), WRITE_CHUNK):
+                chunk = items[i:i + WRITE_CHUNK]
+                args: List[Any] = []
+                for cid, row in chunk:
+                    args.extend((int(cid), asof, self.encode(row), self.key(cid, asof, inputs)))
+                await pool.execute(UPSERT_SQL.format(values=",".join(["(%s,%s,%s,%s)"] * len(chunk))), args)
+                written += len(chunk)
+        except DBUnavailable as exc:
+            self.errors += 1
+            log.warning("[FEATURES_CACHE] write-back failed after %d rows: %s", written, exc)
+        self.writes += written
+        return written
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "spec": self.spec,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "writes": self.writes,
+            "errors": self.errors,
+        }
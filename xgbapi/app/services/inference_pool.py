@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+log = logging.getLogger("xgbapi.pool")
+
+
+class PoolBusy(Exception):
+    """Raised when the inference queue is full and the request is shed."""
+
+
+class InferencePool:
+    """Run CPU-bound scoring off the event loop with bounded concurrency.
+
+    At most ``workers`` jobs execute at once and at most ``max_queue`` more
+    wait for a worker; anything beyond that is rejected immediately with
+    :class:`PoolBusy` instead of piling up until clients time out.
+    numpy / xgboost / sklearn release the GIL inside predict, so a thread
+    pool keeps the model objects shared while the loop stays responsive.
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 32) -> None:
+        self.workers = max(1, int(workers))
+        self.max_queue = max(0, int(max_queue))
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="infer")
+        self._inflight = 0  # only touched from the event loop thread
+        self._rejected = 0
+
+    async def run(self, fn: Callable[..., Any], *args: Any, shed: bool = True) -> Any:
+        """Execute ``fn(*args)`` on a worker thread.
+
+        ``shed=False`` bypasses the queue limit; use it for follow-up work of
+        a request that has already been admitted (e.g. a micro-batch flush).
+        """
+        if shed and self._inflight >= self.workers + self.max_queue:
+            self._rejected += 1
+            raise PoolBusy(f"inference queue full ({self._inflight} in flight)")
+        self._inflight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            # run inside a copy of the caller's context so contextvars (e.g.
+            # the metrics endpoint label) are visible on the worker thread
+            ctx = contextvars.copy_context()
+            return await loop.run_in_executor(self._executor, functools.partial(ctx.run, fn, *args))
+        finally:
+            self._inflight -= 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "inflight": self._inflight,
+            "rejected": self._rejected,
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
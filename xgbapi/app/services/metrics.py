@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+log = logging.getLogger("xgbapi.metrics")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+# (labels, value) pairs reported by a collector callback at scrape time
+Sample = Tuple[Dict[str, str], float]
+Family = Tuple[str, str, str, List[Sample]]  # name, type, help, samples
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Fixed-bucket histogram; ``observe`` is a bisect plus two additions."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        self._series: Dict[Tuple[Any, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: Any) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(k, list(v[0]), v[1]) for k, v in self._series.items()]
+        for labels, counts, total in sorted(snapshot, key=lambda s: tuple(map(str, s[0]))):
+            running = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                running += count
+                le = 'le="' + _num(bound) + '"'
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {running}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_num(total)}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, labels)} {running}")
+        return out
+
+
+class MetricsRegistry:
+    """Holds metrics and scrape-time collectors; renders Prometheus text format."""
+
+    def __init__(self) -> None:
+        self._metrics: List[Any] = []
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, fn: Callable[[], Iterable[Family]]) -> None:
+        """``fn()`` yields ``(name, type, help, samples)`` families at scrape time."""
+        self._collectors.append(fn)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for fn in self._collectors:
+            try:
+                families = list(fn())
+            except Exception:
+                log.exception("metrics collector failed")
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(list(labels), list(labels.values()))} {_num(value)}")
+        lines.append("")
+        return "\n".join(lines)
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "xgbapi_request_duration_seconds", "End-to-end request latency.", ("endpoint", "method", "status")
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "xgbapi_stage_duration_seconds", "Time spent per pipeline stage.", ("endpoint", "stage")
+)
+REQUEST_ROWS = REGISTRY.histogram(
+    "xgbapi_request_rows", "Rows per prediction request.", ("endpoint",), ROW_BUCKETS
+)
+BATCH_ROWS = REGISTRY.histogram(
+    "xgbapi_batch_rows", "Rows per micro-batch scored together.", (), ROW_BUCKETS
+)
+BATCH_REQUESTS = REGISTRY.histogram(
+    "xgbapi_batch_requests", "Requests coalesced per micro-batch.", (), (1, 2, 4, 8, 16, 32, 64, 128)
+)
+LOOP_LAG_SECONDS = REGISTRY.histogram(
+    "xgbapi_event_loop_lag_seconds", "Delay of a periodic event-loop tick beyond its schedule.",
+    (), (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+
+# Endpoint label for stage timings recorded on worker threads; InferencePool
+# runs jobs inside a copy of the caller's context so this follows the request.
+ENDPOINT: contextvars.ContextVar[str] = contextvars.ContextVar("xgbapi_endpoint", default="-")
+
+
+def observe_stage(stage: str, started: float) -> None:
+    STAGE_SECONDS.observe(time.perf_counter() - started, ENDPOINT.get(), stage)
+
+
+class LoopLagMonitor:
+    """Sleep ``interval`` seconds in a loop and record how late each wake-up is."""
+
+    def __init__(self, interval_sec: float = 0.5) -> None:
+        self.interval = float(interval_sec)
+        self.last_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(0.0, time.perf_counter() - started - self.interval)
+            LOOP_LAG_SECONDS.observe(self.last_lag)
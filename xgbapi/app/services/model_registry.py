@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+log = logging.getLogger("xgbapi.registry")
+
+REQUIRED_FILES = ("model_days.pkl", "model_yield.pkl")
+
+
+class UnknownModelVersion(ValueError):
+    """The requested version does not exist under the models root."""
+
+
+class ModelRegistry:
+    """Versions under ``<root>/<name>/<version>/`` loaded on demand, LRU-bounded.
+
+    A version directory holds ``model_days.pkl`` and ``model_yield.pkl`` plus
+    optional ``preproc.pkl`` / ``feature_meta.json`` (the layout the legacy
+    loaders use). At most ``max_resident`` versions stay in memory; the least
+    recently used one is dropped when another is loaded. Requests already
+    scoring on an evicted version keep their reference until they finish.
+    Version directories are treated as immutable: publish a new version
+    instead of overwriting files in place.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        name: str,
+        load: Callable[[str, str], Any],
+        max_resident: int = 2,
+        required: Sequence[str] = REQUIRED_FILES,
+    ) -> None:
+        self.root = os.path.abspath(os.path.expanduser(root))
+        self.name = name
+        self.base = os.path.join(self.root, name)
+        self._load = load
+        self.max_resident = max(1, int(max_resident))
+        self._required = tuple(required)
+        self._resident: "OrderedDict[str, Any]" = OrderedDict()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self.last_used: Dict[str, float] = {}
+
+    def versions(self) -> List[str]:
+        """Version directories that contain the required artifact files."""
+        try:
+            entries = os.listdir(self.base)
+        except OSError:
+            return []
+        found = []
+        for entry in entries:
+            path = os.path.join(self.base, entry)
+            if os.path.isdir(path) and all(os.path.isfile(os.path.join(path, f)) for f in self._required):
+                found.append(entry)
+        return sorted(found)
+
+    def get(self, version: str) -> Any:
+        """Return the snapshot for ``version``, loading (and evicting) as needed.
+
+        Safe to call from worker threads; concurrent requests for a version
+        that is not resident yet share one load.
+        """
+        with self._lock:
+            snapshot = self._touch(version)
+            if snapshot is not None:
+                return snapshot
+            loading = self._loading.setdefault(version, threading.Lock())
+
+        with loading:
+            with self._lock:
+                snapshot = self._touch(version)
+                if snapshot is not None:
+                    return snapshot
+            # only names found by listing the directory are accepted, so a
+            # header value can never point outside the models root
+            if version not in self.versions():
+                with self._lock:
+                    self._loading.pop(version, None)
+                raise UnknownModelVersion(f"unknown model version '{version}'")
+
+            started = time.perf_counter()
+            snapshot = self._load(version, os.path.join(self.base, version))
+            log.info("[REGISTRY] loaded %s/%s in %.3fs", self.name, version, time.perf_counter() - started)
+
+            with self._lock:
+                self._resident[version] = snapshot
+                self.last_used[version] = time.time()
+                self.loads += 1
+                while len(self._resident) > self.max_resident:
+                    old, _ = self._resident.popitem(last=False)
+                    self.evictions += 1
+                    log.info("[REGISTRY] evicted %s/%s", self.name, old)
+                self._loading.pop(version, None)
+        return snapshot
+
+    def _touch(self, version: str) -> Optional[Any]:
+        snapshot = self._resident.get(version)
+        if snapshot is not None:
+            self._resident.move_to_end(version)
+            self.last_used[version] = time.time()
+            self.hits += 1
+        return snapshot
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            resident = list(self._resident)
+        return {
+            "name": self.name,
+            "root": self.root,
+            "max_resident": self.max_resident,
+            "resident": resident,
+            "hits": self.hits,
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
+
+    def describe(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            resident = set(self._resident)
+            last_used = dict(self.last_used)
+        return [
+            {"version": v, "resident": v in resident, "last_used_at": last_used.get(v) if v in resident else None}
+            for v in self.versions()
+        ]
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+# No xgbapi imports: api/predict_model.py loads this module from its own path.
+
+PEER_WINDOWS = (5, 10, 14, 30, 60, 120, 365)  # harvest_end within asof - N days
+PEER_DOY_RADIUS = 14
+_DOY_SLOTS = 367  # 0 (always empty, the prefix-sum origin) .. 366
+# channels of every (group, plant DOY, window) cell
+_COUNT, _YIELD_SUM, _YIELD_N, _DAYS_SUM = range(4)
+
+
+def _to_date(value: Any) -> Optional[date]:
+    if value is None or isinstance(value, date) and not isinstance(value, datetime):
+        return value
+    if isinstance(value, datetime):
+        return value.date()
+    return date.fromisoformat(str(value)[:10])
+
+
+def _doy(d: date) -> int:
+    return d.timetuple().tm_yday
+
+
+class PeerIndex:
+    """findRecentPeerStats for every target of one asof, without scanning the history per target.
+
+    Finished cycles (bed present, harvest_start / harvest_end / plant_date set,
+    harvest_end <= asof) are binned by group, plant DOY and the smallest
+    :data:`PEER_WINDOWS` entry their harvest_end falls in. Counts and sums are
+    then accumulated along the window axis (a cycle finished 8 days ago
+    belongs to every window from 10 days up) and prefix-summed along the DOY
+    axis, so the circular ``±PEER_DOY_RADIUS`` DOY filter is at most three
+    range differences. Each target resolves the whole strict / relaxed window
+    cascade from one ``(windows, channels)`` slice.
+
+    Row 0 of the table holds every group (the relaxed queries), rows
+    ``1..G`` one group each, and a last all-zero row stands in for an
+    unknown or NULL group (``b.group_type = ?`` never matches NULL).
+
+    ``rows`` need ``has_bed``, ``group_type``, ``plant_date``,
+    ``harvest_start``, ``harvest_end`` and ``total_yield`` (the cycle's
+    SUM(harvest_kg)); cycles without a harvest_start / harvest_end are ignored.
+    """
+
+    def __init__(self, asof: Any, rows: Iterable[Mapping[str, Any]]) -> None:
+        self.asof = _to_date(asof)
+        if self.asof is None:
+            raise ValueError("asof is required")
+        asof_ord = self.asof.toordinal()
+        self._codes: Dict[Any, int] = {}
+        windows = np.array(PEER_WINDOWS, dtype=np.int64)
+
+        cells = []  # (group code, plant DOY, window slot, total_yield or NaN, days)
+        fallback = [0, 0.0, 0, 0.0, 0]  # rows, yield sum / n, days sum / n
+        for r in rows:
+            start, end = _to_date(r.get("harvest_start")), _to_date(r.get("harvest_end"))
+            if start is None or end is None:
+                continue
+            plant = _to_date(r.get("plant_date"))
+            total = r.get("total_yield")
+            days = (start - plant).days if plant is not None else None
+            fallback[0] += 1
+            if total is not None:
+                fallback[1] += float(total)
+                fallback[2] += 1
+            if days is not None:
+                fallback[3] += days
+                fallback[4] += 1
+            if not r.get("has_bed") or plant is None:
+                continue
+            age = asof_ord - end.toordinal()
+            if age < 0 or age > PEER_WINDOWS[-1]:
+                continue
+            group = r.get("group_type")
+            code = self._codes.setdefault(group, len(self._codes) + 1) if group is not None else 0
+            slot = int(np.searchsorted(windows, age, side="left"))
+            cells.append((code, _doy(plant), slot, np.nan if total is None else float(total), days))
+
+        self.rows = len(cells)
+        self._fallback = self._means(*fallback)
+        self._none = len(self._codes) + 1
+        table = np.zeros((self._none + 1, _DOY_SLOTS, len(PEER_WINDOWS), 4), dtype=np.float64)
+        if cells:
+            code, doy, slot, total, days = (np.array(col) for col in zip(*cells))
+            has_yield = ~np.isnan(total)
+            values = np.stack(
+                [np.ones(len(cells)), np.where(has_yield, total, 0.0), has_yield.astype(np.float64), days.astype(np.float64)],
+                axis=1,
+            )
+            named = code > 0
+            np.add.at(table, (code[named], doy[named], slot[named]), values[named])
+            np.add.at(table, (np.zeros_like(code), doy, slot), values)  # every group
+            np.cumsum(table, axis=2, out=table)
+            np.cumsum(table, axis=1, out=table)
+        self._table = table
+
+    @staticmethod
+    def _means(rows: int, yield_sum: float, yield_n: int, days_sum: float, days_n: int) -> Tuple[float, float, int]:
+        # AVG, then PHP's (float) cast: NULL becomes 0.0
+        return (
+            yield_sum / yield_n if yield_n else 0.0,
+            days_sum / days_n if days_n else 0.0,
+            int(rows),
+        )
+
+    def _window_sums(self, rows: np.ndarray, doys: np.ndarray) -> np.ndarray:
+        """(targets, windows, channels) sums over plant DOYs within the circular radius."""
+        # min(|d - t|, 365 - |d - t|) <= R  <=>  |d - t| <= R  or  |d - t| >= 365 - R
+        far = 365 - PEER_DOY_RADIUS
+        ranges = (
+            (np.maximum(doys - PEER_DOY_RADIUS, 1), np.minimum(doys + PEER_DOY_RADIUS, _DOY_SLOTS - 1)),
+            (np.ones_like(doys), np.maximum(doys - far, 0)),  # empty unless the target is late in the year
+            (np.minimum(doys + far, _DOY_SLOTS), np.full_like(doys, _DOY_SLOTS - 1)),  # ... early in the year
+        )
+        out = np.zeros((len(doys), len(PEER_WINDOWS), 4), dtype=np.float64)
+        for lo, hi in ranges:
+            out += self._table[rows, hi] - self._table[rows, lo - 1]
+        return out
+
+    def lookup_many(
+        self,
+        groups: Sequence[Any],
+        plant_dates: Sequence[Any],
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(peer_mean_total, peer_mean_days, k) for every target, aligned with the inputs."""
+        m = len(groups)
+        doys = np.array([_doy(_to_date(d)) for d in plant_dates], dtype=np.int64)
+        codes = np.array(
+            [self._codes.get(g, self._none) if g is not None else self._none for g in groups],
+            dtype=np.int64,
+        )
+        relaxed = self._window_sums(np.zeros(m, dtype=np.int64), doys)
+        strict = self._window_sums(codes, doys)
+
+        # the first window with any peer; strict ⊆ relaxed, so an earlier strict hit is impossible
+        found = relaxed[:, :, _COUNT] > 0
+        slot = found.argmax(axis=1)
+        at = np.arange(m)
+        use_strict = strict[at, slot, _COUNT] > 0
+        pick = np.where(use_strict[:, None], strict[at, slot], relaxed[at, slot])
+
+        count = pick[:, _COUNT]
+        yield_n = pick[:, _YIELD_N]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            totals = np.where(yield_n > 0, pick[:, _YIELD_SUM] / np.maximum(yield_n, 1), 0.0)
+            days = np.where(count > 0, pick[:, _DAYS_SUM] / np.maximum(count, 1), 0.0)
+        k = count.astype(np.int64)
+
+        hit = found.any(axis=1)
+        fb_total, fb_days, fb_k = self._fallback
+        return (
+            np.where(hit, totals, fb_total),
+            np.where(hit, days, fb_days),
+            np.where(hit, k, fb_k),
+        )
+
+    def lookup(self, group: Any, plant_date: Any) -> Tuple[float, float, int]:
+        totals, days, k = self.lookup_many([group], [plant_date])
+        return float(totals[0]), float(days[0]), int(k[0])
+
+    def info(self) -> Dict[str, Any]:
+        return {"asof": self.asof.isoformat(), "rows": self.rows, "groups": len(self._codes)}
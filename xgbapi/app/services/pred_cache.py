@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+Value = Tuple[float, ...]
+ComputeFn = Callable[[List[int]], Awaitable[Sequence[np.ndarray]]]
+
+
+@functools.lru_cache(maxsize=16)
+def _salt(signature: str, kind: str) -> bytes:
+    return hashlib.blake2b(f"{kind}|{signature}".encode("utf-8"), digest_size=32).digest()
+
+
+class PredictionCache:
+    """Per-row LRU/TTL cache of model outputs with single-flight deduplication.
+
+    Keys are a keyed BLAKE2b digest of the row's bytes in feature order; the
+    key is derived from the artifact signature, so a model reload never serves
+    stale values. Concurrent lookups of a row that is already being computed
+    wait for that computation instead of starting another one.
+    Only used from the event loop thread, hence no locking.
+    """
+
+    def __init__(self, max_entries: int = 50000, ttl_sec: float = 600.0) -> None:
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl_sec)
+        self._data: "OrderedDict[bytes, Tuple[float, Value]]" = OrderedDict()
+        self._inflight: Dict[bytes, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def keys(self, signature: str, kind: str, X: np.ndarray) -> List[bytes]:
+        """Row keys for ``X``; safe to call from a worker thread."""
+        salt = _salt(signature, kind)
+        X = np.ascontiguousarray(X)
+        return [hashlib.blake2b(row.tobytes(), digest_size=16, key=salt).digest() for row in X]
+
+    def _get(self, key: bytes, now: float):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < now:
+            del self._data[key]
+            self.expired += 1
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def _put(self, key: bytes, value: Value, now: float) -> None:
+        self._data[key] = (now + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    async def resolve(self, keys: List[bytes], compute: ComputeFn) -> List[Value]:
+        """Return one value tuple per key; ``compute(idx)`` scores only the uncached rows.
+
+        ``compute`` receives row positions and must return output arrays aligned
+        with them (e.g. ``(days, yields)``).
+        """
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        results: List[Any] = [None] * len(keys)
+        waits: List[Tuple[int, asyncio.Future]] = []
+        owned: List[Tuple[int, asyncio.Future]] = []
+        for i, key in enumerate(keys):
+            value = self._get(key, now)
+            if value is not None:
+                self.hits += 1
+                results[i] = value
+                continue
+            fut = self._inflight.get(key)
+            if fut is not None:
+                # same row in flight (another request or a duplicate in this one)
+                self.shared += 1
+                waits.append((i, fut))
+                continue
+            self.misses += 1
+            fut = loop.create_future()
+            self._inflight[key] = fut
+            owned.append((i, fut))
+
+        if owned:
+            try:
+                outputs = await compute([i for i, _ in owned])
+            except BaseException as exc:
+                err = exc if isinstance(exc, Exception) else RuntimeError("prediction cancelled")
+                for i, fut in owned:
+                    self._inflight.pop(keys[i], None)
+                    if not fut.done():
+                        fut.set_exception(err)
+                        fut.exception()  # mark retrieved when nobody else is waiting
+                raise
+            now = time.monotonic()
+            for pos, (i, fut) in enumerate(owned):
+                value = tuple(float(out[pos]) for out in outputs)
+                self._inflight.pop(keys[i], None)
+                self._put(keys[i], value, now)
+                results[i] = value
+                if not fut.done():
+                    fut.set_result(value)
+
+        for i, fut in waits:
+            results[i] = await fut
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.shared
+        return {
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "ttl_sec": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self.shared,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "inflight": len(self._inflight),
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+        }
@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import logging
+import math
+import numbers
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+log = logging.getLogger("xgbapi.preproc_plan")
+
+
+class Unsupported(Exception):
+    """The preprocessor contains a step :func:`build` cannot compile."""
+
+
+def _work_copy(X: np.ndarray) -> np.ndarray:
+    # sklearn keeps float32/float64 input as is and converts anything else to float64
+    return np.array(X, dtype=X.dtype if X.dtype.kind == "f" else np.float64)
+
+
+class _Identity:
+    summary = "passthrough"
+
+    def __call__(self, X: np.ndarray) -> np.ndarray:
+        return X
+
+
+class _Impute:
+    """SimpleImputer.transform: replace ``missing`` with the fitted statistics."""
+
+    def __init__(self, fill: np.ndarray, keep: Optional[np.ndarray], missing: float) -> None:
+        self.fill = fill
+        self.keep = keep
+        self.missing = missing
+        self.summary = "SimpleImputer"
+
+    def __call__(self, X: np.ndarray) -> np.ndarray:
+        X = _work_copy(X if self.keep is None else X[:, self.keep])
+        mask = np.isnan(X) if math.isnan(self.missing) else X == self.missing
+        np.copyto(X, self.fill, where=mask)
+        return X
+
+
+class _Elementwise:
+    """In-place column-wise arithmetic in the scaler's own order of operations.
+
+    ``cast`` rounds the fitted statistics to the input dtype first, as
+    StandardScaler does (the other scalers operate with float64 statistics).
+    """
+
+    _OPS = {"sub": np.subtract, "div": np.divide, "mul": np.multiply, "add": np.add}
+
+    def __init__(self, name: str, ops: Sequence[Tuple[str, Any]], cast: bool = False) -> None:
+        self.summary = name
+        self.ops = list(ops)
+        self.cast = cast
+
+    def __call__(self, X: np.ndarray) -> np.ndarray:
+        X = _work_copy(X)
+        for op, arg in self.ops:
+            if op == "clip":
+                np.clip(X, arg[0], arg[1], out=X)
+            else:
+                self._OPS[op](X, arg.astype(X.dtype) if self.cast else arg, out=X, casting="unsafe")
+        return X
+
+
+class _Chain:
+    def __init__(self, nodes: List[Any]) -> None:
+        self.nodes = nodes
+        self.summary = "Pipeline[" + ",".join(n.summary for n in nodes) + "]"
+
+    def __call__(self, X: np.ndarray) -> np.ndarray:
+        for node in self.nodes:
+            X = node(X)
+        return X
+
+
+class _Columns:
+    """ColumnTransformer.transform: run each branch on its columns and hstack."""
+
+    def __init__(self, parts: List[Tuple[np.ndarray, Any]]) -> None:
+        self.parts = parts
+        self.summary = "ColumnTransformer[" + ",".join(f"{n.summary}({len(i)})" for i, n in parts) + "]"
+
+    def __call__(self, X: np.ndarray) -> np.ndarray:
+        return np.hstack([node(X[:, idx]) for idx, node in self.parts])
+
+
+class PreprocPlan:
+    """A fitted sklearn preprocessor compiled into plain NumPy operations.
+
+    ``transform`` takes the request matrix in feature-order columns (the ones
+    the original pipeline was given as a DataFrame) and returns the same
+    array ``preproc.transform`` would, without building a DataFrame or going
+    through sklearn's input validation.
+    """
+
+    def __init__(self, root: Any, n_features: int) -> None:
+        self.root = root
+        self.n_features = int(n_features)
+        self.summary = root.summary
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"preproc plan expects {self.n_features} columns, got shape {X.shape}")
+        return self.root(X)
+
+
+# ----- builders -----
+def _output_config(est: Any) -> Optional[str]:
+    cfg = getattr(est, "_sklearn_output_config", None) or {}
+    return cfg.get("transform")
+
+
+def _column_indices(spec: Any, names: List[str]) -> np.ndarray:
+    n = len(names)
+    pos = {c: i for i, c in enumerate(names)}
+    if callable(spec):
+        raise Unsupported("callable column selector")
+    if isinstance(spec, slice):
+        if isinstance(spec.start, str) or isinstance(spec.stop, str):
+            start = pos[spec.start] if spec.start is not None else 0
+            stop = pos[spec.stop] + 1 if spec.stop is not None else n  # label slices are inclusive
+            return np.arange(start, stop, dtype=np.intp)
+        return np.arange(n, dtype=np.intp)[spec]
+    if isinstance(spec, (str, numbers.Integral)):
+        spec = [spec]
+    items = list(spec)
+    if not items:
+        return np.empty(0, dtype=np.intp)
+    if all(isinstance(v, (bool, np.bool_)) for v in items):
+        if len(items) != n:
+            raise Unsupported("boolean column mask does not match the input width")
+        return np.flatnonzero(np.asarray(items, dtype=bool))
+    if all(isinstance(v, numbers.Integral) for v in items):
+        return np.asarray([int(v) % n for v in items], dtype=np.intp)
+    try:
+        return np.asarray([pos[str(v)] for v in items], dtype=np.intp)
+    except KeyError as exc:
+        raise Unsupported(f"column {exc.args[0]!r} is not in the feature order") from exc
+
+
+def _build_imputer(est: Any) -> _Impute:
+    if getattr(est, "add_indicator", False):
+        raise Unsupported("SimpleImputer(add_indicator=True)")
+    missing = est.missing_values
+    if not isinstance(missing, numbers.Real) or isinstance(missing, bool):
+        raise Unsupported(f"SimpleImputer(missing_values={missing!r})")
+    stats = np.asarray(est.statistics_)
+    if stats.dtype.kind not in "fiu":
+        raise Unsupported("SimpleImputer with non-numeric statistics")
+    stats = stats.astype(np.float64)
+    keep = None
+    if est.strategy != "constant" and not getattr(est, "keep_empty_features", False):
+        valid = ~np.isnan(stats)
+        if not valid.all():  # all-missing columns seen at fit time are dropped
+            keep = np.flatnonzero(valid)
+            stats = stats[keep]
+    return _Impute(stats[None, :], keep, float(missing))
+
+
+def _build_estimator(est: Any) -> Any:
+    from sklearn.compose import ColumnTransformer
+    from sklearn.impute import SimpleImputer
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import FunctionTransformer, MaxAbsScaler, MinMaxScaler, RobustScaler, StandardScaler
+
+    if est is None or (isinstance(est, str) and est == "passthrough"):
+        return _Identity()
+    if _output_config(est) not in (None, "default"):
+        raise Unsupported(f"{type(est).__name__} with set_output(transform={_output_config(est)!r})")
+
+    # exact type checks: subclasses may override transform
+    kind = type(est)
+    if kind is Pipeline:
+        nodes = [_build_estimator(step) for _, step in est.steps]
+        nodes = [n for n in nodes if not isinstance(n, _Identity)]
+        return _Chain(nodes) if nodes else _Identity()
+    if kind is ColumnTransformer:
+        return _build_column_transformer(est)
+    if kind is SimpleImputer:
+        return _build_imputer(est)
+    if kind is StandardScaler:
+        ops = []
+        if est.with_mean and est.mean_ is not None:
+            ops.append(("sub", np.asarray(est.mean_, dtype=np.float64)))
+        if est.with_std and est.scale_ is not None:
+            ops.append(("div", np.asarray(est.scale_, dtype=np.float64)))
+        return _Elementwise("StandardScaler", ops, cast=True)
+    if kind is RobustScaler:
+        ops = []
+        if est.with_centering and est.center_ is not None:
+            ops.append(("sub", np.asarray(est.center_, dtype=np.float64)))
+        if est.with_scaling and est.scale_ is not None:
+            ops.append(("div", np.asarray(est.scale_, dtype=np.float64)))
+        return _Elementwise("RobustScaler", ops)
+    if kind is MinMaxScaler:
+        ops: List[Tuple[str, Any]] = [
+            ("mul", np.asarray(est.scale_, dtype=np.float64)),
+            ("add", np.asarray(est.min_, dtype=np.float64)),
+        ]
+        if getattr(est, "clip", False):
+            ops.append(("clip", tuple(est.feature_range)))
+        return _Elementwise("MinMaxScaler", ops)
+    if kind is MaxAbsScaler:
+        ops = [("div", np.asarray(est.scale_, dtype=np.float64))]
+        if getattr(est, "clip", False):
+            ops.append(("clip", (-1.0, 1.0)))
+        return _Elementwise("MaxAbsScaler", ops)
+    if kind is FunctionTransformer and est.func is None:
+        return _Identity()
+    raise Unsupported(type(est).__name__)
+
+
+def _build_column_transformer(ct: Any) -> _Columns:
+    if getattr(ct, "sparse_output_", False):
+        raise Unsupported("ColumnTransformer with sparse output")
+    names = [str(c) for c in getattr(ct, "feature_names_in_", [])] or None
+    if names is None:
+        raise Unsupported("ColumnTransformer fitted without feature names")
+    parts: List[Tuple[np.ndarray, Any]] = []
+    for _, trans, spec in ct.transformers_:
+        if isinstance(trans, str) and trans == "drop":
+            continue
+        idx = _column_indices(spec, names)
+        if idx.size == 0:
+            continue  # sklearn skips empty selections as well
+        parts.append((idx, _build_estimator(trans)))
+    if not parts:
+        raise Unsupported("ColumnTransformer without output columns")
+    return _Columns(parts)
+
+
+def build(preproc: Any, columns: Sequence[str]) -> PreprocPlan:
+    """Compile ``preproc`` for input matrices whose columns are ``columns``.
+
+    Raises :class:`Unsupported` for anything other than (nested) Pipelines and
+    ColumnTransformers of imputers, scalers and passthrough columns.
+    """
+    columns = [str(c) for c in columns]
+    fitted_names = getattr(preproc, "feature_names_in_", None)
+    root = _build_estimator(preproc)
+    if fitted_names is not None:
+        fitted = [str(c) for c in fitted_names]
+        if fitted != columns:
+            # a ColumnTransformer selects by name, anything else is positional
+            missing = [c for c in fitted if c not in columns]
+            if missing or not isinstance(root, _Columns):
+                raise Unsupported("feature order differs from the preprocessor's input columns")
+            pos = {c: i for i, c in enumerate(columns)}
+            root.parts = [(np.asarray([pos[fitted[i]] for i in idx], dtype=np.intp), node) for idx, node in root.parts]
+    return PreprocPlan(root, len(columns))
+
+
+def _parity_matrix(n_features: int, rows: int, dtype: Any) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    X = rng.normal(0.0, 50.0, size=(rows, n_features))
+    X[rng.random(X.shape) < 0.15] = np.nan
+    X[0] = 0.0
+    X[1] = np.nan
+    return X.astype(dtype)
+
+
+def compile_plan(
+    preproc: Any,
+    columns: Sequence[str],
+    reference: Callable[[np.ndarray], Any],
+    dtype: Any = np.float64,
+    rows: int = 256,
+    rtol: float = 1e-9,
+    atol: float = 1e-12,
+) -> Optional[PreprocPlan]:
+    """Build a :class:`PreprocPlan` and verify it against ``reference(X)``.
+
+    ``reference`` is the sklearn path the plan replaces. Returns None (the
+    sklearn pipeline keeps being used) when a step is not supported or the
+    outputs differ.
+    """
+    name = type(preproc).__name__
+    try:
+        plan = build(preproc, columns)
+    except Unsupported as exc:
+        log.info("[PREPROC_PLAN] %s: sklearn transform only (%s)", name, exc)
+        return None
+    except Exception:
+        log.exception("[PREPROC_PLAN] failed to compile %s", name)
+        return None
+
+    X = _parity_matrix(plan.n_features, rows, dtype)
+    try:
+        expected = reference(X)
+        if hasattr(expected, "toarray"):
+            log.info("[PREPROC_PLAN] %s: sklearn transform only (sparse output)", name)
+            return None
+        expected = np.asarray(expected)
+        got = plan.transform(X)
+    except Exception:
+        log.exception("[PREPROC_PLAN] parity check failed to run for %s", name)
+        return None
+    if (
+        expected.shape != got.shape
+        or expected.dtype != got.dtype
+        or not np.allclose(got, expected, rtol=rtol, atol=atol, equal_nan=True)
+    ):
+        same = expected.shape == got.shape
+        worst = float(np.nanmax(np.abs(got.astype(np.float64) - expected.astype(np.float64)))) if same else float("nan")
+        log.warning("[PREPROC_PLAN] %s parity check failed (shape %s vs %s, dtype %s vs %s, max abs diff %.3g); "
+                    "using sklearn transform", name, got.shape, expected.shape, got.dtype, expected.dtype, worst)
+        return None
+    log.info("[PREPROC_PLAN] %s compiled: %s -> %d outputs", name, plan.summary, got.shape[1])
+    return plan
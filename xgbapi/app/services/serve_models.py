@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Union
+
+import numpy as np
+
+# The JSON "serve" models scored by lib/predict_ridge.php and lib/predict_hgb_plant.php,
+# evaluated for many feature rows at once with the same arithmetic order.
+
+# the PHP app root (holding models/ and ml/artifacts/); xgbapi/ normally sits inside it
+REPO_ROOT = Path(os.getenv("SERVE_MODELS_ROOT") or Path(__file__).resolve().parents[3])
+SERVE_DIRS = (REPO_ROOT / "models", REPO_ROOT / "ml" / "artifacts")
+
+Prediction = Dict[str, Any]
+
+
+class ServeModelError(RuntimeError):
+    """A serve JSON is missing or malformed."""
+
+
+def php_round(value: float, digits: int = 3) -> float:
+    # PHP round(): half away from zero (Python's round() is half to even)
+    scale = 10.0 ** digits
+    return math.copysign(math.floor(abs(value) * scale + 0.5) / scale, value)
+
+
+def serve_path(name: str) -> Path:
+    """models/<name>, else ml/artifacts/<name> (PHP's lookup order)."""
+    for d in SERVE_DIRS:
+        if (d / name).is_file():
+            return d / name
+    return SERVE_DIRS[-1] / name
+
+
+def _load_json(path: Path, label: str) -> Dict[str, Any]:
+    if not path.is_file():
+        raise ServeModelError(f"{label} not found: {path}")
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except ValueError as exc:
+        raise ServeModelError(f"{label} invalid: {path}") from exc
+    if not isinstance(data, dict) or not data.get("feature_order"):
+        raise ServeModelError(f"{label} invalid: {path}")
+    return data
+
+
+class ServeModel:
+    """Baseline + residual model: ``pred = baseline feature + residual(x)``, clipped and rounded."""
+
+    default_id = "serve"
+
+    def __init__(self, serve: Mapping[str, Any], path: Path) -> None:
+        self.path = path
+        self.order: List[str] = list(serve["feature_order"])
+        self.model_id = str(serve.get("model_id") or self.default_id)
+        keys = serve.get("baseline_keys") or {}
+        self.baseline_days = keys.get("days")
+        self.baseline_yield = keys.get("yield")
+        clip = serve.get("clip") or {}
+        self.days_min = float(clip.get("days_min", 1))
+        self.yield_min = float(clip.get("yield_min", 0))
+
+    def _residuals(self, part: str, X: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def missing(self, row: Mapping[str, Any]) -> Optional[str]:
+        for key in self.order:
+            if key not in row:
+                return key
+        return None
+
+    def predict(self, rows: Sequence[Mapping[str, Any]]) -> List[Union[Prediction, str]]:
+        """A prediction dict per row, or the error message for rows lacking a feature."""
+        out: List[Union[Prediction, str]] = [""] * len(rows)
+        ok: List[int] = []
+        for i, row in enumerate(rows):
+            key = self.missing(row)
+            if key is None:
+                ok.append(i)
+            else:
+                out[i] = f"missing feature: {key}"
+        if not ok:
+            return out
+        X = np.array([[float(rows[i][k] or 0) for k in self.order] for i in ok], dtype=np.float64)
+        b_days = np.array([float(rows[i].get(self.baseline_days) or 0) for i in ok], dtype=np.float64)
+        b_yield = np.array([float(rows[i].get(self.baseline_yield) or 0) for i in ok], dtype=np.float64)
+        days = np.maximum(b_days + self._residuals("days", X), self.days_min)
+        yields = np.maximum(b_yield + self._residuals("yield", X), self.yield_min)
+        for j, i in enumerate(ok):
+            out[i] = {
+                "days": php_round(float(days[j])),
+                "yield": php_round(float(yields[j])),
+                "baseline_days": float(b_days[j]),
+                "baseline_yield": float(b_yield[j]),
+                "model_id": self.model_id,
+            }
+        return out
+
+
+class RidgeServe(ServeModel):
+    """ridge_serve[_mid].json: standardised linear residual."""
+
+    default_id = "ridge_v2"
+
+    def __init__(self, serve: Mapping[str, Any], path: Path) -> None:
+        super().__init__(serve, path)
+        self.parts = {}
+        for part in ("days", "yield"):
+            m = serve[part]
+            scale = np.array(m["scale"], dtype=np.float64)
+            self.parts[part] = (
+                float(m["intercept"]),
+                np.array(m["mean"], dtype=np.float64),
+                np.where(scale == 0.0, 1.0, scale),
+                np.array(m["coef"], dtype=np.float64),
+            )
+
+    def _residuals(self, part: str, X: np.ndarray) -> np.ndarray:
+        intercept, mean, scale, coef = self.parts[part]
+        s = np.full(len(X), intercept)
+        for i in range(X.shape[1]):  # feature by feature, as ridge_residual() sums
+            s += (X[:, i] - mean[i]) / scale[i] * coef[i]
+        return s
+
+
+class _Tree:
+    __slots__ = ("left", "right", "feature", "threshold", "value")
+
+    def __init__(self, nodes: Sequence[Mapping[str, Any]]) -> None:
+        self.left = np.array([int(n["left"]) for n in nodes], dtype=np.int64)
+        self.right = np.array([int(n.get("right", -1)) for n in nodes], dtype=np.int64)
+        self.feature = np.array([max(int(n.get("feature", 0)), 0) for n in nodes], dtype=np.int64)
+        self.threshold = np.array([float(n.get("threshold", 0.0)) for n in nodes], dtype=np.float64)
+        self.value = np.array([float(n.get("value", 0.0)) for n in nodes], dtype=np.float64)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        rows = np.arange(len(X))
+        idx = np.zeros(len(X), dtype=np.int64)
+        while True:
+            leaf = self.left[idx] < 0
+            if leaf.all():
+                return self.value[idx]
+            go_left = X[rows, self.feature[idx]] <= self.threshold[idx]
+            idx = np.where(leaf, idx, np.where(go_left, self.left[idx], self.right[idx]))
+
+
+class GbrServe(ServeModel):
+    """hgb_plant_serve.json: gradient-boosted trees, walked level by level for all rows."""
+
+    default_id = "hgb_plant"
+
+    def __init__(self, serve: Mapping[str, Any], path: Path) -> None:
+        super().__init__(serve, path)
+        if not (serve.get("yield") or {}).get("trees"):
+            raise ServeModelError(f"hgb_plant_serve.json invalid: {path}")
+        self.parts = {
+            part: (
+                float(serve[part]["init_score"]),
+                float(serve[part]["learning_rate"]),
+                [_Tree(t["nodes"]) for t in serve[part]["trees"]],
+            )
+            for part in ("days", "yield")
+        }
+
+    def _residuals(self, part: str, X: np.ndarray) -> np.ndarray:
+        init, lr, trees = self.parts[part]
+        s = np.full(len(X), init)
+        for tree in trees:  # same accumulation order as gbr_ensemble_predict()
+            s += lr * tree.predict(X)
+        return s
+
+
+def load_ridge(variant: str = "plant") -> RidgeServe:
+    """load_ridge_serve: ridge_serve_mid.json for 'mid' (plant's file if absent), else ridge_serve.json."""
+    name = "ridge_serve_mid.json" if variant == "mid" else "ridge_serve.json"
+    path = REPO_ROOT / "models" / name
+    if not path.is_file() and variant == "mid":
+        path = REPO_ROOT / "models" / "ridge_serve.json"
+    if not path.is_file():
+        path = REPO_ROOT / "ml" / "artifacts" / name
+    return RidgeServe(_load_json(path, "ridge serve json"), path)
+
+
+def load_gbr_plant() -> GbrServe:
+    path = serve_path("hgb_plant_serve.json")
+    return GbrServe(_load_json(path, "hgb_plant_serve.json"), path)
+
+
+def predict_rows(rows: Sequence[Mapping[str, Any]], variant: str = "plant") -> List[Union[Prediction, str]]:
+    """rebuild_and_predict_cycle's model step for many rows.
+
+    'plant' scores with the boosted trees and falls back to the plant ridge
+    (``model_id`` + ``_fallback``) for rows the trees cannot score; 'mid'
+    scores with the mid ridge. Entries are predictions or error messages.
+    """
+    if variant != "plant":
+        try:
+            return load_ridge("mid").predict(rows)
+        except ServeModelError as exc:
+            return [str(exc)] * len(rows)
+    try:
+        out = load_gbr_plant().predict(rows)
+    except (ServeModelError, KeyError, TypeError, ValueError):
+        out = [""] * len(rows)
+    retry = [i for i, p in enumerate(out) if not isinstance(p, dict)]
+    if retry:
+        try:
+            ridge = load_ridge("plant")
+        except ServeModelError as exc:
+            for i in retry:
+                out[i] = str(exc)
+            return out
+        for i, p in zip(retry, ridge.predict([rows[i] for i in retry])):
+            if isinstance(p, dict):
+                p["model_id"] = p["model_id"] + "_fallback"
+            out[i] = p
+    return out
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+log = logging.getLogger("xgbapi.shadow")
+
+ShadowScoreFn = Callable[[Any, List[str], np.ndarray], Tuple[np.ndarray, ...]]
+
+
+class _DeltaStats:
+    """Running |shadow - primary| statistics for one output."""
+
+    __slots__ = ("n", "sum_abs", "sum_sq", "sum_signed", "max_abs")
+
+    def __init__(self) -> None:
+        self.n = 0
+        self.sum_abs = 0.0
+        self.sum_sq = 0.0
+        self.sum_signed = 0.0
+        self.max_abs = 0.0
+
+    def update(self, primary: np.ndarray, shadow: np.ndarray) -> None:
+        d = np.asarray(shadow, dtype=np.float64) - np.asarray(primary, dtype=np.float64)
+        if d.size == 0:
+            return
+        a = np.abs(d)
+        self.n += int(d.size)
+        self.sum_abs += float(a.sum())
+        self.sum_sq += float(np.dot(d, d))
+        self.sum_signed += float(d.sum())
+        self.max_abs = max(self.max_abs, float(a.max()))
+
+    def as_dict(self) -> Dict[str, Any]:
+        if not self.n:
+            return {"rows": 0, "mae": None, "rmse": None, "mean_delta": None, "max_abs_delta": None}
+        return {
+            "rows": self.n,
+            "mae": self.sum_abs / self.n,
+            "rmse": (self.sum_sq / self.n) ** 0.5,
+            "mean_delta": self.sum_signed / self.n,
+            "max_abs_delta": self.max_abs,
+        }
+
+
+class ShadowScorer:
+    """Score live traffic with a candidate model off the request path.
+
+    ``submit`` only enqueues work on a dedicated single-thread executor and
+    returns immediately; the primary response never waits for it. When more
+    than ``max_pending`` batches are queued further ones are dropped (and
+    counted) rather than building a backlog. ``load()`` is called once, on the
+    shadow thread, to obtain the candidate snapshot; ``score(snapshot,
+    columns, X)`` returns outputs aligned with ``outputs``.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        load: Callable[[], Any],
+        score: ShadowScoreFn,
+        outputs: Sequence[str] = ("days", "yield"),
+        sample_rate: float = 1.0,
+        max_pending: int = 8,
+    ) -> None:
+        self.name = name
+        self._load = load
+        self._score = score
+        self.outputs = tuple(outputs)
+        self.sample_rate = min(1.0, max(0.0, float(sample_rate)))
+        self.max_pending = max(1, int(max_pending))
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+        self._snapshot: Any = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._deltas = {name: _DeltaStats() for name in self.outputs}
+        self.batches = 0
+        self.dropped = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.last_error: Optional[str] = None
+
+    def submit(self, columns: List[str], X: np.ndarray, primary: Sequence[np.ndarray]) -> bool:
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.dropped += 1
+                return False
+            self._pending += 1
+        try:
+            self._executor.submit(self._run, columns, X, tuple(primary))
+        except RuntimeError:  # executor shut down
+            with self._lock:
+                self._pending -= 1
+            return False
+        return True
+
+    def _run(self, columns: List[str], X: np.ndarray, primary: Tuple[np.ndarray, ...]) -> None:
+        try:
+            if self._snapshot is None:
+                self._snapshot = self._load()
+            started = time.perf_counter()
+            shadow = self._score(self._snapshot, columns, X)
+            with self._lock:
+                for name, p, s in zip(self.outputs, primary, shadow):
+                    self._deltas[name].update(p, s)
+                self.batches += 1
+                self.seconds += time.perf_counter() - started
+        except Exception as exc:
+            with self._lock:
+                self.errors += 1
+                self.last_error = f"{type(exc).__name__}: {exc}"
+            log.warning("[SHADOW] scoring failed: %s", exc)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "model": self.name,
+                "loaded": self._snapshot is not None,
+                "sample_rate": self.sample_rate,
+                "batches": self.batches,
+                "pending": self._pending,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "last_error": self.last_error,
+                "avg_batch_ms": round(1000.0 * self.seconds / self.batches, 3) if self.batches else None,
+                "deltas": {name: d.as_dict() for name, d in self._deltas.items()},
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
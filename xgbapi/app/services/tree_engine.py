@@ -0,0 +1,341 @@
+from __future__ import annotations
+
+import json
+import logging
+import math
+from typing import Any, Callable, List, Optional, Tuple
+
+import numpy as np
+
+log = logging.getLogger("xgbapi.tree_engine")
+
+# Objectives whose prediction is the raw margin (identity link)
+_XGB_IDENTITY_OBJECTIVES = {
+    "reg:squarederror",
+    "reg:linear",
+    "reg:absoluteerror",
+    "reg:pseudohubererror",
+    "reg:squaredlogerror",
+    "reg:quantileerror",
+}
+
+
+class Unsupported(Exception):
+    """The model cannot be represented by :class:`FlatForest`."""
+
+
+class FlatForest:
+    """A tree ensemble flattened into contiguous node arrays.
+
+    All trees share one set of arrays (``feature``, ``threshold``, ``left``,
+    ``right``, ``value``, ``default_left``); ``roots`` holds each tree's first
+    node. Leaves point to themselves, so a batch is evaluated by advancing an
+    ``(n_rows, n_trees)`` matrix of node ids ``depth`` times with vectorized
+    gathers, then summing the leaf values. ``strict`` selects XGBoost's
+    ``x < threshold`` over scikit-learn's ``x <= threshold``; NaN follows
+    ``default_left``. Leaf values (pre-multiplied by ``scale``) are added to
+    ``base`` one tree at a time in ``output_dtype``, the order the native
+    predictors use, so results match them bit for bit.
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        n_features: int,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        value: np.ndarray,
+        default_left: np.ndarray,
+        roots: np.ndarray,
+        depth: int,
+        base: float,
+        scale: float = 1.0,
+        strict: bool = False,
+        input_dtype: Any = np.float32,
+        output_dtype: Any = np.float64,
+        link: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+    ) -> None:
+        self.kind = kind
+        self.n_features = int(n_features)
+        self.feature = np.ascontiguousarray(feature, dtype=np.intp)
+        self.threshold = np.ascontiguousarray(threshold, dtype=input_dtype)
+        self.left = np.ascontiguousarray(left, dtype=np.intp)
+        self.right = np.ascontiguousarray(right, dtype=np.intp)
+        self.value = np.ascontiguousarray(np.asarray(value, dtype=np.float64) * scale, dtype=output_dtype)
+        self.default_left = np.ascontiguousarray(default_left, dtype=bool)
+        self.roots = np.ascontiguousarray(roots, dtype=np.intp)
+        self.depth = int(depth)
+        self.base = float(base)
+        self.scale = float(scale)
+        self.strict = bool(strict)
+        self.input_dtype = np.dtype(input_dtype)
+        self.output_dtype = np.dtype(output_dtype)
+        self.link = link
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.feature)
+
+    def predict(self, X: Any) -> np.ndarray:
+        X = np.asarray(X, dtype=self.input_dtype)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"expected {self.n_features} features, got shape {X.shape}")
+        n = X.shape[0]
+        flat = np.ascontiguousarray(X).ravel()
+        row_offset = (np.arange(n, dtype=np.intp) * self.n_features)[:, None]
+        has_missing = bool(np.isnan(flat).any())
+        less = np.less if self.strict else np.less_equal
+        node = np.broadcast_to(self.roots, (n, self.n_trees)).copy()
+        for _ in range(self.depth):
+            x = flat[row_offset + self.feature[node]]
+            go_left = less(x, self.threshold[node])
+            if has_missing:
+                missing = np.isnan(x)
+                go_left = np.where(missing, self.default_left[node], go_left)
+            node = np.where(go_left, self.left[node], self.right[node])
+        terms = np.empty((n, self.n_trees + 1), dtype=self.output_dtype)
+        terms[:, 0] = self.base
+        terms[:, 1:] = self.value[node]
+        raw = terms.cumsum(axis=1)[:, -1]  # sequential, unlike the pairwise sum()
+        if self.link is not None:
+            raw = self.link(raw)
+        return raw
+
+    def split_thresholds(self) -> List[np.ndarray]:
+        """Thresholds used per feature (for building parity-check inputs)."""
+        internal = self.left != np.arange(self.n_nodes)
+        feats, thr = self.feature[internal], self.threshold[internal].astype(np.float64)
+        return [thr[feats == f] for f in range(self.n_features)]
+
+
+# ----------------------------------------------------------------------------
+# Builders
+# ----------------------------------------------------------------------------
+_Tree = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+
+def _tree_depth(left: np.ndarray, right: np.ndarray, is_leaf: np.ndarray) -> int:
+    depth, stack = 0, [(0, 0)]
+    while stack:
+        i, d = stack.pop()
+        if is_leaf[i]:
+            depth = max(depth, d)
+        else:
+            stack.append((int(left[i]), d + 1))
+            stack.append((int(right[i]), d + 1))
+    return depth
+
+
+def _assemble(trees: List[_Tree], n_features: int, **kwargs: Any) -> FlatForest:
+    """Concatenate per-tree local arrays ``(feature, threshold, left, right,
+    value, default_left, is_leaf)`` into one :class:`FlatForest`."""
+    if not trees:
+        raise Unsupported("model has no trees")
+    parts: List[List[np.ndarray]] = [[] for _ in range(6)]
+    roots, depth, offset = [], 0, 0
+    for feature, threshold, left, right, value, default_left, is_leaf in trees:
+        n = len(feature)
+        own = np.arange(offset, offset + n)
+        is_leaf = np.asarray(is_leaf, dtype=bool)
+        depth = max(depth, _tree_depth(left, right, is_leaf))
+        parts[0].append(np.where(is_leaf, 0, feature))
+        parts[1].append(np.where(is_leaf, 0, threshold))
+        parts[2].append(np.where(is_leaf, own, np.asarray(left) + offset))
+        parts[3].append(np.where(is_leaf, own, np.asarray(right) + offset))
+        parts[4].append(np.where(is_leaf, value, 0.0))
+        parts[5].append(np.asarray(default_left, dtype=bool))
+        roots.append(offset)
+        offset += n
+    feature, threshold, left, right, value, default_left = (np.concatenate(p) for p in parts)
+    if feature.size and (feature.min() < 0 or feature.max() >= n_features):
+        raise Unsupported("split feature index out of range")
+    return FlatForest(
+        n_features=n_features,
+        feature=feature,
+        threshold=threshold,
+        left=left,
+        right=right,
+        value=value,
+        default_left=default_left,
+        roots=np.asarray(roots),
+        depth=depth,
+        **kwargs,
+    )
+
+
+def _from_xgboost(model: Any) -> FlatForest:
+    booster = model.get_booster()
+    missing = getattr(model, "missing", np.nan)
+    if missing is not None and not (isinstance(missing, float) and math.isnan(missing)):
+        raise Unsupported(f"missing={missing!r} is not NaN")
+    cfg = json.loads(bytes(booster.save_raw(raw_format="json")))
+    learner = cfg["learner"]
+    objective = learner["objective"]["name"]
+    if objective not in _XGB_IDENTITY_OBJECTIVES:
+        raise Unsupported(f"objective {objective} has a non-identity link")
+    gbm = learner["gradient_booster"]
+    if gbm.get("name") != "gbtree":
+        raise Unsupported(f"booster {gbm.get('name')} is not gbtree")
+    params = learner["learner_model_param"]
+    if int(params.get("num_class", "0") or 0) > 1 or int(params.get("num_target", "1") or 1) > 1:
+        raise Unsupported("multi-output models are not supported")
+    base = float(str(params["base_score"]).strip("[]"))
+
+    trees_json = gbm["model"]["trees"]
+    # XGBRegressor.predict stops at best_iteration when early stopping was used
+    try:
+        best = model.best_iteration
+        per_round = int(gbm["model"]["gbtree_model_param"].get("num_parallel_tree", "1") or 1)
+        trees_json = trees_json[: (best + 1) * per_round]
+    except AttributeError:
+        pass
+
+    n_features = int(params.get("num_feature") or model.n_features_in_)
+    trees: List[_Tree] = []
+    for t in trees_json:
+        if any(int(s) != 0 for s in t.get("split_type", [])):
+            raise Unsupported("categorical splits are not supported")
+        left = np.asarray(t["left_children"], dtype=np.int64)
+        conditions = np.asarray(t["split_conditions"], dtype=np.float32)
+        trees.append((
+            np.asarray(t["split_indices"], dtype=np.int64),
+            conditions,
+            left,
+            np.asarray(t["right_children"], dtype=np.int64),
+            conditions.astype(np.float64),  # a leaf's value is stored in split_conditions
+            np.asarray(t["default_left"], dtype=bool),
+            left == -1,
+        ))
+    return _assemble(
+        trees, n_features, kind="xgboost", base=base, strict=True,
+        input_dtype=np.float32, output_dtype=np.float32,
+    )
+
+
+def _sklearn_tree(tree_: Any) -> _Tree:
+    left = np.asarray(tree_.children_left, dtype=np.int64)
+    missing_left = getattr(tree_, "missing_go_to_left", None)
+    return (
+        np.asarray(tree_.feature, dtype=np.int64),
+        np.asarray(tree_.threshold, dtype=np.float64),
+        left,
+        np.asarray(tree_.children_right, dtype=np.int64),
+        np.asarray(tree_.value[:, 0, 0], dtype=np.float64),
+        np.zeros(len(left), dtype=bool) if missing_left is None else np.asarray(missing_left, dtype=bool),
+        left == -1,
+    )
+
+
+def _from_sklearn_gbr(model: Any) -> FlatForest:
+    estimators = model.estimators_
+    if estimators.shape[1] != 1:
+        raise Unsupported("multi-output GradientBoosting is not supported")
+    n_features = int(model.n_features_in_)
+    base = float(np.ravel(model._raw_predict_init(np.zeros((1, n_features), dtype=np.float32)))[0])
+    trees = [_sklearn_tree(est.tree_) for est in estimators[:, 0]]
+    # sklearn casts X to float32 before walking the trees; thresholds stay float64
+    return _assemble(
+        trees, n_features, kind="sklearn_gbr", base=base, scale=model.learning_rate,
+        input_dtype=np.float32, output_dtype=np.float64,
+    )
+
+
+def _from_sklearn_hgb(model: Any) -> FlatForest:
+    if getattr(model, "_preprocessor", None) is not None:
+        raise Unsupported("categorical preprocessing is not supported")
+    predictors = model._predictors
+    if any(len(p) != 1 for p in predictors):
+        raise Unsupported("multi-output HistGradientBoosting is not supported")
+    n_features = int(model.n_features_in_)
+    trees: List[_Tree] = []
+    for (predictor,) in predictors:
+        nodes = predictor.nodes
+        if "is_categorical" in nodes.dtype.names and nodes["is_categorical"].any():
+            raise Unsupported("categorical splits are not supported")
+        trees.append((
+            nodes["feature_idx"].astype(np.int64),
+            nodes["num_threshold"].astype(np.float64),
+            nodes["left"].astype(np.int64),
+            nodes["right"].astype(np.int64),
+            nodes["value"].astype(np.float64),
+            nodes["missing_go_to_left"].astype(bool),
+            nodes["is_leaf"].astype(bool),
+        ))
+    link = getattr(getattr(model, "_loss", None), "link", None)
+    inverse = None
+    if link is not None and type(link).__name__ != "IdentityLink":
+        inverse = link.inverse
+    return _assemble(
+        trees, n_features, kind="sklearn_hgb", base=float(np.ravel(model._baseline_prediction)[0]),
+        input_dtype=np.float64, output_dtype=np.float64, link=inverse,
+    )
+
+
+def build(model: Any) -> FlatForest:
+    """Flatten a supported model or raise :class:`Unsupported`."""
+    name = type(model).__name__
+    if hasattr(model, "get_booster"):
+        return _from_xgboost(model)
+    if name == "GradientBoostingRegressor":
+        return _from_sklearn_gbr(model)
+    if name == "HistGradientBoostingRegressor":
+        return _from_sklearn_hgb(model)
+    raise Unsupported(f"{name} is not a supported tree ensemble")
+
+
+# ----------------------------------------------------------------------------
+# Parity check
+# ----------------------------------------------------------------------------
+def _parity_matrix(forest: FlatForest, rows: int, seed: int = 0) -> np.ndarray:
+    """Inputs that land on both sides of the model's own split points, plus NaNs."""
+    rng = np.random.default_rng(seed)
+    X = np.zeros((rows, forest.n_features), dtype=np.float64)
+    for f, thr in enumerate(forest.split_thresholds()):
+        if thr.size == 0:
+            continue
+        picks = rng.choice(thr, size=rows)
+        nudge = (np.abs(picks) * 1e-3 + 1e-3) * rng.choice((-1.0, 1.0), size=rows)
+        X[:, f] = picks + nudge
+    X[rng.random(X.shape) < 0.02] = np.nan
+    return X
+
+
+def compile_model(model: Any, rows: int = 512, rtol: float = 1e-5, atol: float = 1e-4) -> Optional[FlatForest]:
+    """Build a :class:`FlatForest` and verify it against ``model.predict``.
+
+    Returns None (native predict keeps being used) when the model type is not
+    supported or the outputs differ. Calls the native predict, so run it
+    where that is allowed (e.g. during warm-up, not in a pre-fork parent).
+    """
+    try:
+        forest = build(model)
+    except Unsupported as exc:
+        log.info("[TREE_ENGINE] %s: native predict only (%s)", type(model).__name__, exc)
+        return None
+    except Exception:
+        log.exception("[TREE_ENGINE] failed to flatten %s", type(model).__name__)
+        return None
+
+    X = _parity_matrix(forest, rows)
+    if forest.kind == "sklearn_gbr":
+        X = np.nan_to_num(X)  # GradientBoosting rejects NaN input
+    try:
+        expected = np.asarray(model.predict(X), dtype=np.float64)
+        got = forest.predict(X).astype(np.float64)
+    except Exception:
+        log.exception("[TREE_ENGINE] parity check failed to run for %s", type(model).__name__)
+        return None
+    if expected.shape != got.shape or not np.allclose(got, expected, rtol=rtol, atol=atol):
+        worst = float(np.max(np.abs(got - expected))) if expected.shape == got.shape else float("nan")
+        log.warning("[TREE_ENGINE] %s parity check failed (max abs diff %.3g); using native predict",
+                    type(model).__name__, worst)
+        return None
+    log.info("[TREE_ENGINE] %s compiled: %d trees, %d nodes, depth %d",
+             type(model).__name__, forest.n_trees, forest.n_nodes, forest.depth)
+    return forest
@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+import math
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+# No xgbapi imports: api/predict_model.py loads this module from its own path.
+
+WEATHER_INDEX_SQL = """
+SELECT date, temp_avg, temp_max, temp_min, variation
+FROM weather_daily
+ORDER BY date
+"""
+
+_RAW = ("temp_avg", "temp_max", "temp_min", "variation")
+# series aggregated with AVG / STDDEV_POP; "spread" is temp_max - temp_min
+_MEAN_SERIES = ("temp_avg", "variation", "spread")
+# stats() key -> (series, aggregate), named like the PHP / SQL aliases
+STAT_KEYS = {
+    "temp_avg_mean": ("temp_avg", "mean"),
+    "temp_max_max": ("temp_max", "max"),
+    "temp_min_min": ("temp_min", "min"),
+    "temp_avg_std": ("temp_avg", "std"),
+    "swing_avg": ("variation", "mean"),
+    "swing_std": ("variation", "std"),
+    "spread_avg": ("spread", "mean"),
+    "spread_std": ("spread", "std"),
+}
+
+DateLike = Union[date, datetime, str]
+
+_EPS = float(np.finfo(np.float64).eps)
+_VAR_ULPS = 8.0
+
+
+def _day(value: DateLike) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _float(value: Any) -> float:
+    return np.nan if value is None else float(value)
+
+
+class WeatherIndex:
+    """``weather_daily`` as day-indexed arrays with O(1) date-range statistics.
+
+    Slot ``i`` holds the day ``start + i``; days without a row are missing and,
+    like NULLs, are skipped by every aggregate. Means and population standard
+    deviations come from prefix sums of ``x`` and ``x²`` (shifted by a fixed
+    offset to keep the subtraction well conditioned), range max / min from
+    sparse tables, so a query costs the same for a week or for three years.
+
+    :meth:`append` adds (or replaces) days at the end in time proportional to
+    the new days; it mutates the arrays, so readers on other threads should be
+    handed a :meth:`copy` instead.
+    """
+
+    def __init__(self, start: Optional[DateLike] = None, capacity: int = 512) -> None:
+        self.start: Optional[date] = _day(start) if start is not None else None
+        self.n = 0
+        self._cap = 0
+        self._raw: Dict[str, np.ndarray] = {}
+        self._shift: Dict[str, float] = {s: 0.0 for s in _MEAN_SERIES}
+        self._count: Dict[str, np.ndarray] = {}
+        self._sum: Dict[str, np.ndarray] = {}
+        self._sumsq: Dict[str, np.ndarray] = {}
+        self._max = np.empty((0, 0))
+        self._min = np.empty((0, 0))
+        self._allocate(max(1, int(capacity)))
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Mapping[str, Any]]) -> "WeatherIndex":
+        days, values = cls._decode(rows)
+        index = cls(days[0] if days else None, capacity=(days[-1] - days[0]).days + 1 if days else 512)
+        if days:
+            # centre each series on its mean so x - shift stays small
+            for name in _MEAN_SERIES:
+                vals = values[name]
+                if np.isfinite(vals).any():
+                    index._shift[name] = float(np.nanmean(vals))
+            index._write(days, values)
+        return index
+
+    # ----- properties -----
+    @property
+    def end(self) -> Optional[date]:
+        """Last day held (the day of the last appended row)."""
+        if self.start is None or self.n == 0:
+            return None
+        return self.start + timedelta(days=self.n - 1)
+
+    def __len__(self) -> int:
+        return self.n
+
+    # ----- building -----
+    @staticmethod
+    def _decode(rows: Iterable[Mapping[str, Any]]) -> Tuple[List[date], Dict[str, np.ndarray]]:
+        ordered = sorted(((_day(r["date"]), r) for r in rows), key=lambda item: item[0])
+        days = [d for d, _ in ordered]
+        values = {name: np.array([_float(r.get(name)) for _, r in ordered], dtype=np.float64) for name in _RAW}
+        values["spread"] = values["temp_max"] - values["temp_min"]
+        return days, values
+
+    def _allocate(self, capacity: int) -> None:
+        n = self.n
+        raw = {name: np.full(capacity, np.nan) for name in (*_RAW, "spread")}
+        for name, arr in self._raw.items():
+            raw[name][:n] = arr[:n]
+        self._raw = raw
+        for store in (self._count, self._sum, self._sumsq):
+            for name in _MEAN_SERIES:
+                prefix = np.zeros(capacity + 1)
+                if name in store:
+                    prefix[: n + 1] = store[name][: n + 1]
+                store[name] = prefix
+        levels = capacity.bit_length()
+        self._max = np.full((levels, capacity), -np.inf)
+        self._min = np.full((levels, capacity), np.inf)
+        self._cap = capacity
+        self._update_tables(0)
+
+    def _update_tables(self, first: int) -> None:
+        """Recompute every sparse-table entry whose window reaches slot ``first`` or later."""
+        n = self.n
+        self._max[0, first:n] = np.where(np.isnan(self._raw["temp_max"][first:n]), -np.inf, self._raw["temp_max"][first:n])
+        self._min[0, first:n] = np.where(np.isnan(self._raw["temp_min"][first:n]), np.inf, self._raw["temp_min"][first:n])
+        for k in range(1, self._max.shape[0]):
+            width, half = 1 << k, 1 << (k - 1)
+            lo, hi = max(0, first - width + 1), n - width + 1
+            if hi <= lo:
+                continue
+            np.maximum(self._max[k - 1, lo:hi], self._max[k - 1, lo + half:hi + half], out=self._max[k, lo:hi])
+            np.minimum(self._min[k - 1, lo:hi], self._min[k - 1, lo + half:hi + half], out=self._min[k, lo:hi])
+
+    def _write(self, days: Sequence[date], values: Mapping[str, np.ndarray]) -> None:
+        assert self.start is not None
+        # slots between the current end and the first new day (a gap) are rewritten as missing
+        first = min((days[0] - self.start).days, self.n)
+        n = (days[-1] - self.start).days + 1
+        if n > self._cap:
+            self.n = min(self.n, first)
+            self._allocate(max(n, 2 * self._cap))
+        slots = np.array([(d - self.start).days for d in days], dtype=np.int64)
+        for name, arr in self._raw.items():
+            arr[first:n] = np.nan
+            arr[slots] = values[name]
+        self.n = n
+        for name in _MEAN_SERIES:
+            x = self._raw[name][first:n] - self._shift[name]
+            valid = ~np.isnan(x)
+            x = np.where(valid, x, 0.0)
+            for store, inc in ((self._count, valid.astype(np.float64)), (self._sum, x), (self._sumsq, x * x)):
+                prefix = store[name]
+                prefix[first + 1:n + 1] = prefix[first] + np.cumsum(inc)
+        self._update_tables(first)
+
+    def append(self, rows: Iterable[Mapping[str, Any]]) -> int:
+        """Add the days in ``rows``; returns the number of slots rewritten.
+
+        Every day from the first row's date on is replaced, so re-sending the
+        last few days picks up late corrections (days with no row become
+        missing). Rows may not start before :attr:`start`.
+        """
+        days, values = self._decode(rows)
+        if not days:
+            return 0
+        if self.start is None:
+            self.start = days[0]
+        if days[0] < self.start:
+            raise ValueError(f"cannot prepend {days[0]} before {self.start}; rebuild the index")
+        first = min((days[0] - self.start).days, self.n)
+        self._write(days, values)
+        return self.n - first
+
+    def matches(self, rows: Iterable[Mapping[str, Any]]) -> bool:
+        """True when ``rows`` describe exactly the days already held from their first date on."""
+        days, values = self._decode(rows)
+        if not days or self.start is None or days[0] < self.start:
+            return not days
+        first = (days[0] - self.start).days
+        if (days[-1] - self.start).days != self.n - 1:
+            return False
+        slots = np.array([(d - self.start).days for d in days], dtype=np.int64) - first
+        for name in _RAW:
+            expected = np.full(self.n - first, np.nan)
+            expected[slots] = values[name]
+            if not np.array_equal(expected, self._raw[name][first:self.n], equal_nan=True):
+                return False
+        return True
+
+    def copy(self) -> "WeatherIndex":
+        other = WeatherIndex.__new__(WeatherIndex)
+        other.start, other.n, other._cap = self.start, self.n, self._cap
+        other._shift = dict(self._shift)
+        other._raw = {k: v.copy() for k, v in self._raw.items()}
+        other._count = {k: v.copy() for k, v in self._count.items()}
+        other._sum = {k: v.copy() for k, v in self._sum.items()}
+        other._sumsq = {k: v.copy() for k, v in self._sumsq.items()}
+        other._max, other._min = self._max.copy(), self._min.copy()
+        return other
+
+    # ----- queries -----
+    def _slots(self, first: DateLike, last: DateLike) -> Tuple[int, int]:
+        """Half-open slot range for the inclusive date range, clipped to the index."""
+        if self.start is None:
+            return 0, 0
+        lo = min(self.n, max(0, (_day(first) - self.start).days))
+        hi = min(self.n, (_day(last) - self.start).days + 1)
+        return lo, max(lo, hi)
+
+    def _range_stats(self, lo: np.ndarray, hi: np.ndarray) -> Dict[str, np.ndarray]:
+        out: Dict[str, np.ndarray] = {}
+        empty = hi <= lo
+        for name in _MEAN_SERIES:
+            count = self._count[name][hi] - self._count[name][lo]
+            sumsq_hi, sumsq_lo = self._sumsq[name][hi], self._sumsq[name][lo]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean_shifted = (self._sum[name][hi] - self._sum[name][lo]) / count
+                var = (sumsq_hi - sumsq_lo) / count - mean_shifted ** 2
+                # below the rounding error of the prefix difference the range is constant
+                var = np.where(var <= _VAR_ULPS * _EPS * (sumsq_hi + sumsq_lo) / count, 0.0, var)
+            none = count <= 0
+            out[(name, "mean")] = np.where(none, np.nan, mean_shifted + self._shift[name])
+            out[(name, "std")] = np.where(none, np.nan, np.sqrt(np.maximum(var, 0.0)))
+        length = np.where(empty, 1, hi - lo)
+        k = np.floor(np.log2(length)).astype(np.int64)
+        left = np.where(empty, 0, lo)
+        right = np.where(empty, 0, hi - (1 << k))
+        mx = np.maximum(self._max[k, left], self._max[k, right])
+        mn = np.minimum(self._min[k, left], self._min[k, right])
+        out[("temp_max", "max")] = np.where(empty | np.isinf(mx), np.nan, mx)
+        out[("temp_min", "min")] = np.where(empty | np.isinf(mn), np.nan, mn)
+        return out
+
+    def stats(self, first: DateLike, last: DateLike) -> Dict[str, Optional[float]]:
+        """AVG / MAX / MIN / STDDEV_POP over ``first..last`` (inclusive); None where SQL gives NULL."""
+        lo, hi = self._slots(first, last)
+        res: Dict[Tuple[str, str], Optional[float]] = {}
+        for name in _MEAN_SERIES:
+            count = float(self._count[name][hi] - self._count[name][lo])
+            if count <= 0:
+                res[(name, "mean")] = res[(name, "std")] = None
+                continue
+            sumsq_hi, sumsq_lo = float(self._sumsq[name][hi]), float(self._sumsq[name][lo])
+            mean_shifted = float(self._sum[name][hi] - self._sum[name][lo]) / count
+            var = (sumsq_hi - sumsq_lo) / count - mean_shifted * mean_shifted
+            if var <= _VAR_ULPS * _EPS * (sumsq_hi + sumsq_lo) / count:
+                var = 0.0
+            res[(name, "mean")] = mean_shifted + self._shift[name]
+            res[(name, "std")] = math.sqrt(var)
+        if hi > lo:
+            k = (hi - lo).bit_length() - 1
+            right = hi - (1 << k)
+            mx = max(self._max[k, lo], self._max[k, right])
+            mn = min(self._min[k, lo], self._min[k, right])
+            res[("temp_max", "max")] = None if math.isinf(mx) else float(mx)
+            res[("temp_min", "min")] = None if math.isinf(mn) else float(mn)
+        else:
+            res[("temp_max", "max")] = res[("temp_min", "min")] = None
+        return {key: res[spec] for key, spec in STAT_KEYS.items()}
+
+    def stats_many(self, firsts: Sequence[DateLike], lasts: Sequence[DateLike]) -> Dict[str, np.ndarray]:
+        """Vectorised :meth:`stats` for many ranges; NaN where SQL gives NULL."""
+        if self.start is None:
+            nan = np.full(len(firsts), np.nan)
+            return {key: nan.copy() for key in STAT_KEYS}
+        origin = self.start.toordinal()
+        lo = np.array([_day(d).toordinal() - origin for d in firsts], dtype=np.int64)
+        hi = np.array([_day(d).toordinal() - origin + 1 for d in lasts], dtype=np.int64)
+        lo = np.clip(lo, 0, self.n)
+        hi = np.maximum(np.clip(hi, 0, self.n), lo)
+        res = self._range_stats(lo, hi)
+        return {key: res[spec] for key, spec in STAT_KEYS.items()}
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "days": self.n,
+            "start": self.start.isoformat() if self.start else None,
+            "end": self.end.isoformat() if self.end else None,
+        }
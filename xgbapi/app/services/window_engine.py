@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+# No xgbapi imports: api/predict_model.py loads this module from its own path.
+
+# plant_date windows (days relative to the target's plant_date, inclusive)
+SIMILAR_WINDOW = (-7, 7)  # same group, the cycle itself excluded
+PREV_YEAR_WINDOW = (-365 - 5, -365 + 5)
+
+WINDOW_COLUMNS = (
+    "similar_bed_avg_yield",
+    "similar_bed_avg_days",
+    "prev_year_yield",
+    "prev_year_days",
+    "yield_diff_prev",
+    "days_diff_prev",
+)
+
+_GROUP_SHIFT = 32  # key = group code << 32 | plant_date ordinal
+
+
+def _ordinal(value: Any) -> int:
+    if isinstance(value, datetime):
+        return value.date().toordinal()
+    if isinstance(value, date):
+        return value.toordinal()
+    return date.fromisoformat(str(value)[:10]).toordinal()
+
+
+def _float(value: Any) -> float:
+    return np.nan if value is None else float(value)
+
+
+class GroupWindows:
+    """Same-group plant_date window averages for many cycles at once.
+
+    The history is sorted once by ``(group, plant_date)`` and each value column
+    kept as a cumulative sum (NULLs count as neither value nor row), so the
+    AVG over any window of any group is two binary searches and two
+    subtractions: O(n log n) to build, O(log n) per query, all vectorised.
+    Rows with a NULL group never match, like ``b.group_type = %s`` in SQL.
+    """
+
+    def __init__(
+        self,
+        ids: Sequence[int],
+        groups: Sequence[Any],
+        plant_dates: Sequence[Any],
+        values: Mapping[str, Sequence[Any]],
+    ) -> None:
+        self._codes: Dict[Any, int] = {}
+        keep = [i for i, g in enumerate(groups) if g is not None and plant_dates[i] is not None]
+        codes = np.array([self._code(groups[i]) for i in keep], dtype=np.int64)
+        ords = np.array([_ordinal(plant_dates[i]) for i in keep], dtype=np.int64)
+        keys = (codes << _GROUP_SHIFT) | ords
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.ids = np.array([int(ids[i]) for i in keep], dtype=np.int64)[order]
+        self._pos = {int(cid): p for p, cid in enumerate(self.ids)}
+        self.columns: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        for name, column in values.items():
+            v = np.array([_float(column[i]) for i in keep], dtype=np.float64)[order]
+            valid = ~np.isnan(v)
+            v0 = np.where(valid, v, 0.0)
+            self.columns[name] = (
+                v0,
+                np.concatenate(([0.0], np.cumsum(v0))),
+                np.concatenate(([0], np.cumsum(valid))),
+            )
+
+    def _code(self, group: Any) -> int:
+        return self._codes.setdefault(group, len(self._codes) + 1)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def means(
+        self,
+        groups: Sequence[Any],
+        plant_dates: Sequence[Any],
+        window: Tuple[int, int],
+        exclude_ids: Optional[Sequence[int]] = None,
+    ) -> Dict[str, np.ndarray]:
+        """AVG of every value column over ``plant_date + window`` within the same group.
+
+        ``exclude_ids`` leaves one cycle out of its own query (``c.id <> %s``).
+        Windows with no non-NULL value give NaN.
+        """
+        m = len(groups)
+        codes = np.array([self._codes.get(g, 0) if g is not None else 0 for g in groups], dtype=np.int64)
+        ords = np.array([_ordinal(d) for d in plant_dates], dtype=np.int64)
+        lo = np.searchsorted(self.keys, (codes << _GROUP_SHIFT) | (ords + window[0]), side="left")
+        hi = np.searchsorted(self.keys, (codes << _GROUP_SHIFT) | (ords + window[1]), side="right")
+        hi = np.where(codes == 0, lo, hi)  # unknown / NULL group: empty window
+
+        own = np.full(m, -1, dtype=np.int64)
+        if exclude_ids is not None:
+            own = np.array([self._pos.get(int(cid), -1) for cid in exclude_ids], dtype=np.int64)
+            own = np.where((own >= lo) & (own < hi), own, -1)
+        has_own = own >= 0
+        own_idx = np.where(has_own, own, 0)
+
+        out: Dict[str, np.ndarray] = {}
+        for name, (v0, csum, ccount) in self.columns.items():
+            total = csum[hi] - csum[lo]
+            count = ccount[hi] - ccount[lo]
+            if len(v0):
+                own_valid = has_own & (ccount[own_idx + 1] - ccount[own_idx] > 0)
+                total = total - np.where(own_valid, v0[own_idx], 0.0)
+                count = count - own_valid.astype(np.int64)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                out[name] = np.where(count > 0, total / np.maximum(count, 1), np.nan)
+        return out
+
+
+def cycle_window_features(
+    history: Iterable[Mapping[str, Any]],
+    targets: Sequence[Mapping[str, Any]],
+) -> Dict[str, np.ndarray]:
+    """similar_bed_avg_* / prev_year_* / *_diff_prev for every target (NaN = SQL NULL).
+
+    ``history`` rows need ``id``, ``group_type``, ``plant_date``,
+    ``harvest_start`` and ``total_yield`` (the cycle's SUM(harvest_kg));
+    ``targets`` need ``id``, ``group_type`` and ``plant_date``. Results are
+    aligned with ``targets``.
+    """
+    rows: List[Mapping[str, Any]] = list(history)
+    days = [
+        _ordinal(r["harvest_start"]) - _ordinal(r["plant_date"])
+        if r.get("harvest_start") is not None and r.get("plant_date") is not None
+        else None
+        for r in rows
+    ]
+    windows = GroupWindows(
+        [r["id"] for r in rows],
+        [r.get("group_type") for r in rows],
+        [r.get("plant_date") for r in rows],
+        {"yield": [r.get("total_yield") for r in rows], "days": days},
+    )
+    groups = [t.get("group_type") for t in targets]
+    plants = [t["plant_date"] for t in targets]
+    similar = windows.means(groups, plants, SIMILAR_WINDOW, exclude_ids=[t["id"] for t in targets])
+    prev = windows.means(groups, plants, PREV_YEAR_WINDOW)
+    return {
+        "similar_bed_avg_yield": similar["yield"],
+        "similar_bed_avg_days": similar["days"],
+        "prev_year_yield": prev["yield"],
+        "prev_year_days": prev["days"],
+        # NaN propagates: NULL unless both sides exist
+        "yield_diff_prev": similar["yield"] - prev["yield"],
+        "days_diff_prev": similar["days"] - prev["days"],
+    }
+
+
+def to_optional(value: float) -> Optional[float]:
+    """NaN -> None, for writing a result back as SQL NULL."""
+    return None if np.isnan(value) else float(value)
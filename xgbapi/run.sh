@@ -40,6 +40,14 @@ if [[ -f "$APP_HOME/.venv/bin/activate" ]]; then
   source "$APP_HOME/.venv/bin/activate"
 fi
 
+# WORKERS>1: 親プロセスでモデルを 1 回だけ読み込み、fork したワーカー間でメモリを共有する
+WORKERS="${WORKERS:-1}"
+echo "[CONFIG] WORKERS            = $WORKERS"
+if [[ "$WORKERS" -gt 1 ]]; then
+  export WORKERS API_HOST API_PORT
+  exec python -m app.prefork
+fi
+
 # Uvicorn 起動
 # app/main.py 側で "app" という FastAPI インスタンスが公開されている想定
 exec python -m uvicorn app.main:app \